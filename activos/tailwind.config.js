@@ -0,0 +1,19 @@
+/** Solo se generan las clases que aparecen en las plantillas y el JS */
+module.exports = {
+  content: {
+    relative: true,
+    files: [
+      '../reservaciones/templates/**/*.html',
+      '../static/reservaciones/js/**/*.js',
+    ],
+  },
+  theme: {
+    extend: {
+      colors: {
+        primary: '#3b82f6',
+        secondary: '#8b5cf6',
+      },
+    },
+  },
+  plugins: [],
+}
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 from decouple import config
 
@@ -47,10 +48,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'reservaciones',
 ]
 
 MIDDLEWARE = [
+    'reservaciones.middleware.IdCorrelacionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -72,6 +75,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'reservaciones.context_processors.estaticos',
             ],
         },
     },
@@ -98,6 +102,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='reservaciones'),
+    }
+}
+
+# Caché de horarios disponibles (se invalida por versión al cambiar reservaciones/horarios)
+DISPONIBILIDAD_CACHE = 'default'
+DISPONIBILIDAD_CACHE_TIMEOUT = config('DISPONIBILIDAD_CACHE_TIMEOUT', default=300, cast=int)
+
+# Caché de página completa del catálogo para visitantes anónimos (se purga al cambiar un servicio)
+PAGINAS_CACHE = 'default'
+PAGINAS_CACHE_TIMEOUT = config('PAGINAS_CACHE_TIMEOUT', default=600, cast=int)
+
+# Minutos que una reservación pendiente retiene su horario antes de liberarse si no se paga
+RESERVAS_MINUTOS_RETENCION = config('RESERVAS_MINUTOS_RETENCION', default=15, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -139,8 +165,34 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
-# Configuración adicional para producción
-STATICFILES_DIRS = []
+# CSS e iconos propios (manage.py construir_estaticos los genera en static/reservaciones/dist)
+STATICFILES_DIRS = [BASE_DIR / 'static']
+
+# En producción collectstatic agrega el hash del contenido al nombre y deja
+# copias .gz/.br: STATIC_ROOT se puede servir con caché de un año (immutable)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'reservaciones.estaticos.AlmacenEstaticos'
+        ),
+    },
+}
+
+# Usar Tailwind y Font Awesome desde CDN en lugar del paquete construido.
+# Por defecto solo en desarrollo: static/reservaciones/dist no está en el
+# repositorio y hay que generarlo con construir_estaticos antes de desplegar
+ESTATICOS_CDN = config('ESTATICOS_CDN', default=DEBUG, cast=bool)
+TAILWIND_CLI = config('TAILWIND_CLI', default=str(BASE_DIR / 'activos' / 'node_modules' / '.bin' / 'tailwindcss'))
+FONTAWESOME_DIR = config('FONTAWESOME_DIR', default=str(BASE_DIR / 'activos' / 'node_modules' / '@fortawesome' / 'fontawesome-free'))
+
+# Identificador del despliegue (p. ej. el commit) para los ETag y la caché de
+# páginas; vacío = hash del manifiesto de estáticos, que no cambia si solo
+# cambian las plantillas
+VERSION_PUBLICADA = config('VERSION_PUBLICADA', default='')
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -155,8 +207,82 @@ PAYPHONE_TOKEN = config('PAYPHONE_TOKEN')
 PAYPHONE_STORE_ID = config('PAYPHONE_STORE_ID')
 PAYPHONE_API_URL = config('PAYPHONE_API_URL')
 
+# Cliente HTTP de PayPhone (sesión compartida con keep-alive)
+PAYPHONE_POOL_SIZE = config('PAYPHONE_POOL_SIZE', default=10, cast=int)
+PAYPHONE_CONNECT_TIMEOUT = config('PAYPHONE_CONNECT_TIMEOUT', default=3.05, cast=float)
+PAYPHONE_READ_TIMEOUT = config('PAYPHONE_READ_TIMEOUT', default=15, cast=float)
+PAYPHONE_REINTENTOS = config('PAYPHONE_REINTENTOS', default=3, cast=int)
+PAYPHONE_BACKOFF = config('PAYPHONE_BACKOFF', default=0.5, cast=float)
+
+# Hilos para las llamadas a pasarelas desde vistas async: techo de pagos
+# en vuelo por proceso (los demás esperan turno). Por defecto uno por
+# conexión del pool, para no abrir conexiones que no se reutilizan
+PASARELAS_HILOS = config('PASARELAS_HILOS', default=PAYPHONE_POOL_SIZE, cast=int)
+
+# Secreto compartido para firmar las notificaciones (vacío = se rechazan todas)
+PAYPHONE_WEBHOOK_SECRET = config('PAYPHONE_WEBHOOK_SECRET', default='')
+
+# Stripe
+STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
+STRIPE_PUBLIC_KEY = config('STRIPE_PUBLIC_KEY', default='')
+
+# Reembolsos simultáneos al cancelar en lote
+REEMBOLSOS_HILOS = config('REEMBOLSOS_HILOS', default=8, cast=int)
+
+# Pasarela usada para pagos nuevos (por ahora solo 'payphone': Stripe no
+# tiene retorno ni confirmación de cobros, solo confirma y reembolsa los
+# existentes) y su interruptor: tras PASARELAS_UMBRAL_FALLOS fallas seguidas
+# del proveedor (conexión, timeout, 5xx) se deja de llamar a la pasarela
+# durante PASARELAS_ESPERA_INTERRUPTOR segundos
+PASARELA_PAGO = config('PASARELA_PAGO', default='payphone')
+PASARELAS_UMBRAL_FALLOS = config('PASARELAS_UMBRAL_FALLOS', default=5, cast=int)
+PASARELAS_ESPERA_INTERRUPTOR = config('PASARELAS_ESPERA_INTERRUPTOR', default=30, cast=float)
+
+# Worker de confirmaciones (manage.py procesar_confirmaciones)
+CONFIRMACIONES_MAX_INTENTOS = config('CONFIRMACIONES_MAX_INTENTOS', default=5, cast=int)
+
 # URLs de retorno
 SITE_URL = config('SITE_URL', default='http://127.0.0.1:8000')
 
 # Referrer Policy para PayPhone
-SECURE_REFERRER_POLICY = 'origin-when-cross-origin'
\ No newline at end of file
+SECURE_REFERRER_POLICY = 'origin-when-cross-origin'
+
+# Logging estructurado (JSON a stderr) a través de una cola: el request
+# nunca espera la escritura. LOG_MUESTREO_DEBUG es la fracción de
+# registros DEBUG (payloads y respuestas de las pasarelas) que se conserva.
+LOG_NIVEL = config('LOG_NIVEL', default='INFO')
+LOG_MUESTREO_DEBUG = config('LOG_MUESTREO_DEBUG', default=1.0, cast=float)
+LOG_TAMANO_COLA = config('LOG_TAMANO_COLA', default=10000, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'contexto': {
+            '()': 'reservaciones.registro.FiltroContexto',
+        },
+        'muestreo': {
+            '()': 'reservaciones.registro.FiltroMuestreo',
+            'tasa': LOG_MUESTREO_DEBUG,
+        },
+    },
+    'handlers': {
+        'cola': {
+            '()': 'reservaciones.registro.ManejadorCola',
+            'tamano': LOG_TAMANO_COLA,
+            'filters': ['muestreo', 'contexto'],
+        },
+    },
+    'loggers': {
+        'reservaciones': {
+            'handlers': ['cola'],
+            'level': LOG_NIVEL,
+            'propagate': False,
+        },
+    },
+}
+
+# Bajo "manage.py test" los registros no se escriben en stderr: la salida de
+# las pruebas queda limpia y assertLogs los sigue capturando
+if sys.argv[1:2] == ['test']:
+    LOGGING['handlers']['cola'] = {'class': 'logging.NullHandler'}
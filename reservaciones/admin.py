@@ -1,5 +1,12 @@
-from django.contrib import admin
-from .models import Servicio, HorarioDisponible, Reservacion
+from django.conf import settings
+from django.contrib import admin, messages
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import Servicio, HorarioDisponible, Reservacion, ConfirmacionPago, IntentoPago
+from .services.ocupacion import CAMPOS_HUELLA, huella, actualizar_ocupacion
+from .services.cache_disponibilidad import invalidar_fechas
+from .services.reembolsos import cancelar_y_reembolsar
+from .services.reservas import RESTRICCION_CAPACIDAD
 
 @admin.register(Servicio)
 class ServicioAdmin(admin.ModelAdmin):
@@ -9,9 +16,19 @@ class ServicioAdmin(admin.ModelAdmin):
 
 @admin.register(HorarioDisponible)
 class HorarioDisponibleAdmin(admin.ModelAdmin):
-    list_display = ['servicio', 'dia_semana', 'hora_inicio', 'hora_fin', 'activo']
+    list_display = ['servicio', 'dia_semana', 'hora_inicio', 'hora_fin', 'intervalo_minutos', 'activo']
     list_filter = ['dia_semana', 'activo']
 
+class IntentoPagoInline(admin.TabularInline):
+    model = IntentoPago
+    extra = 0
+    can_delete = False
+    fields = ['created_at', 'pasarela', 'client_transaction_id', 'transaction_id', 'estado', 'monto', 'autorizacion']
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 @admin.register(Reservacion)
 class ReservacionAdmin(admin.ModelAdmin):
     list_display = ['nombre_cliente', 'servicio', 'fecha', 'hora_inicio', 'estado', 'estado_pago', 'precio_total']
@@ -19,6 +36,7 @@ class ReservacionAdmin(admin.ModelAdmin):
     search_fields = ['nombre_cliente', 'email_cliente', 'telefono_cliente', 'transaccion_id']
     date_hierarchy = 'fecha'
     readonly_fields = ['transaccion_id', 'referencia_pago', 'fecha_pago']
+    inlines = [IntentoPagoInline]
     
     fieldsets = (
         ('Información del Servicio', {
@@ -35,16 +53,75 @@ class ReservacionAdmin(admin.ModelAdmin):
         }),
     )
     
-    actions = ['confirmar_reservaciones', 'completar_reservaciones', 'marcar_como_pagadas']
+    actions = ['confirmar_reservaciones', 'completar_reservaciones', 'marcar_como_pagadas', 'cancelar_y_reembolsar']
+    
+    def _actualizar_estado(self, request, queryset, estado):
+        """
+        update() no dispara señales: aplicar a la ocupación el cambio de cada
+        reservación. Si alguna no cabe (p. ej. reconfirmar una cancelada en un
+        horario lleno), la restricción de capacidad rechaza todo el lote.
+        """
+        try:
+            with transaction.atomic():
+                filas = list(
+                    Reservacion.objects.select_for_update()
+                    .filter(id__in=queryset.values('id'))
+                    .values('id', *CAMPOS_HUELLA)
+                )
+                Reservacion.objects.filter(id__in=[fila['id'] for fila in filas]).update(
+                    estado=estado,
+                    updated_at=timezone.now()
+                )
+                pares = set()
+                for fila in filas:
+                    anterior, actual = huella(fila), huella({**fila, 'estado': estado})
+                    actualizar_ocupacion(anterior, actual)
+                    pares.update(h[:2] for h in (anterior, actual) if h)
+                invalidar_fechas(pares)
+        except IntegrityError as e:
+            if RESTRICCION_CAPACIDAD not in str(e):
+                raise
+            self.message_user(request, 'No se cambió ninguna: el horario de alguna ya no tiene cupo.', messages.ERROR)
     
     def confirmar_reservaciones(self, request, queryset):
-        queryset.update(estado='confirmada')
+        self._actualizar_estado(request, queryset, 'confirmada')
     confirmar_reservaciones.short_description = "Confirmar reservaciones seleccionadas"
     
     def completar_reservaciones(self, request, queryset):
-        queryset.update(estado='completada')
+        self._actualizar_estado(request, queryset, 'completada')
     completar_reservaciones.short_description = "Marcar como completadas"
     
     def marcar_como_pagadas(self, request, queryset):
         queryset.update(estado_pago='pagado')
-    marcar_como_pagadas.short_description = "Marcar como pagadas (manual)"
\ No newline at end of file
+    marcar_como_pagadas.short_description = "Marcar como pagadas (manual)"
+    
+    def cancelar_y_reembolsar(self, request, queryset):
+        resumen = cancelar_y_reembolsar(queryset, hilos=settings.REEMBOLSOS_HILOS)
+        self.message_user(
+            request,
+            f"{resumen['canceladas']} canceladas, {resumen['reembolsadas']} de "
+            f"{resumen['reembolsos_solicitados']} reembolsos realizados en {resumen['segundos']}s"
+        )
+        for fallida in resumen['fallidas']:
+            self.message_user(
+                request,
+                f"Reservación #{fallida['reservacion']}: no se pudo reembolsar ({fallida['error']})",
+                messages.ERROR
+            )
+    cancelar_y_reembolsar.short_description = "Cancelar y reembolsar"
+
+
+@admin.register(ConfirmacionPago)
+class ConfirmacionPagoAdmin(admin.ModelAdmin):
+    list_display = ['transaction_id', 'reservacion', 'estado', 'intentos', 'disponible_en', 'updated_at']
+    list_filter = ['estado']
+    search_fields = ['transaction_id', 'client_transaction_id']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(IntentoPago)
+class IntentoPagoAdmin(admin.ModelAdmin):
+    list_display = ['client_transaction_id', 'transaction_id', 'reservacion', 'pasarela', 'estado', 'monto', 'created_at']
+    list_filter = ['estado', 'pasarela']
+    search_fields = ['client_transaction_id', 'transaction_id']
+    readonly_fields = ['created_at', 'updated_at']
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ReservacionesConfig(AppConfig):
     name = 'reservaciones'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
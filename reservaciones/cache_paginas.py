@@ -0,0 +1,104 @@
+"""
+Caché de página completa para visitantes anónimos (catálogo de servicios).
+
+Una respuesta en caché se sirve sin tocar la base de datos: el usuario se
+considera anónimo si no trae cookie de sesión ni mensajes pendientes, y
+no se consulta nada más. Cada página se etiqueta con claves sustitutas
+(p. ej. 'servicios' y 'servicio-3'); la clave de caché incluye la versión
+de cada etiqueta, así que al guardar o borrar un servicio basta con
+cambiar la versión de sus etiquetas para purgar solo esas páginas. También
+incluye la versión publicada: un despliegue no sirve páginas de la anterior.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.translation import get_language_from_request
+
+from .versiones import leer_versiones, nueva_version, version_publicada
+
+
+def _cache():
+    return caches[getattr(settings, 'PAGINAS_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'PAGINAS_CACHE_TIMEOUT', 600)
+
+
+def _clave_etiqueta(etiqueta):
+    return f'pag:v:{etiqueta}'
+
+
+def _versiones(etiquetas):
+    """Versión actual de cada etiqueta (se inicializa si fue desalojada)"""
+    return leer_versiones(_cache(), [_clave_etiqueta(etiqueta) for etiqueta in etiquetas])
+
+
+def _es_anonimo(request):
+    # Sin sesión no hay usuario autenticado; los mensajes viajan en cookie
+    return (
+        settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and getattr(settings, 'MESSAGE_COOKIE_NAME', 'messages') not in request.COOKIES
+    )
+
+
+def cache_anonimo(etiquetas, parametros=None):
+    """
+    Guardar en caché la página completa para visitantes anónimos.
+    `etiquetas(**kwargs)` devuelve las claves sustitutas de la página a
+    partir de los argumentos de la vista. La clave usa la ruta sin la
+    query string: las vistas que leen request.GET pasan `parametros(request)`,
+    que devuelve lo que la vista usa ya normalizado (así ?utm=... o un
+    orden distinto no crean entradas nuevas). La caché varía por idioma.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not _es_anonimo(request):
+                return vista(request, *args, **kwargs)
+
+            lista = etiquetas(**kwargs)
+            clave = 'pag:{}?{}:{}:{}:{}'.format(
+                request.path,
+                parametros(request) if parametros else '',
+                get_language_from_request(request),
+                version_publicada(),
+                _versiones(lista)
+            )
+            cache = _cache()
+            respuesta = cache.get(clave)
+            if respuesta is not None:
+                respuesta['X-Cache'] = 'HIT'
+                return get_conditional_response(request, etag=respuesta.get('ETag'), response=respuesta)
+
+            respuesta = vista(request, *args, **kwargs)
+            patch_vary_headers(respuesta, ['Accept-Language'])
+            respuesta['Surrogate-Key'] = ' '.join(lista)
+            # Solo páginas completas y sin cookies propias (p. ej. sesión nueva)
+            if respuesta.status_code == 200 and not respuesta.cookies and not respuesta.streaming:
+                if hasattr(respuesta, 'render') and not respuesta.is_rendered:
+                    respuesta.render()
+                cache.set(clave, respuesta, _timeout())
+                respuesta['X-Cache'] = 'MISS'
+            return respuesta
+        return envoltura
+    return decorador
+
+
+def etiquetas_servicio(servicio_id):
+    """Etiquetas del detalle de un servicio"""
+    return [f'servicio-{servicio_id}']
+
+
+def purgar_servicio(servicio_id):
+    """Purgar la lista de servicios y el detalle de este servicio"""
+    purgar(['servicios', *etiquetas_servicio(servicio_id)])
+
+
+def purgar(etiquetas):
+    """Invalidar todas las páginas con alguna de las etiquetas (tras el commit)"""
+    claves = [_clave_etiqueta(etiqueta) for etiqueta in etiquetas]
+    transaction.on_commit(lambda: _cache().set_many(dict.fromkeys(claves, nueva_version()), None))
@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+
+
+# Archivos de construir_estaticos que usa base.html sin ESTATICOS_CDN
+ESTATICOS_CONSTRUIDOS = ('app.css', 'iconos.css', 'iconos.woff2')
+
+
+@checks.register()
+def revisar_pasarela_de_cobro(app_configs, **kwargs):
+    """PASARELA_PAGO debe ser una pasarela que admita pagos nuevos"""
+    from .services.pasarelas import pasarela_de_cobro
+
+    try:
+        pasarela_de_cobro()
+    except (ImproperlyConfigured, ValueError) as e:
+        return [checks.Error(str(e), hint="Use PASARELA_PAGO=payphone.", id='reservaciones.E001')]
+    return []
+
+
+@checks.register()
+def revisar_estaticos_construidos(app_configs, **kwargs):
+    """Sin ESTATICOS_CDN, el CSS y los iconos tienen que estar construidos"""
+    if settings.ESTATICOS_CDN:
+        return []
+    dist = Path(settings.BASE_DIR) / 'static' / 'reservaciones' / 'dist'
+    faltantes = [nombre for nombre in ESTATICOS_CONSTRUIDOS if not (dist / nombre).exists()]
+    if not faltantes:
+        return []
+    return [checks.Warning(
+        f"Faltan estáticos construidos en {dist}: {', '.join(faltantes)}",
+        hint='Ejecute "manage.py construir_estaticos" o use ESTATICOS_CDN=True en desarrollo.',
+        id='reservaciones.W001',
+    )]
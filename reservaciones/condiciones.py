@@ -0,0 +1,108 @@
+"""
+Funciones de ETag / Last-Modified para las vistas con GET condicional.
+
+Se calculan con consultas pequeñas antes de ejecutar la vista, de modo que
+si nada cambió se responde 304 sin renderizar plantillas ni generar slots.
+El resultado se guarda en el request porque Django llama por separado a
+la función de ETag y a la de Last-Modified.
+"""
+import hashlib
+from datetime import datetime
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max
+
+from .models import Servicio, Reservacion
+from .services.ocupacion import filtro_vencidas
+from .versiones import version_publicada
+
+
+def _firma(request, clave, calcular):
+    """Calcular (una sola vez por request) la tupla (etag, last_modified)"""
+    memo = request.__dict__.setdefault('_firmas_condicionales', {})
+    if clave not in memo:
+        memo[clave] = calcular()
+    return memo[clave]
+
+
+def _etag(*partes):
+    return hashlib.sha1('|'.join(str(parte) for parte in partes).encode()).hexdigest()
+
+
+def _usuario(request):
+    # Las páginas HTML muestran el menú del usuario: el ETag depende de quién pide
+    return request.user.pk if request.user.is_authenticated else 'anonimo'
+
+
+def _con_mensajes(request):
+    # Si hay mensajes pendientes la página debe renderizarse para mostrarlos
+    return len(get_messages(request)) > 0
+
+
+def _firma_lista(request):
+    if _con_mensajes(request):
+        return None, None
+    datos = Servicio.objects.filter(activo=True).aggregate(
+        ultima=Max('updated_at'),
+        total=Count('id')
+    )
+    etag = _etag('lista', datos['ultima'], datos['total'], _usuario(request), version_publicada())
+    return etag, datos['ultima']
+
+
+def _firma_detalle(request, servicio_id):
+    if _con_mensajes(request):
+        return None, None
+    ultima = Servicio.objects.filter(id=servicio_id, activo=True).values_list('updated_at', flat=True).first()
+    if ultima is None:
+        return None, None
+    return _etag('detalle', servicio_id, ultima, _usuario(request), version_publicada()), ultima
+
+
+def _firma_horarios(request, servicio_id):
+    try:
+        fecha = datetime.strptime(request.GET.get('fecha', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return None, None
+
+    servicio_actualizado = Servicio.objects.filter(id=servicio_id).values_list('updated_at', flat=True).first()
+    if servicio_actualizado is None:
+        return None, None
+
+    # Incluye canceladas/eliminadas: cualquier cambio del día mueve la firma.
+    # Las retenciones que vencen liberan lugar sin escribir nada: se cuentan aparte
+    datos = Reservacion.objects.filter(servicio_id=servicio_id, fecha=fecha).aggregate(
+        ultima=Max('updated_at'),
+        total=Count('id'),
+        vencidas=Count('id', filter=filtro_vencidas())
+    )
+    ultima = max(filter(None, [servicio_actualizado, datos['ultima']]))
+    etag = _etag(
+        'horarios', servicio_id, fecha, request.GET.get('personas', 1),
+        servicio_actualizado, datos['ultima'], datos['total'], datos['vencidas']
+    )
+    return etag, ultima
+
+
+def etag_lista_servicios(request):
+    return _firma(request, 'lista', lambda: _firma_lista(request))[0]
+
+
+def ultima_modificacion_lista_servicios(request):
+    return _firma(request, 'lista', lambda: _firma_lista(request))[1]
+
+
+def etag_detalle_servicio(request, servicio_id):
+    return _firma(request, 'detalle', lambda: _firma_detalle(request, servicio_id))[0]
+
+
+def ultima_modificacion_detalle_servicio(request, servicio_id):
+    return _firma(request, 'detalle', lambda: _firma_detalle(request, servicio_id))[1]
+
+
+def etag_horarios(request, servicio_id):
+    return _firma(request, 'horarios', lambda: _firma_horarios(request, servicio_id))[0]
+
+
+def ultima_modificacion_horarios(request, servicio_id):
+    return _firma(request, 'horarios', lambda: _firma_horarios(request, servicio_id))[1]
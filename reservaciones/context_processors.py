@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def estaticos(request):
+    """Si base.html carga Tailwind y Font Awesome del CDN o el paquete construido"""
+    return {'ESTATICOS_CDN': settings.ESTATICOS_CDN}
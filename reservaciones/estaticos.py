@@ -0,0 +1,56 @@
+"""
+Almacenamiento de archivos estáticos para producción.
+
+collectstatic copia cada archivo con el hash de su contenido en el nombre
+(app.3f2a9c.css), así que se pueden servir con caché de un año: si el
+archivo cambia, cambia el nombre. Además deja junto a cada archivo de
+texto una copia .gz y, si está instalado el paquete brotli, una .br,
+para que el servidor web las entregue sin comprimir en cada request
+(gzip_static / brotli_static en nginx).
+"""
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Las fuentes woff2 y las imágenes ya vienen comprimidas
+EXTENSIONES_COMPRIMIBLES = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.html', '.xml', '.ttf', '.eot')
+
+# Por debajo de este tamaño la copia comprimida no ahorra nada útil
+TAMANO_MINIMO = 256
+
+
+def comprimir(datos):
+    """Copias (.gz, .br) del contenido; solo las que resultan más pequeñas"""
+    copias = {'.gz': gzip.compress(datos, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        copias['.br'] = brotli.compress(datos, quality=11)
+    return {extension: copia for extension, copia in copias.items() if len(copia) < len(datos)}
+
+
+class AlmacenEstaticos(ManifestStaticFilesStorage):
+    """Nombres con hash del contenido más copias precomprimidas"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        for nombre in sorted(set(self.hashed_files.values())):
+            if not nombre.endswith(EXTENSIONES_COMPRIMIBLES):
+                continue
+            with self.open(nombre) as archivo:
+                datos = archivo.read()
+            if len(datos) < TAMANO_MINIMO:
+                continue
+            for extension, copia in comprimir(datos).items():
+                if self.exists(nombre + extension):
+                    self.delete(nombre + extension)
+                self._save(nombre + extension, ContentFile(copia))
+                yield nombre, nombre + extension, True
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import statistics
+import time as reloj
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from reservaciones.management.estadisticas import percentil
+from reservaciones.models import Servicio, Reservacion
+from reservaciones.services import payphone_simulado
+from reservaciones.services.payphone_service import PayPhoneService
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el throughput de crear pagos con el cliente síncrono (un hilo por worker) '
+        'y con el async (un event loop que delega cada llamada a los hilos de pasarelas con la sesión '
+        'compartida) contra una API de PayPhone simulada con latencia. En modo async hay como mucho '
+        'PASARELAS_HILOS llamadas en vuelo, aunque --concurrencia sea mayor'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solicitudes', type=int, default=200, help='Pagos a crear en cada modo')
+        parser.add_argument('--trabajadores', type=int, default=4,
+                            help='Workers síncronos simulados (hilos que atienden un request a la vez)')
+        parser.add_argument('--concurrencia', type=int, default=1000,
+                            help='Máximo de llamadas async pendientes (en vuelo: hasta PASARELAS_HILOS)')
+        parser.add_argument('--latencia', type=float, default=0.2, help='Latencia de la API simulada (segundos)')
+        parser.add_argument('--puerto', type=int, default=8765)
+        parser.add_argument('--salida', help='Archivo donde guardar el JSON (por defecto stdout)')
+
+    def handle(self, *args, **options):
+        servidor = payphone_simulado.iniciar(puerto=options['puerto'], latencia=options['latencia'])
+        try:
+            payphone_service = PayPhoneService()
+            payphone_service.api_url = f"http://127.0.0.1:{options['puerto']}/api"
+
+            # Reservaciones en memoria: solo se usan para armar el payload
+            servicio = Servicio(id=1, nombre='Benchmark')
+            reservaciones = [
+                Reservacion(id=i, servicio=servicio, precio_total=Decimal('10.00'))
+                for i in range(1, options['solicitudes'] + 1)
+            ]
+
+            resultado = {
+                'latencia_pasarela_s': options['latencia'],
+                'solicitudes': options['solicitudes'],
+                'sincrono': self._sincrono(payphone_service, reservaciones, options['trabajadores']),
+                'async': asyncio.run(self._async(payphone_service, reservaciones, options['concurrencia'])),
+            }
+        finally:
+            servidor.shutdown()
+
+        resultado['aceleracion'] = round(
+            resultado['async']['por_segundo'] / resultado['sincrono']['por_segundo'], 2
+        ) if resultado['sincrono']['por_segundo'] else None
+
+        salida = json.dumps(resultado, indent=2)
+        if options['salida']:
+            with open(options['salida'], 'w') as archivo:
+                archivo.write(salida)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['salida']}"))
+        else:
+            self.stdout.write(salida)
+
+    def _sincrono(self, payphone_service, reservaciones, trabajadores):
+        def crear(reservacion):
+            inicio = reloj.perf_counter()
+            ok = payphone_service.crear_pago(reservacion, 'http://localhost/', 'http://localhost/')['success']
+            return (reloj.perf_counter() - inicio) * 1000, ok
+
+        inicio = reloj.perf_counter()
+        with ThreadPoolExecutor(max_workers=trabajadores) as pool:
+            medidas = list(pool.map(crear, reservaciones))
+        return self._resumen(medidas, reloj.perf_counter() - inicio, {'trabajadores': trabajadores})
+
+    async def _async(self, payphone_service, reservaciones, concurrencia):
+        semaforo = asyncio.Semaphore(concurrencia)
+
+        async def crear(reservacion):
+            async with semaforo:
+                inicio = reloj.perf_counter()
+                resultado = await payphone_service.acrear_pago(reservacion, 'http://localhost/', 'http://localhost/')
+                return (reloj.perf_counter() - inicio) * 1000, resultado['success']
+
+        inicio = reloj.perf_counter()
+        medidas = await asyncio.gather(*(crear(reservacion) for reservacion in reservaciones))
+        return self._resumen(medidas, reloj.perf_counter() - inicio, {
+            'concurrencia': concurrencia,
+            'hilos': settings.PASARELAS_HILOS,
+        })
+
+    def _resumen(self, medidas, segundos, extra):
+        tiempos = [tiempo for tiempo, _ in medidas]
+        return {
+            **extra,
+            'segundos': round(segundos, 3),
+            'por_segundo': round(len(medidas) / segundos, 1) if segundos else 0,
+            'errores': sum(1 for _, ok in medidas if not ok),
+            'p50_ms': round(percentil(tiempos, 50), 2),
+            'p99_ms': round(percentil(tiempos, 99), 2),
+            'media_ms': round(statistics.fmean(tiempos), 2),
+        }
@@ -0,0 +1,177 @@
+import json
+import random
+import statistics
+import time as reloj
+import uuid
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from reservaciones.management.estadisticas import percentil
+from reservaciones.models import Servicio, Reservacion
+from reservaciones.services import cache_disponibilidad
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide las vistas más usadas con el cliente de pruebas de Django y reporta '
+        'percentiles de latencia y número de consultas en JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteraciones', type=int, default=50)
+        parser.add_argument('--usuario', help='Usuario para las vistas con login (por defecto el que tenga más reservaciones)')
+        parser.add_argument('--host', default='localhost', help='Host permitido en ALLOWED_HOSTS')
+        parser.add_argument('--salida', help='Archivo donde guardar el JSON (por defecto stdout)')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        aleatorio = random.Random(options['semilla'])
+        servicios = list(Servicio.objects.filter(activo=True, horarios__activo=True).distinct())
+        if not servicios:
+            raise CommandError('No hay servicios con horarios; ejecute primero sembrar_datos')
+
+        usuario = self._usuario(options['usuario'])
+
+        cliente = Client(HTTP_HOST=options['host'])
+        cliente.force_login(usuario)
+        cliente_staff = Client(HTTP_HOST=options['host'])
+
+        iteraciones = options['iteraciones']
+        hoy = date.today()
+
+        def fecha_aleatoria():
+            return hoy + timedelta(days=aleatorio.randint(1, 60))
+
+        def horarios():
+            servicio = aleatorio.choice(servicios)
+            url = reverse('horarios_disponibles', args=[servicio.id])
+            return cliente.get(url, {'fecha': fecha_aleatoria().isoformat()})
+
+        def elegir_horario():
+            # Fuera de la medición: elegir un horario libre para la reservación
+            for _ in range(10):
+                servicio = aleatorio.choice(servicios)
+                fecha = fecha_aleatoria()
+                libres = cache_disponibilidad.horarios_disponibles(servicio, fecha)
+                if libres:
+                    return servicio, fecha, aleatorio.choice(libres)['hora']
+            return None
+
+        def crear(servicio, fecha, hora):
+            return cliente.post(reverse('crear_reservacion', args=[servicio.id]), {
+                'fecha': fecha.isoformat(),
+                'hora_inicio': hora,
+                'nombre_cliente': 'Benchmark',
+                'email_cliente': 'benchmark@example.com',
+                'telefono_cliente': '0999999999',
+                'numero_personas': 1,
+            })
+
+        escenarios = {
+            'lista_servicios': lambda: cliente.get(reverse('lista_servicios')),
+            'obtener_horarios_disponibles': horarios,
+            'crear_reservacion': (crear, elegir_horario),
+            'mis_reservaciones': lambda: cliente.get(reverse('mis_reservaciones')),
+            'admin_reservaciones': lambda: cliente_staff.get(
+                reverse('admin:reservaciones_reservacion_changelist')
+            ),
+        }
+
+        ultimo_id = Reservacion.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        resultados = {}
+        # Superusuario temporal para medir el admin: se borra al terminar
+        staff = User.objects.create(
+            username=f'benchmark-{uuid.uuid4().hex[:12]}', is_staff=True, is_superuser=True
+        )
+        try:
+            cliente_staff.force_login(staff)
+            for nombre, escenario in escenarios.items():
+                preparar = None
+                if isinstance(escenario, tuple):
+                    escenario, preparar = escenario
+                resultados[nombre] = self._medir(escenario, iteraciones, preparar)
+                if resultados[nombre]['muestras']:
+                    self.stderr.write(f"{nombre}: p50={resultados[nombre]['p50_ms']}ms")
+                else:
+                    self.stderr.write(f'{nombre}: sin muestras')
+        finally:
+            # Eliminar las reservaciones creadas por el benchmark (con señales, para la ocupación)
+            for reservacion in Reservacion.objects.filter(id__gt=ultimo_id, usuario=usuario):
+                reservacion.delete()
+            staff.delete()
+
+        reporte = {
+            'fecha': reloj.strftime('%Y-%m-%dT%H:%M:%S'),
+            'base_de_datos': connection.vendor,
+            'iteraciones': iteraciones,
+            'datos': {
+                'servicios': Servicio.objects.count(),
+                'reservaciones': Reservacion.objects.count(),
+                'reservaciones_usuario': Reservacion.objects.filter(usuario=usuario).count(),
+            },
+            'cache_disponibilidad': cache_disponibilidad.estadisticas(),
+            'vistas': resultados,
+        }
+
+        contenido = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(contenido)
+            self.stderr.write(f"Reporte guardado en {options['salida']}")
+        else:
+            self.stdout.write(contenido)
+
+    def _usuario(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Usuario no encontrado: {username}')
+        usuario_id = (
+            Reservacion.objects.values('usuario_id')
+            .order_by()
+            .annotate(total=Count('id'))
+            .order_by('-total')
+            .values_list('usuario_id', flat=True)
+            .first()
+        )
+        if usuario_id is None:
+            raise CommandError('No hay reservaciones; ejecute primero sembrar_datos')
+        return User.objects.get(pk=usuario_id)
+
+    def _medir(self, escenario, iteraciones, preparar=None):
+        tiempos, consultas, estados = [], [], {}
+        for _ in range(iteraciones):
+            argumentos = ()
+            if preparar:
+                argumentos = preparar()
+                if argumentos is None:
+                    continue
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = reloj.perf_counter()
+                respuesta = escenario(*argumentos)
+                tiempos.append((reloj.perf_counter() - inicio) * 1000)
+            consultas.append(len(capturadas))
+            estados[respuesta.status_code] = estados.get(respuesta.status_code, 0) + 1
+
+        if not tiempos:
+            return {'muestras': 0}
+
+        return {
+            'muestras': len(tiempos),
+            'p50_ms': round(percentil(tiempos, 50), 2),
+            'p90_ms': round(percentil(tiempos, 90), 2),
+            'p99_ms': round(percentil(tiempos, 99), 2),
+            'max_ms': round(max(tiempos), 2),
+            'media_ms': round(statistics.fmean(tiempos), 2),
+            'consultas_media': round(statistics.fmean(consultas), 2),
+            'consultas_max': max(consultas),
+            'estados_http': {str(estado): total for estado, total in estados.items()},
+        }
@@ -0,0 +1,214 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from reservaciones.models import Reservacion, ConfirmacionPago, IntentoPago
+from reservaciones.services.pasarelas import obtener_pasarela
+
+
+logger = logging.getLogger(__name__)
+
+# Campos de la reservación que puede escribir la conciliación
+CAMPOS_RESERVACION = (
+    'id', 'estado', 'estado_pago', 'fecha_pago', 'metodo_pago',
+    'referencia_pago', 'transaccion_id', 'updated_at'
+)
+
+
+class LimiteTasa:
+    """Espaciar las llamadas para no pasar de `por_segundo` entre todos los hilos"""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1 / por_segundo if por_segundo else 0
+        self.siguiente = time.monotonic()
+        self.lock = threading.Lock()
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        with self.lock:
+            ahora = time.monotonic()
+            turno = max(self.siguiente, ahora)
+            self.siguiente = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+class Command(BaseCommand):
+    help = (
+        "Concilia con PayPhone las reservaciones que quedaron en estado_pago='procesando' "
+        'y guarda los resultados por lotes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help='Consultas simultáneas a PayPhone')
+        parser.add_argument('--tasa', type=float, default=10, help='Máximo de consultas por segundo (0 = sin límite)')
+        parser.add_argument('--lote', type=int, default=200, help='Filas por bulk_update')
+        parser.add_argument('--antiguedad', type=int, default=30,
+                            help='Minutos sin cambios para considerar un pago atascado')
+        parser.add_argument('--api-url', help='URL de la API (p. ej. el servidor de payphone_simulado)')
+
+    def handle(self, *args, **options):
+        pasarela = obtener_pasarela('payphone')
+        if options['api_url']:
+            pasarela.servicio.api_url = options['api_url'].rstrip('/')
+        limite = LimiteTasa(options['tasa'])
+        self.totales = {
+            'aprobados': 0, 'rechazados': 0, 'errores': 0, 'sin_id': 0,
+            'omitidos': 0, 'canceladas': 0, 'monto_distinto': 0,
+        }
+
+        atascados = IntentoPago.objects.filter(
+            pasarela='payphone',
+            estado='iniciado',
+            updated_at__lt=timezone.now() - timedelta(minutes=options['antiguedad']),
+            reservacion__estado_pago='procesando'
+        ).annotate(
+            # Sin Confirm verificado, el ID de PayPhone solo está en la cola de confirmaciones
+            id_en_cola=Subquery(
+                ConfirmacionPago.objects.filter(client_transaction_id=OuterRef('client_transaction_id'))
+                .order_by('-created_at').values('transaction_id')[:1]
+            )
+        ).only(
+            'id', 'reservacion_id', 'estado', 'client_transaction_id', 'transaction_id', 'monto',
+            'autorizacion', 'updated_at'
+        ).order_by('id')
+
+        inicio = time.perf_counter()
+        consultadas = 0
+        resultados = []
+        en_curso = set()
+        with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+            for intento in atascados.iterator(chunk_size=options['lote']):
+                # El ID de PayPhone solo se conoce si llegó el retorno o la notificación
+                if not (intento.transaction_id or intento.id_en_cola):
+                    self.totales['sin_id'] += 1
+                    continue
+
+                # Cola acotada: no leer más filas de las que los hilos pueden atender
+                if len(en_curso) >= options['hilos'] * 2:
+                    listas, en_curso = wait(en_curso, return_when=FIRST_COMPLETED)
+                    resultados.extend(futuro.result() for futuro in listas)
+
+                en_curso.add(pool.submit(self._confirmar, pasarela, limite, intento))
+                consultadas += 1
+
+                if len(resultados) >= options['lote']:
+                    self._aplicar(resultados)
+                    resultados = []
+
+            resultados.extend(futuro.result() for futuro in wait(en_curso).done)
+        self._aplicar(resultados)
+
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'Conciliados {consultadas} pagos en {segundos:.2f}s '
+            f'({consultadas / segundos if segundos else 0:.1f}/s): '
+            + ', '.join(f'{clave}={valor}' for clave, valor in self.totales.items())
+        ))
+
+    def _confirmar(self, pasarela, limite, intento):
+        limite.esperar()
+        return intento, pasarela.confirmar_pago(
+            intento.transaction_id or intento.id_en_cola,
+            intento.client_transaction_id
+        )
+
+    def _aplicar(self, resultados):
+        """Guardar un lote de resultados con un bulk_update por tabla"""
+        if not resultados:
+            return
+        ahora = timezone.now()
+        with transaction.atomic():
+            # Solo los que siguen igual: el webhook o el worker pudieron resolverlos mientras tanto
+            vigentes = set(IntentoPago.objects.select_for_update().filter(
+                id__in=[intento.id for intento, _ in resultados],
+                estado='iniciado'
+            ).values_list('id', flat=True))
+            # Las reservaciones se bloquean y se leen de nuevo: el cliente pudo
+            # cancelarlas (y liberar el horario) después de empezar el lote
+            actuales = {
+                reservacion.id: reservacion
+                for reservacion in Reservacion.objects.select_for_update().filter(
+                    id__in={intento.reservacion_id for intento, _ in resultados}
+                ).only(*CAMPOS_RESERVACION)
+            }
+            procesando = {pk for pk, reservacion in actuales.items() if reservacion.estado_pago == 'procesando'}
+            # Un rechazo no marca como fallida una reservación con otro intento abierto
+            con_otro_intento = set(IntentoPago.objects.filter(
+                reservacion_id__in=actuales,
+                estado='iniciado'
+            ).exclude(id__in=vigentes).values_list('reservacion_id', flat=True))
+
+            intentos = []
+            reservaciones = {}
+            # Aprobados primero: si una reservación tiene dos intentos en el lote, gana el pago
+            for intento, confirmacion in sorted(resultados, key=lambda par: not par[1].get('aprobado')):
+                if not confirmacion['success']:
+                    self.totales['errores'] += 1
+                    continue
+                reservacion = actuales[intento.reservacion_id]
+                if intento.id not in vigentes or reservacion.id not in procesando:
+                    self.totales['omitidos'] += 1
+                    continue
+                # La misma regla que registrar_resultado_pago: un aprobado por otro
+                # monto no se registra y el intento queda abierto para revisarlo
+                monto = confirmacion.get('monto')
+                if confirmacion['aprobado'] and monto is not None and monto != intento.monto:
+                    logger.warning('Monto distinto al conciliar', extra={
+                        'client_transaction_id': intento.client_transaction_id,
+                        'monto': str(monto),
+                        'monto_intento': str(intento.monto),
+                    })
+                    self.totales['monto_distinto'] += 1
+                    continue
+
+                intento.estado = 'aprobado' if confirmacion['aprobado'] else 'rechazado'
+                # El ID que devolvió Confirm (verificado), no el de la cola
+                intento.transaction_id = confirmacion['transaction_id']
+                intento.autorizacion = confirmacion.get('autorizacion') or ''
+                # bulk_update no aplica auto_now
+                intento.updated_at = ahora
+                intentos.append(intento)
+
+                if reservacion.estado == 'cancelada':
+                    # El intento queda registrado (un cobro aprobado se reembolsa aparte),
+                    # pero la reservación cancelada no vuelve a ocupar el horario
+                    self.totales['canceladas'] += 1
+                    continue
+                if reservacion.id in reservaciones:
+                    continue
+
+                if confirmacion['aprobado']:
+                    reservacion.estado_pago = 'pagado'
+                    if reservacion.estado == 'pendiente':
+                        reservacion.estado = 'confirmada'
+                    reservacion.fecha_pago = ahora
+                    reservacion.metodo_pago = 'PayPhone'
+                    reservacion.referencia_pago = confirmacion.get('autorizacion') or intento.transaction_id
+                    reservacion.transaccion_id = intento.transaction_id
+                    self.totales['aprobados'] += 1
+                else:
+                    if reservacion.id in con_otro_intento:
+                        continue
+                    reservacion.estado_pago = 'fallido'
+                    self.totales['rechazados'] += 1
+                reservacion.updated_at = ahora
+                reservaciones[reservacion.id] = reservacion
+
+            IntentoPago.objects.bulk_update(intentos, ['estado', 'transaction_id', 'autorizacion', 'updated_at'])
+            Reservacion.objects.bulk_update(reservaciones.values(), [
+                'estado', 'estado_pago', 'fecha_pago', 'metodo_pago',
+                'referencia_pago', 'transaccion_id', 'updated_at'
+            ])
+            ConfirmacionPago.objects.filter(
+                client_transaction_id__in=[intento.client_transaction_id for intento in intentos],
+                estado__in=['pendiente', 'fallida']
+            ).update(estado='completada', updated_at=ahora)
@@ -0,0 +1,120 @@
+import re
+import shlex
+import subprocess
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Dónde se buscan iconos en uso (las rutas de la configuración son relativas a BASE_DIR)
+PLANTILLAS = ('reservaciones/templates/**/*.html', 'static/reservaciones/js/**/*.js')
+
+# Clases de Font Awesome que no son iconos
+UTILIDADES_FA = {'fa-spin', 'fa-pulse', 'fa-fw', 'fa-lg', 'fa-xs', 'fa-sm', 'fa-2x', 'fa-3x', 'fa-solid'}
+
+# Regla de cada icono en all.css: ".fa-home:before,.fa-house:before{content:"\f015"}"
+# (desde Font Awesome 6.6 el código va en la variable --fa)
+REGLA_ICONO = re.compile(r'((?:\.fa-[a-z0-9-]+:{1,2}before\s*,?\s*)+)\{\s*(?:content|--fa)\s*:\s*"\\([0-9a-f]+)"')
+
+CSS_ICONOS = """@font-face{{font-family:"Iconos";font-style:normal;font-weight:900;font-display:block;src:url({fuente}) format("woff2")}}
+.fa,.fas,.fa-solid{{font-family:"Iconos";font-weight:900;font-style:normal;font-variant:normal;display:inline-block;line-height:1;text-rendering:auto;-webkit-font-smoothing:antialiased;-moz-osx-font-smoothing:grayscale}}
+.fa-spin{{animation:fa-spin 2s linear infinite}}
+@keyframes fa-spin{{0%{{transform:rotate(0)}}to{{transform:rotate(360deg)}}}}
+@media (prefers-reduced-motion:reduce){{.fa-spin{{animation:none}}}}
+{reglas}
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Construye el CSS de Tailwind con solo las clases usadas y un subconjunto de los iconos '
+        'de Font Awesome; después ejecuta collectstatic (nombres con hash y copias .gz/.br)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sin-collectstatic', action='store_true', help='Solo construir, sin recolectar')
+
+    def handle(self, *args, **options):
+        self.raiz = Path(settings.BASE_DIR)
+        self.activos = self.raiz / 'activos'
+        self.salida = self.raiz / 'static' / 'reservaciones' / 'dist'
+        self.salida.mkdir(parents=True, exist_ok=True)
+
+        self._css()
+        self._iconos()
+
+        if not options['sin_collectstatic']:
+            call_command('collectstatic', interactive=False, verbosity=options['verbosity'])
+
+    def _css(self):
+        comando = shlex.split(settings.TAILWIND_CLI) + [
+            '--config', str(self.activos / 'tailwind.config.js'),
+            '--input', str(self.activos / 'app.css'),
+            '--output', str(self.salida / 'app.css'),
+            '--minify',
+        ]
+        try:
+            subprocess.run(comando, cwd=self.raiz, check=True)
+        except FileNotFoundError:
+            raise CommandError(
+                f'No se encontró Tailwind ({settings.TAILWIND_CLI}). '
+                'Ejecute "npm install" en activos/ o configure TAILWIND_CLI.'
+            )
+        except subprocess.CalledProcessError as e:
+            raise CommandError(f'Tailwind terminó con error ({e.returncode})')
+        self._informar('app.css')
+
+    def _iconos(self):
+        try:
+            from fontTools import subset
+        except ImportError:
+            raise CommandError('Falta fontTools para recortar la fuente de iconos: pip install fonttools brotli')
+
+        fontawesome = self.raiz / settings.FONTAWESOME_DIR
+        hoja = fontawesome / 'css' / 'all.css'
+        fuente = fontawesome / 'webfonts' / 'fa-solid-900.woff2'
+        if not hoja.exists() or not fuente.exists():
+            raise CommandError(f'No se encontró Font Awesome en {fontawesome} (npm install en activos/)')
+
+        usados = self._iconos_usados()
+        codigos = {}
+        for selectores, codigo in REGLA_ICONO.findall(hoja.read_text(encoding='utf-8')):
+            for nombre in re.findall(r'\.(fa-[a-z0-9-]+)', selectores):
+                if nombre in usados:
+                    codigos[nombre] = codigo
+
+        faltantes = usados - set(codigos)
+        if faltantes:
+            raise CommandError(f"Iconos que no existen en esta versión de Font Awesome: {', '.join(sorted(faltantes))}")
+
+        opciones = subset.Options()
+        opciones.flavor = 'woff2'
+        opciones.layout_features = []
+        opciones.name_IDs = []
+        recortadora = subset.Subsetter(opciones)
+        fuente_completa = subset.load_font(str(fuente), opciones)
+        recortadora.populate(unicodes={int(codigo, 16) for codigo in codigos.values()})
+        recortadora.subset(fuente_completa)
+        subset.save_font(fuente_completa, str(self.salida / 'iconos.woff2'), opciones)
+
+        reglas = '\n'.join(
+            f'.{nombre}:before{{content:"\\{codigo}"}}'
+            for nombre, codigo in sorted(codigos.items())
+        )
+        (self.salida / 'iconos.css').write_text(CSS_ICONOS.format(fuente='iconos.woff2', reglas=reglas), encoding='utf-8')
+        self._informar('iconos.woff2')
+        self._informar('iconos.css')
+        self.stdout.write(f'{len(codigos)} iconos incluidos')
+
+    def _iconos_usados(self):
+        usados = set()
+        for patron in PLANTILLAS:
+            for archivo in self.raiz.glob(patron):
+                usados.update(re.findall(r'\bfa-[a-z0-9-]+', archivo.read_text(encoding='utf-8')))
+        return usados - UTILIDADES_FA
+
+    def _informar(self, nombre):
+        tamano = (self.salida / nombre).stat().st_size
+        self.stdout.write(self.style.SUCCESS(f'{nombre}: {tamano / 1024:.1f} KB'))
@@ -0,0 +1,88 @@
+import json
+import random
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from reservaciones.models import Reservacion
+from reservaciones.services.notificaciones import firmar, ESTADO_APROBADO, ESTADO_CANCELADO
+
+
+class Command(BaseCommand):
+    help = (
+        'Simula las notificaciones de PayPhone para una reservación en proceso de pago. '
+        'Cada notificación solo encola la confirmación: el resultado lo aplica '
+        'procesar_confirmaciones con la respuesta de Confirm.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('reservacion', type=int, help='ID de la reservación (debe tener un pago iniciado)')
+        parser.add_argument('--rechazado', action='store_true', help='Enviar un pago rechazado en lugar de aprobado')
+        parser.add_argument('--repetir', type=int, default=1, help='Veces que se envía la misma notificación')
+        parser.add_argument('--desordenado', action='store_true',
+                            help='Enviar además la notificación contraria, en orden aleatorio')
+        parser.add_argument('--url', help='Enviar por HTTP a esta URL (por defecto se usa el cliente de pruebas)')
+        parser.add_argument('--host', default='localhost', help='Host permitido en ALLOWED_HOSTS')
+
+    def handle(self, *args, **options):
+        if not settings.PAYPHONE_WEBHOOK_SECRET:
+            raise CommandError('Configure PAYPHONE_WEBHOOK_SECRET: sin él se rechazan las notificaciones')
+        try:
+            reservacion = Reservacion.objects.get(id=options['reservacion'])
+        except Reservacion.DoesNotExist:
+            raise CommandError(f'No existe la reservación {options["reservacion"]}')
+        intento = reservacion.intentos_pago.order_by('-created_at').first()
+        if intento is None:
+            raise CommandError('La reservación no tiene intentos de pago (inicie el pago primero)')
+
+        transaction_id = intento.transaction_id or str(random.randint(10 ** 7, 10 ** 8))
+        envios = [not options['rechazado']] * options['repetir']
+        if options['desordenado']:
+            envios.append(options['rechazado'])
+            random.shuffle(envios)
+
+        enviar = self._enviar_http if options['url'] else self._enviar_local
+        for aprobado in envios:
+            cuerpo = json.dumps(self._payload(intento, transaction_id, aprobado)).encode()
+            codigo, respuesta = enviar(cuerpo, options)
+            etiqueta = 'aprobado' if aprobado else 'rechazado'
+            self.stdout.write(f'{etiqueta}: {codigo} {respuesta}')
+
+        pendientes = reservacion.confirmaciones.filter(estado='pendiente').count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Reservación #{reservacion.id}: {pendientes} confirmación(es) en cola '
+            '(manage.py procesar_confirmaciones --una-vez para aplicarlas)'
+        ))
+
+    def _payload(self, intento, transaction_id, aprobado):
+        # Mismos campos que envía la notificación externa de PayPhone
+        return {
+            'StoreId': settings.PAYPHONE_STORE_ID,
+            'TransactionId': transaction_id,
+            'ClientTransactionId': intento.client_transaction_id,
+            'StatusCode': ESTADO_APROBADO if aprobado else ESTADO_CANCELADO,
+            'TransactionStatus': 'Approved' if aprobado else 'Canceled',
+            'AuthorizationCode': f'AUT{transaction_id[-6:]}' if aprobado else '',
+            'Amount': int(intento.monto * 100),
+        }
+
+    def _cabeceras(self, cuerpo):
+        return {'X-PayPhone-Signature': firmar(cuerpo, settings.PAYPHONE_WEBHOOK_SECRET)}
+
+    def _enviar_local(self, cuerpo, options):
+        cliente = Client(HTTP_HOST=options['host'])
+        response = cliente.post(
+            reverse('notificacion_payphone'),
+            cuerpo,
+            content_type='application/json',
+            headers=self._cabeceras(cuerpo)
+        )
+        return response.status_code, response.content.decode()
+
+    def _enviar_http(self, cuerpo, options):
+        cabeceras = {'Content-Type': 'application/json', **self._cabeceras(cuerpo)}
+        response = requests.post(options['url'], data=cuerpo, headers=cabeceras, timeout=10)
+        return response.status_code, response.text
@@ -0,0 +1,104 @@
+import threading
+import time as reloj
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from reservaciones.models import Servicio, Reservacion, OcupacionSlot
+from reservaciones.services.ocupacion import slots_de, rango_minutos
+from reservaciones.services.reservas import reservar, HorarioNoDisponible
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de estrés: muchos hilos intentan reservar el mismo horario a la vez '
+        'y se verifica que no haya sobrerreserva (usar contra PostgreSQL local)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('servicio', type=int, help='ID del servicio')
+        parser.add_argument('fecha', help='Fecha (YYYY-MM-DD)')
+        parser.add_argument('hora', help='Hora de inicio (HH:MM)')
+        parser.add_argument('--hilos', type=int, default=20)
+        parser.add_argument('--personas', type=int, default=1)
+        parser.add_argument('--conservar', action='store_true', help='No borrar las reservaciones creadas')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                f'Base de datos {connection.vendor}: los resultados de concurrencia no son representativos'
+            ))
+
+        try:
+            servicio = Servicio.objects.get(pk=options['servicio'])
+            fecha = datetime.strptime(options['fecha'], '%Y-%m-%d').date()
+            hora_inicio = datetime.strptime(options['hora'], '%H:%M').time()
+        except Servicio.DoesNotExist:
+            raise CommandError('Servicio no encontrado')
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        hora_fin = (
+            datetime.combine(fecha, hora_inicio) + timedelta(minutes=servicio.duracion_minutos)
+        ).time()
+        usuario, _ = User.objects.get_or_create(username='estres_reservas')
+        personas = options['personas']
+
+        creadas, rechazadas, errores = [], [], []
+        barrera = threading.Barrier(options['hilos'])
+
+        def intentar(n):
+            try:
+                barrera.wait()
+                reservacion = reservar(
+                    servicio, fecha, hora_inicio, hora_fin, personas,
+                    usuario=usuario,
+                    nombre_cliente=f'Estrés {n}',
+                    email_cliente='estres@example.com',
+                    telefono_cliente='0000000000',
+                    precio_total=servicio.precio * personas,
+                )
+                creadas.append(reservacion.pk)
+            except HorarioNoDisponible:
+                rechazadas.append(n)
+            except Exception as e:
+                errores.append(repr(e))
+            finally:
+                connections.close_all()
+
+        inicio = reloj.perf_counter()
+        hilos = [threading.Thread(target=intentar, args=(n,)) for n in range(options['hilos'])]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = reloj.perf_counter() - inicio
+
+        slots = slots_de(*rango_minutos(hora_inicio, hora_fin))
+        maximo = max(
+            OcupacionSlot.objects.filter(
+                servicio=servicio, fecha=fecha, slot__range=(slots.start, slots.stop - 1)
+            ).values_list('personas', flat=True),
+            default=0
+        )
+
+        self.stdout.write(
+            f'Creadas: {len(creadas)}  Rechazadas: {len(rechazadas)}  '
+            f'Errores: {len(errores)}  Tiempo: {duracion:.2f}s'
+        )
+        for error in errores[:5]:
+            self.stdout.write(self.style.ERROR(error))
+
+        if not options['conservar']:
+            for reservacion in Reservacion.objects.filter(pk__in=creadas):
+                reservacion.delete()
+
+        if maximo > servicio.capacidad_maxima:
+            raise CommandError(
+                f'Sobrerreserva: {maximo} personas con capacidad {servicio.capacidad_maxima}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Sin sobrerreserva (máximo {maximo} de {servicio.capacidad_maxima})'
+        ))
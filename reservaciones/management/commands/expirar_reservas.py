@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reservaciones.services.retenciones import expirar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Cancela por lotes las reservaciones pendientes cuya retención venció sin pago'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Reservaciones por transacción')
+        parser.add_argument('--pausa', type=float, default=0.0, help='Segundos de espera entre lotes')
+        parser.add_argument('--intervalo', type=float, default=0.0,
+                            help='Repetir cada N segundos (0 = una sola pasada)')
+
+    def handle(self, *args, **options):
+        while True:
+            total = self._barrer(options['lote'], options['pausa'])
+            if total or options['verbosity'] > 1:
+                self.stdout.write(self.style.SUCCESS(f'Reservaciones vencidas canceladas: {total}'))
+            if not options['intervalo']:
+                return
+            time.sleep(options['intervalo'])
+
+    def _barrer(self, lote, pausa):
+        total = 0
+        while True:
+            canceladas = expirar_vencidas(lote=lote)
+            total += canceladas
+            # Un lote incompleto significa que no quedan (o las que quedan están bloqueadas)
+            if canceladas < lote:
+                return total
+            if pausa:
+                time.sleep(pausa)
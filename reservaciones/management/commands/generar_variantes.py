@@ -0,0 +1,44 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from reservaciones.models import Servicio
+from reservaciones.services.imagenes import actualizar_variantes, formatos_disponibles
+
+
+class Command(BaseCommand):
+    help = 'Genera en paralelo las variantes (tamaños y formatos) de las imágenes de servicios existentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=os.cpu_count() or 4,
+                            help='Imágenes procesadas a la vez (Pillow libera el GIL al redimensionar y codificar)')
+        parser.add_argument('--forzar', action='store_true', help='Regenerar también las que ya tienen variantes')
+        parser.add_argument('--servicio', type=int, action='append', help='Solo este servicio (se puede repetir)')
+
+    def handle(self, *args, **options):
+        servicios = Servicio.objects.exclude(imagen='').exclude(imagen__isnull=True).order_by('id')
+        if options['servicio']:
+            servicios = servicios.filter(id__in=options['servicio'])
+
+        self.stdout.write(f"Formatos: {', '.join(formatos_disponibles())}")
+        inicio = time.perf_counter()
+        generadas = 0
+        with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+            for servicio, hecho in pool.map(lambda s: self._procesar(s, options['forzar']), servicios):
+                if hecho:
+                    generadas += 1
+                    self.stdout.write(f'Servicio #{servicio.id}: {servicio.imagen.name}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Variantes generadas para {generadas} imágenes en {time.perf_counter() - inicio:.2f}s'
+        ))
+
+    def _procesar(self, servicio, forzar):
+        # Cada hilo usa su propia conexión; se cierra si quedó inservible
+        try:
+            return servicio, actualizar_variantes(servicio, forzar=forzar)
+        finally:
+            close_old_connections()
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from reservaciones.services import payphone_simulado
+
+
+class Command(BaseCommand):
+    help = 'Levanta una API de PayPhone simulada en 127.0.0.1 para pruebas locales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puerto', type=int, default=8765)
+        parser.add_argument('--latencia', type=float, default=0.0, help='Segundos de espera por respuesta')
+        parser.add_argument('--errores', type=float, default=0.0, help='Fracción de respuestas 503 (0 a 1)')
+        parser.add_argument('--rechazos', type=float, default=0.0, help='Fracción de pagos rechazados (0 a 1)')
+        parser.add_argument('--verbose-http', action='store_true', help='Mostrar cada petición')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"PayPhone simulado en http://127.0.0.1:{options['puerto']}/api "
+            f"(latencia {options['latencia']}s, errores {options['errores']:.0%}, rechazos {options['rechazos']:.0%})"
+        )
+        try:
+            payphone_simulado.iniciar(
+                puerto=options['puerto'],
+                latencia=options['latencia'],
+                tasa_error=options['errores'],
+                tasa_rechazo=options['rechazos'],
+                en_segundo_plano=False,
+                silencioso=not options['verbose_http'],
+            )
+        except KeyboardInterrupt:
+            pass
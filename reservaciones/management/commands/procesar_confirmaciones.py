@@ -0,0 +1,45 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from reservaciones.services.confirmaciones import reclamar_trabajos, procesar_trabajo
+
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Worker que confirma con PayPhone los pagos encolados por la vista de retorno'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=4, help='Confirmaciones simultáneas')
+        parser.add_argument('--lote', type=int, default=20, help='Trabajos tomados por vuelta')
+        parser.add_argument('--intervalo', type=float, default=1.0, help='Segundos de espera si la cola está vacía')
+        parser.add_argument('--una-vez', action='store_true', help='Procesar lo pendiente y terminar')
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+            while True:
+                trabajos = reclamar_trabajos(options['lote'])
+                for trabajo in pool.map(self._procesar, trabajos):
+                    if trabajo is not None:
+                        self.stdout.write(f'{trabajo.transaction_id}: {trabajo.estado} (intento {trabajo.intentos})')
+
+                if options['una_vez']:
+                    break
+                if not trabajos:
+                    time.sleep(options['intervalo'])
+
+    def _procesar(self, trabajo):
+        # Cada hilo usa su propia conexión; se cierra si quedó inservible
+        try:
+            return procesar_trabajo(trabajo)
+        except Exception:
+            # Ni siquiera se pudo guardar el trabajo (p. ej. la base de datos cayó):
+            # queda 'procesando' y se vuelve a tomar al vencer, sin detener el worker
+            logger.exception('No se pudo procesar la confirmación', extra={'confirmacion': trabajo.id})
+            return None
+        finally:
+            close_old_connections()
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reservaciones.services.ocupacion import reconstruir_ocupacion
+from reservaciones.services.cache_disponibilidad import invalidar_todo
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la tabla de ocupación (OcupacionSlot) a partir de las reservaciones activas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Fecha inicial (YYYY-MM-DD)')
+        parser.add_argument('--hasta', help='Fecha final (YYYY-MM-DD)')
+        parser.add_argument('--servicio', type=int, help='ID del servicio')
+
+    def handle(self, *args, **options):
+        desde = self._fecha(options['desde'])
+        hasta = self._fecha(options['hasta'])
+
+        bloques = reconstruir_ocupacion(desde=desde, hasta=hasta, servicio_id=options['servicio'])
+        invalidar_todo()
+
+        self.stdout.write(self.style.SUCCESS(f'Ocupación reconstruida: {bloques} bloques'))
+
+    def _fecha(self, valor):
+        if not valor:
+            return None
+        try:
+            return datetime.strptime(valor, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Fecha inválida: {valor} (use YYYY-MM-DD)')
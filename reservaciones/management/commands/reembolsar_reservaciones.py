@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reservaciones.models import Reservacion
+from reservaciones.services.reembolsos import cancelar_y_reembolsar
+
+
+class Command(BaseCommand):
+    help = (
+        'Cancela las reservaciones de un servicio/fecha (o de una lista de IDs) '
+        'y reembolsa en paralelo las que estaban pagadas'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servicio', type=int, help='ID del servicio')
+        parser.add_argument('--fecha', help='Fecha de las reservaciones (YYYY-MM-DD)')
+        parser.add_argument('--ids', help='IDs de reservaciones separados por coma')
+        parser.add_argument('--hilos', type=int, default=settings.REEMBOLSOS_HILOS, help='Reembolsos simultáneos')
+        parser.add_argument('--simular', action='store_true', help='Solo mostrar qué se cancelaría y reembolsaría')
+
+    def handle(self, *args, **options):
+        reservaciones = Reservacion.objects.all()
+        if options['ids']:
+            try:
+                ids = [int(i) for i in options['ids'].split(',')]
+            except ValueError:
+                raise CommandError('--ids debe ser una lista de números separados por coma')
+            reservaciones = reservaciones.filter(id__in=ids)
+        elif options['servicio'] and options['fecha']:
+            reservaciones = reservaciones.filter(servicio_id=options['servicio'], fecha=self._fecha(options['fecha']))
+        else:
+            raise CommandError('Indique --ids o --servicio junto con --fecha')
+
+        if options['simular']:
+            activas = reservaciones.filter(estado__in=['pendiente', 'confirmada']).count()
+            pagadas = reservaciones.filter(estado__in=['pendiente', 'confirmada'], estado_pago='pagado').count()
+            self.stdout.write(f'Se cancelarían {activas} reservaciones y se pedirían {pagadas} reembolsos')
+            return
+
+        resumen = cancelar_y_reembolsar(reservaciones, hilos=options['hilos'])
+
+        for fallida in resumen['fallidas']:
+            self.stdout.write(self.style.ERROR(f"Reservación #{fallida['reservacion']}: {fallida['error']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Canceladas: {resumen['canceladas']} | "
+            f"Reembolsos: {resumen['reembolsadas']} de {resumen['reembolsos_solicitados']} "
+            f"({len(resumen['fallidas'])} fallidos) | Tiempo: {resumen['segundos']}s"
+        ))
+
+    def _fecha(self, valor):
+        try:
+            return datetime.strptime(valor, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Fecha inválida: {valor} (use YYYY-MM-DD)')
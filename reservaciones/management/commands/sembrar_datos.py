@@ -0,0 +1,187 @@
+import random
+import time as reloj
+from collections import Counter
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from reservaciones.models import Servicio, HorarioDisponible, Reservacion, OcupacionSlot
+from reservaciones.services.ocupacion import huella
+from reservaciones.services.cache_disponibilidad import invalidar_servicio
+
+
+PREFIJO = 'sintetico'
+
+ESTADOS = ['pendiente', 'confirmada', 'confirmada', 'confirmada', 'cancelada', 'completada']
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera un conjunto de datos sintético (servicios, horarios, usuarios y '
+        'reservaciones) para medir el rendimiento. Usa bulk_create por lotes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servicios', type=int, default=20)
+        parser.add_argument('--usuarios', type=int, default=1000)
+        parser.add_argument('--reservaciones', type=int, default=100000)
+        parser.add_argument('--dias', type=int, default=365, help='Días alrededor de hoy en los que repartir las reservaciones')
+        parser.add_argument('--lote', type=int, default=10000)
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--password', default='benchmark', help='Contraseña de todos los usuarios generados')
+        parser.add_argument('--limpiar', action='store_true', help='Borrar primero los datos sintéticos anteriores')
+
+    def handle(self, *args, **options):
+        aleatorio = random.Random(options['semilla'])
+        inicio = reloj.perf_counter()
+
+        if options['limpiar']:
+            self._limpiar()
+
+        servicios = self._crear_servicios(options['servicios'], aleatorio)
+        usuarios = self._crear_usuarios(options['usuarios'], options['password'])
+        ocupacion = self._crear_reservaciones(servicios, usuarios, options, aleatorio)
+
+        # bulk_create no dispara señales: escribir la ocupación de los servicios
+        # nuevos (solo sus días) e invalidar solo esos servicios en la caché
+        bloques = self._crear_ocupacion(servicios, ocupacion, options['lote'])
+        for servicio in servicios:
+            invalidar_servicio(servicio.id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Datos generados en {reloj.perf_counter() - inicio:.1f}s '
+            f'({bloques} bloques de ocupación)'
+        ))
+
+    def _limpiar(self):
+        # DELETE directo: con señales se recalcularía la ocupación fila por fila;
+        # la de estos servicios se borra con ellos (CASCADE)
+        servicios = list(Servicio.objects.filter(nombre__startswith=PREFIJO).values_list('id', flat=True))
+        if servicios:
+            with connection.cursor() as cursor:
+                marcadores = ', '.join(['%s'] * len(servicios))
+                cursor.execute(
+                    f'DELETE FROM {Reservacion._meta.db_table} WHERE servicio_id IN ({marcadores})',
+                    servicios
+                )
+        Servicio.objects.filter(nombre__startswith=PREFIJO).delete()
+        User.objects.filter(username__startswith=PREFIJO).delete()
+        self.stdout.write('Datos sintéticos anteriores eliminados')
+
+    def _crear_servicios(self, cantidad, aleatorio):
+        existentes = Servicio.objects.filter(nombre__startswith=PREFIJO).count()
+        servicios = Servicio.objects.bulk_create([
+            Servicio(
+                nombre=f'{PREFIJO} servicio {existentes + n}',
+                descripcion='Servicio generado para pruebas de rendimiento',
+                duracion_minutos=aleatorio.choice([15, 30, 45, 60, 90]),
+                precio=Decimal(aleatorio.randint(5, 150)),
+                capacidad_maxima=aleatorio.choice([1, 1, 1, 4, 10]),
+                intervalo_minutos=aleatorio.choice([5, 15, 30]),
+            )
+            for n in range(cantidad)
+        ])
+
+        horarios = []
+        for servicio in servicios:
+            for dia in range(6):
+                horarios.append(HorarioDisponible(
+                    servicio=servicio, dia_semana=dia, hora_inicio=time(8), hora_fin=time(13)
+                ))
+                horarios.append(HorarioDisponible(
+                    servicio=servicio, dia_semana=dia, hora_inicio=time(14), hora_fin=time(20)
+                ))
+        HorarioDisponible.objects.bulk_create(horarios)
+
+        self.stdout.write(f'{len(servicios)} servicios y {len(horarios)} horarios')
+        return servicios
+
+    def _crear_usuarios(self, cantidad, password):
+        # Un solo hash para todos: hashear millones de contraseñas tomaría horas
+        hash_password = make_password(password)
+        existentes = User.objects.filter(username__startswith=PREFIJO).count()
+        User.objects.bulk_create(
+            [
+                User(
+                    username=f'{PREFIJO}{existentes + n}',
+                    email=f'{PREFIJO}{existentes + n}@example.com',
+                    password=hash_password,
+                )
+                for n in range(cantidad)
+            ],
+            batch_size=5000
+        )
+        usuarios = list(User.objects.filter(username__startswith=PREFIJO).values_list('id', flat=True))
+        self.stdout.write(f'{cantidad} usuarios')
+        return usuarios
+
+    def _crear_reservaciones(self, servicios, usuarios, options, aleatorio):
+        total = options['reservaciones']
+        lote = options['lote']
+        dias = options['dias']
+        hoy = date.today()
+
+        # Ocupación de las reservaciones activas: (servicio_id, fecha, slot) -> personas.
+        # Las que no caben se generan canceladas, como si se hubieran liberado
+        ocupacion = Counter()
+        creadas = 0
+        while creadas < total:
+            reservaciones = []
+            for _ in range(min(lote, total - creadas)):
+                servicio = aleatorio.choice(servicios)
+                fecha = hoy + timedelta(days=aleatorio.randint(-dias // 2, dias // 2))
+                minutos = aleatorio.randrange(8 * 60, 19 * 60, 15)
+                fin = minutos + servicio.duracion_minutos
+                personas = aleatorio.randint(1, servicio.capacidad_maxima)
+                reservacion = Reservacion(
+                    usuario_id=aleatorio.choice(usuarios),
+                    servicio=servicio,
+                    fecha=fecha,
+                    hora_inicio=time(minutos // 60, minutos % 60),
+                    hora_fin=time(fin // 60, fin % 60),
+                    nombre_cliente='Cliente Sintético',
+                    email_cliente='cliente@example.com',
+                    telefono_cliente='0999999999',
+                    numero_personas=personas,
+                    # bulk_create no pasa por save(): copiar el margen aquí
+                    buffer_minutos=servicio.buffer_minutos,
+                    estado=aleatorio.choice(ESTADOS),
+                    precio_total=servicio.precio * personas,
+                )
+                aporte = huella(reservacion.__dict__)
+                if aporte:
+                    _, _, slots, _ = aporte
+                    if any(ocupacion[(servicio.id, fecha, slot)] + personas > servicio.capacidad_maxima
+                           for slot in slots):
+                        reservacion.estado = 'cancelada'
+                    else:
+                        for slot in slots:
+                            ocupacion[(servicio.id, fecha, slot)] += personas
+                reservaciones.append(reservacion)
+            Reservacion.objects.bulk_create(reservaciones)
+            creadas += len(reservaciones)
+            self.stdout.write(f'  {creadas}/{total} reservaciones')
+        return ocupacion
+
+    def _crear_ocupacion(self, servicios, ocupacion, lote):
+        # Los servicios son nuevos: no tienen bloques que sumar ni otras
+        # reservaciones, así que basta con insertar lo acumulado
+        capacidades = {servicio.id: servicio.capacidad_maxima for servicio in servicios}
+        OcupacionSlot.objects.bulk_create(
+            [
+                OcupacionSlot(
+                    servicio_id=servicio,
+                    fecha=fecha,
+                    slot=slot,
+                    personas=personas,
+                    capacidad=capacidades[servicio],
+                )
+                for (servicio, fecha, slot), personas in ocupacion.items()
+            ],
+            batch_size=lote
+        )
+        return len(ocupacion)
@@ -0,0 +1,7 @@
+def percentil(valores, porcentaje):
+    """Percentil con interpolación lineal entre los dos valores más cercanos"""
+    ordenados = sorted(valores)
+    indice = (len(ordenados) - 1) * porcentaje / 100
+    bajo = int(indice)
+    alto = min(bajo + 1, len(ordenados) - 1)
+    return ordenados[bajo] + (ordenados[alto] - ordenados[bajo]) * (indice - bajo)
@@ -0,0 +1,46 @@
+import re
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .registro import iniciar_contexto, terminar_contexto
+
+
+# Solo se acepta un X-Request-ID entrante con formato razonable
+_ID_VALIDO = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class IdCorrelacionMiddleware:
+    """
+    Asignar a cada request un ID de correlación (el X-Request-ID recibido
+    o uno nuevo). Todos los registros del request lo incluyen y se
+    devuelve en la cabecera X-Request-ID de la respuesta.
+    Funciona con vistas síncronas y async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _iniciar(self, request):
+        recibido = request.headers.get('X-Request-ID', '')
+        request.id_correlacion = recibido if _ID_VALIDO.match(recibido) else uuid.uuid4().hex
+        return iniciar_contexto(request.id_correlacion)
+
+    def _terminar(self, request, response, tokens):
+        response['X-Request-ID'] = request.id_correlacion
+        terminar_contexto(tokens)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self._iniciar(request)
+        return self._terminar(request, self.get_response(request), tokens)
+
+    async def __acall__(self, request):
+        tokens = self._iniciar(request)
+        return self._terminar(request, await self.get_response(request), tokens)
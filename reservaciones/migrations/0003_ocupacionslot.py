@@ -0,0 +1,58 @@
+# Generated by Django 6.0.1 on 2026-10-17 05:58
+
+import django.db.models.deletion
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def poblar_ocupacion(apps, schema_editor):
+    """Calcular la ocupación inicial a partir de las reservaciones activas"""
+    Reservacion = apps.get_model('reservaciones', 'Reservacion')
+    OcupacionSlot = apps.get_model('reservaciones', 'OcupacionSlot')
+
+    totales = Counter()
+    filas = Reservacion.objects.filter(
+        estado__in=['pendiente', 'confirmada']
+    ).values_list('servicio_id', 'fecha', 'hora_inicio', 'hora_fin', 'numero_personas').order_by()
+    for servicio, fecha, hora_inicio, hora_fin, personas in filas.iterator(chunk_size=5000):
+        inicio = hora_inicio.hour * 60 + hora_inicio.minute
+        fin = hora_fin.hour * 60 + hora_fin.minute
+        if fin <= inicio:
+            fin = 24 * 60
+        for slot in range(inicio // 5, (fin - 1) // 5 + 1):
+            totales[(servicio, fecha, slot)] += personas
+
+    OcupacionSlot.objects.bulk_create(
+        [
+            OcupacionSlot(servicio_id=servicio, fecha=fecha, slot=slot, personas=personas)
+            for (servicio, fecha, slot), personas in totales.items()
+        ],
+        batch_size=5000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservaciones', '0002_reservacion_estado_pago_reservacion_fecha_pago_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcupacionSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('slot', models.PositiveSmallIntegerField(help_text='Bloque del día (minuto de inicio / tamaño del bloque)')),
+                ('personas', models.IntegerField(default=0)),
+                ('servicio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocupacion', to='reservaciones.servicio')),
+            ],
+            options={
+                'verbose_name_plural': 'Ocupación de Slots',
+                'ordering': ['servicio', 'fecha', 'slot'],
+                'unique_together': {('servicio', 'fecha', 'slot')},
+            },
+        ),
+        migrations.RunPython(poblar_ocupacion, migrations.RunPython.noop),
+    ]
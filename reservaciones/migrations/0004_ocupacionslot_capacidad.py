@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-17 05:59
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Greatest
+
+
+def copiar_capacidad(apps, schema_editor):
+    """Copiar la capacidad de cada servicio (sin invalidar sobrecupos existentes)"""
+    Servicio = apps.get_model('reservaciones', 'Servicio')
+    OcupacionSlot = apps.get_model('reservaciones', 'OcupacionSlot')
+
+    capacidad = Servicio.objects.filter(pk=OuterRef('servicio_id')).values('capacidad_maxima')[:1]
+    OcupacionSlot.objects.update(capacidad=Greatest(Subquery(capacidad), F('personas')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservaciones', '0003_ocupacionslot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocupacionslot',
+            name='capacidad',
+            field=models.IntegerField(default=1, help_text='Copia de Servicio.capacidad_maxima'),
+        ),
+        migrations.RunPython(copiar_capacidad, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ocupacionslot',
+            constraint=models.CheckConstraint(condition=models.Q(('personas__lte', models.F('capacidad'))), name='ocupacion_dentro_de_capacidad'),
+        ),
+    ]
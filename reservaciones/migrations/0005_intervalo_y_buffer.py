@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:02
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservaciones', '0004_ocupacionslot_capacidad'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='horariodisponible',
+            name='intervalo_minutos',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Intervalo propio para esta franja (vacío = el del servicio)', null=True, validators=[django.core.validators.MinValueValidator(5)]),
+        ),
+        migrations.AddField(
+            model_name='servicio',
+            name='buffer_minutos',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Minutos libres requeridos antes y después de cada reservación'),
+        ),
+        migrations.AddField(
+            model_name='servicio',
+            name='intervalo_minutos',
+            field=models.PositiveSmallIntegerField(default=30, help_text='Minutos entre el inicio de un horario y el siguiente', validators=[django.core.validators.MinValueValidator(5)]),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservaciones', '0005_intervalo_y_buffer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfirmacionPago',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_id', models.CharField(help_text='ID de la transacción en PayPhone', max_length=255, unique=True)),
+                ('client_transaction_id', models.CharField(max_length=255)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completada', 'Completada'), ('fallida', 'Fallida')], default='pendiente', max_length=20)),
+                ('intentos', models.IntegerField(default=0)),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now, help_text='Cuándo puede procesarse (reintentos)')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('reservacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='confirmaciones', to='reservaciones.reservacion')),
+            ],
+            options={
+                'verbose_name_plural': 'Confirmaciones de Pago',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['estado', 'disponible_en'], name='reservacion_estado_666d6f_idx')],
+            },
+        ),
+    ]
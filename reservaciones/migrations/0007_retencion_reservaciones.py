@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservaciones', '0006_confirmacionpago'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservacion',
+            name='expira_en',
+            field=models.DateTimeField(blank=True, help_text='Vencimiento de la retención si no se paga (vacío = no vence)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reservacion',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['expira_en'], name='reservacion_retencion_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def registrar_pagos_en_curso(apps, schema_editor):
+    """
+    Crear el intento de los pagos que estaban en curso: hasta ahora el
+    clientTransactionId se guardaba en Reservacion.transaccion_id
+    """
+    Reservacion = apps.get_model('reservaciones', 'Reservacion')
+    IntentoPago = apps.get_model('reservaciones', 'IntentoPago')
+    ConfirmacionPago = apps.get_model('reservaciones', 'ConfirmacionPago')
+
+    en_curso = Reservacion.objects.filter(
+        estado_pago='procesando',
+        transaccion_id__isnull=False
+    ).exclude(transaccion_id='')
+    intentos = []
+    for reservacion in en_curso.iterator(chunk_size=2000):
+        # El ID de PayPhone solo se conoce si el retorno alcanzó a encolar la confirmación
+        confirmacion = ConfirmacionPago.objects.filter(
+            reservacion_id=reservacion.id,
+            client_transaction_id=reservacion.transaccion_id
+        ).order_by('-created_at').first()
+        intentos.append(IntentoPago(
+            reservacion_id=reservacion.id,
+            pasarela='payphone',
+            client_transaction_id=reservacion.transaccion_id,
+            transaction_id=confirmacion.transaction_id if confirmacion else None,
+            monto=reservacion.precio_total,
+        ))
+    IntentoPago.objects.bulk_create(intentos, batch_size=2000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservaciones', '0007_retencion_reservaciones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntentoPago',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pasarela', models.CharField(max_length=20)),
+                ('client_transaction_id', models.CharField(help_text='Referencia propia enviada a la pasarela', max_length=255, unique=True)),
+                ('transaction_id', models.CharField(blank=True, help_text='ID de la transacción en la pasarela', max_length=255, null=True, unique=True)),
+                ('estado', models.CharField(choices=[('iniciado', 'Iniciado'), ('aprobado', 'Aprobado'), ('rechazado', 'Rechazado'), ('cancelado', 'Cancelado')], default='iniciado', max_length=20)),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('autorizacion', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('reservacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intentos_pago', to='reservaciones.reservacion')),
+            ],
+            options={
+                'verbose_name_plural': 'Intentos de Pago',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['estado', 'updated_at'], name='reservacion_estado_71cbc3_idx')],
+            },
+        ),
+        migrations.RunPython(registrar_pagos_en_curso, migrations.RunPython.noop),
+    ]
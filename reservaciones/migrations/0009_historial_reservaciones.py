@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservaciones', '0008_intentopago'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservacion',
+            index=models.Index(fields=['usuario', 'fecha', 'hora_inicio', 'id'], name='reservacion_historial_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservaciones', '0009_historial_reservaciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicio',
+            name='imagen_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
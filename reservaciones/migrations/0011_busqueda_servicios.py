@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:29
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservaciones', '0010_servicio_imagen_variantes'),
+    ]
+
+    operations = [
+        # Requerida por el índice gin_trgm_ops (en Postgres 13+ no necesita superusuario)
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.AddIndex(
+            model_name='servicio',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('nombre', config='spanish', weight='A'), '||', django.contrib.postgres.search.SearchVector('descripcion', config='spanish', weight='B'), django.contrib.postgres.search.SearchConfig('spanish')), condition=models.Q(('activo', True)), name='servicio_busqueda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicio',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(('activo', True)), fields=['nombre'], name='servicio_nombre_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='servicio',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['precio', 'id'], name='servicio_precio_idx'),
+        ),
+    ]
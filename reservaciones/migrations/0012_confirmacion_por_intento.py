@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservaciones', '0011_busqueda_servicios'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='confirmacionpago',
+            name='transaction_id',
+            field=models.CharField(help_text='ID de la transacción en PayPhone (sin verificar)', max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='confirmacionpago',
+            constraint=models.UniqueConstraint(fields=('client_transaction_id', 'transaction_id'), name='confirmacion_unica_por_intento'),
+        ),
+    ]
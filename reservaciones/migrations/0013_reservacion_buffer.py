@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservaciones', '0012_confirmacion_por_intento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservacion',
+            name='buffer_minutos',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Margen del servicio al reservar: la reservación también ocupa esos minutos después de terminar'),
+        ),
+        migrations.AlterField(
+            model_name='servicio',
+            name='buffer_minutos',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Minutos libres requeridos entre una reservación y la siguiente (se copia a cada reservación nueva)'),
+        ),
+    ]
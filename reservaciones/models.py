@@ -1,9 +1,20 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 
 
+# Documento de búsqueda de un servicio: el nombre pesa más que la descripción.
+# La búsqueda (services/catalogo.py) debe usar esta misma expresión para
+# que Postgres aproveche el índice GIN de Servicio
+VECTOR_BUSQUEDA = (
+    SearchVector('nombre', weight='A', config='spanish')
+    + SearchVector('descripcion', weight='B', config='spanish')
+)
+
+
 class Servicio(models.Model):
     """Servicios disponibles para reservar"""
     nombre = models.CharField(max_length=200)
@@ -14,8 +25,19 @@ class Servicio(models.Model):
     )
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     imagen = models.ImageField(upload_to='servicios/', blank=True, null=True)
+    # Versiones redimensionadas de la imagen (ver services/imagenes.py)
+    imagen_variantes = models.JSONField(default=dict, blank=True, editable=False)
     activo = models.BooleanField(default=True)
     capacidad_maxima = models.IntegerField(default=1)
+    intervalo_minutos = models.PositiveSmallIntegerField(
+        default=30,
+        validators=[MinValueValidator(5)],
+        help_text="Minutos entre el inicio de un horario y el siguiente"
+    )
+    buffer_minutos = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Minutos libres requeridos entre una reservación y la siguiente (se copia a cada reservación nueva)"
+    )
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -23,10 +45,30 @@ class Servicio(models.Model):
     class Meta:
         verbose_name_plural = "Servicios"
         ordering = ['nombre']
+        indexes = [
+            # Búsqueda de texto completo en nombre y descripción (solo activos)
+            GinIndex(VECTOR_BUSQUEDA, name='servicio_busqueda_idx', condition=models.Q(activo=True)),
+            # Coincidencias parciales o con errores de tipeo en el nombre (pg_trgm)
+            GinIndex(
+                fields=['nombre'],
+                opclasses=['gin_trgm_ops'],
+                name='servicio_nombre_trgm_idx',
+                condition=models.Q(activo=True)
+            ),
+            # Filtros y orden del catálogo
+            models.Index(fields=['precio', 'id'], name='servicio_precio_idx', condition=models.Q(activo=True)),
+        ]
 
     def __str__(self):
         return self.nombre
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valores cargados, para detectar cambios que afectan la disponibilidad
+        instance._valores_cargados = dict(zip(field_names, values))
+        return instance
+
 
 class HorarioDisponible(models.Model):
     """Horarios disponibles por día de la semana"""
@@ -44,6 +86,12 @@ class HorarioDisponible(models.Model):
     dia_semana = models.IntegerField(choices=DIAS_SEMANA)
     hora_inicio = models.TimeField()
     hora_fin = models.TimeField()
+    intervalo_minutos = models.PositiveSmallIntegerField(
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(5)],
+        help_text="Intervalo propio para esta franja (vacío = el del servicio)"
+    )
     activo = models.BooleanField(default=True)
 
     class Meta:
@@ -83,6 +131,11 @@ class Reservacion(models.Model):
     email_cliente = models.EmailField()
     telefono_cliente = models.CharField(max_length=20)
     numero_personas = models.IntegerField(validators=[MinValueValidator(1)], default=1)
+    buffer_minutos = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        help_text="Margen del servicio al reservar: la reservación también ocupa esos minutos después de terminar"
+    )
     
     notas = models.TextField(blank=True, help_text="Notas adicionales del cliente")
     estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
@@ -95,6 +148,9 @@ class Reservacion(models.Model):
     fecha_pago = models.DateTimeField(blank=True, null=True)
     metodo_pago = models.CharField(max_length=50, blank=True, null=True, help_text="Tarjeta, PayPhone, etc.")
     
+    # Retención del horario mientras la reservación está pendiente de pago
+    expira_en = models.DateTimeField(blank=True, null=True, help_text="Vencimiento de la retención si no se paga (vacío = no vence)")
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -104,18 +160,56 @@ class Reservacion(models.Model):
         indexes = [
             models.Index(fields=['fecha', 'estado']),
             models.Index(fields=['usuario', 'estado']),
+            # Orden del historial del usuario (paginación por cursor)
+            models.Index(fields=['usuario', 'fecha', 'hora_inicio', 'id'], name='reservacion_historial_idx'),
             models.Index(fields=['transaccion_id']),
+            # Solo las pendientes: el índice se mantiene pequeño
+            models.Index(
+                fields=['expira_en'],
+                name='reservacion_retencion_idx',
+                condition=models.Q(estado='pendiente')
+            ),
         ]
 
     def __str__(self):
         return f"{self.nombre_cliente} - {self.servicio.nombre} - {self.fecha} {self.hora_inicio}"
 
+    def save(self, *args, **kwargs):
+        # El margen se copia al crear, como el precio: si el servicio lo cambia
+        # después, la ocupación de las reservaciones hechas no se mueve
+        if self._state.adding:
+            self.buffer_minutos = self.servicio.buffer_minutos
+        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        # El margen se copia al crear, como el precio: si el servicio lo cambia
+        # después, la ocupación de las reservaciones hechas no se mueve
+        if self._state.adding:
+            self.buffer_minutos = self.servicio.buffer_minutos
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valores cargados, para calcular el cambio de ocupación al guardar
+        instance._valores_cargados = dict(zip(field_names, values))
+        return instance
+
     def esta_confirmada(self):
         return self.estado == 'confirmada'
     
     def esta_pagada(self):
         return self.estado_pago == 'pagado'
 
+    def retencion_vencida(self):
+        """Pendiente sin pago cuya retención del horario ya venció"""
+        return (
+            self.estado == 'pendiente'
+            and self.estado_pago in ('pendiente', 'fallido')
+            and self.expira_en is not None
+            and self.expira_en < timezone.now()
+        )
+
     def puede_cancelar(self):
         """Verificar si la reservación puede ser cancelada (ej: 24h antes)"""
         from datetime import datetime, timedelta
@@ -127,4 +221,115 @@ class Reservacion(models.Model):
         
         limite_cancelacion = fecha_hora_reserva - timedelta(hours=24)
         
-        return timezone.now() < limite_cancelacion
\ No newline at end of file
+        return timezone.now() < limite_cancelacion
+
+
+class OcupacionSlot(models.Model):
+    """
+    Ocupación precalculada por servicio, fecha y bloque de tiempo.
+    Se mantiene al crear o cambiar reservaciones (ver services/ocupacion.py)
+    y se reconstruye con el comando reconstruir_ocupacion. La restricción
+    de capacidad hace que la base de datos rechace una reservación que no cabe.
+    """
+    servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE, related_name='ocupacion')
+    fecha = models.DateField()
+    slot = models.PositiveSmallIntegerField(help_text="Bloque del día (minuto de inicio / tamaño del bloque)")
+    personas = models.IntegerField(default=0)
+    capacidad = models.IntegerField(default=1, help_text="Copia de Servicio.capacidad_maxima")
+
+    class Meta:
+        verbose_name_plural = "Ocupación de Slots"
+        unique_together = ['servicio', 'fecha', 'slot']
+        ordering = ['servicio', 'fecha', 'slot']
+        constraints = [
+            # Impide sobrerreservar un bloque aunque dos reservaciones lleguen a la vez
+            models.CheckConstraint(
+                condition=models.Q(personas__lte=models.F('capacidad')),
+                name='ocupacion_dentro_de_capacidad',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.servicio_id} - {self.fecha} #{self.slot}: {self.personas}"
+
+
+class IntentoPago(models.Model):
+    """
+    Un intento de pago de una reservación (uno cada vez que se abre la
+    pasarela). Las referencias tienen índice único: la vista de retorno,
+    la notificación, el worker y la conciliación encuentran el intento
+    sin interpretar los IDs, y los reintentos quedan como historial.
+    """
+    ESTADOS = [
+        ('iniciado', 'Iniciado'),
+        ('aprobado', 'Aprobado'),
+        ('rechazado', 'Rechazado'),
+        ('cancelado', 'Cancelado'),
+    ]
+
+    reservacion = models.ForeignKey(Reservacion, on_delete=models.CASCADE, related_name='intentos_pago')
+    pasarela = models.CharField(max_length=20)
+    client_transaction_id = models.CharField(max_length=255, unique=True, help_text="Referencia propia enviada a la pasarela")
+    transaction_id = models.CharField(max_length=255, unique=True, blank=True, null=True, help_text="ID de la transacción en la pasarela")
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='iniciado')
+    monto = models.DecimalField(max_digits=10, decimal_places=2)
+    autorizacion = models.CharField(max_length=255, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Intentos de Pago"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['estado', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.client_transaction_id} - {self.get_estado_display()}"
+
+
+class ConfirmacionPago(models.Model):
+    """
+    Cola de confirmaciones de pago con PayPhone.
+    La vista de retorno y la notificación solo encolan; el comando
+    procesar_confirmaciones llama a la pasarela y actualiza la reservación.
+    """
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    ]
+
+    reservacion = models.ForeignKey(Reservacion, on_delete=models.CASCADE, related_name='confirmaciones')
+    transaction_id = models.CharField(max_length=255, help_text="ID de la transacción en PayPhone (sin verificar)")
+    client_transaction_id = models.CharField(max_length=255)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.IntegerField(default=0)
+    disponible_en = models.DateTimeField(default=timezone.now, help_text="Cuándo puede procesarse (reintentos)")
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Confirmaciones de Pago"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['estado', 'disponible_en']),
+        ]
+        constraints = [
+            # El ID viene del retorno o de la notificación: un valor repetido o
+            # ajeno no debe ocupar el trabajo de otro intento
+            models.UniqueConstraint(
+                fields=['client_transaction_id', 'transaction_id'],
+                name='confirmacion_unica_por_intento'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.transaction_id} - {self.get_estado_display()}"
+
+    def finalizada(self):
+        return self.estado in ('completada', 'fallida')
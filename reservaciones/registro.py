@@ -0,0 +1,128 @@
+"""
+Logging estructurado (JSON) sin bloquear el request.
+
+Los registros pasan por una cola acotada: el hilo del request solo los
+encola y un hilo aparte los formatea y escribe. Si la cola se llena se
+descartan en lugar de esperar. Cada registro lleva el ID de correlación
+del request (ver middleware.IdCorrelacionMiddleware) y los campos que se
+agreguen con contexto(), p. ej. la reservación que se está pagando.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import random
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+
+id_correlacion = contextvars.ContextVar('id_correlacion', default='-')
+_campos = contextvars.ContextVar('campos_registro', default={})
+
+# Atributos propios de LogRecord: todo lo demás son campos extra
+_ATRIBUTOS_RECORD = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+def iniciar_contexto(identificador):
+    """Fijar el ID de correlación (sin campos extra) para un request o trabajo"""
+    return id_correlacion.set(identificador), _campos.set({})
+
+
+def terminar_contexto(tokens):
+    """Restaurar el contexto anterior a iniciar_contexto()"""
+    id_correlacion.reset(tokens[0])
+    _campos.reset(tokens[1])
+
+
+@contextmanager
+def contexto(**campos):
+    """Agregar campos a todos los registros emitidos dentro del bloque"""
+    token = _campos.set({**_campos.get(), **campos})
+    try:
+        yield
+    finally:
+        _campos.reset(token)
+
+
+def vincular(**campos):
+    """Agregar campos a los registros del resto del request (o tarea actual)"""
+    _campos.set({**_campos.get(), **campos})
+
+
+class FiltroContexto(logging.Filter):
+    """Copiar el ID de correlación y los campos de contexto al registro"""
+
+    def filter(self, record):
+        record.id_correlacion = id_correlacion.get()
+        for clave, valor in _campos.get().items():
+            if not hasattr(record, clave):
+                setattr(record, clave, valor)
+        return True
+
+
+class FiltroMuestreo(logging.Filter):
+    """
+    Dejar pasar solo una fracción (tasa, de 0 a 1) de los registros DEBUG.
+    Los niveles INFO y superiores nunca se descartan.
+    """
+
+    def __init__(self, tasa=1.0):
+        super().__init__()
+        self.tasa = float(tasa)
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.tasa
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro"""
+
+    def format(self, record):
+        datos = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_RECORD and not clave.startswith('_'):
+                datos[clave] = valor
+        if record.exc_info:
+            datos['excepcion'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            datos['excepcion'] = record.exc_text
+        return json.dumps(datos, default=str, ensure_ascii=False)
+
+
+class ManejadorCola(QueueHandler):
+    """
+    Encola los registros y los escribe en stderr desde un hilo aparte.
+    Con la cola llena (tamano) el registro se descarta y se cuenta.
+    """
+
+    def __init__(self, tamano=10000):
+        super().__init__(queue.Queue(tamano))
+        self.descartados = 0
+        destino = logging.StreamHandler()
+        destino.setFormatter(FormatoJSON())
+        self.listener = QueueListener(self.queue, destino)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def prepare(self, record):
+        # El formateo se hace en el hilo del listener; aquí solo se fija el
+        # mensaje para que los argumentos no cambien mientras espera en la cola
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
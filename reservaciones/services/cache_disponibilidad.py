@@ -0,0 +1,106 @@
+import math
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from ..versiones import leer_versiones, nueva_version
+from .disponibilidad import calcular_horarios_disponibles, proximo_vencimiento
+
+
+# Versión global: se cambia al reconstruir toda la ocupación
+CLAVE_VERSION_GLOBAL = 'disp:v'
+
+_estadisticas = {'aciertos': 0, 'fallos': 0}
+_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'DISPONIBILIDAD_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'DISPONIBILIDAD_CACHE_TIMEOUT', 300)
+
+
+def _clave_servicio(servicio_id):
+    return f'disp:v:s:{servicio_id}'
+
+
+def _clave_fecha(servicio_id, fecha):
+    return f'disp:v:f:{servicio_id}:{fecha}'
+
+
+def _versiones(servicio_id, fecha):
+    """Leer (o inicializar) las versiones de las que depende un día"""
+    return leer_versiones(
+        _cache(),
+        [CLAVE_VERSION_GLOBAL, _clave_servicio(servicio_id), _clave_fecha(servicio_id, fecha)]
+    )
+
+
+def _contar(tipo):
+    with _lock:
+        _estadisticas[tipo] += 1
+
+
+def estadisticas():
+    """Aciertos y fallos de la caché de disponibilidad en este proceso"""
+    with _lock:
+        datos = dict(_estadisticas)
+    total = datos['aciertos'] + datos['fallos']
+    datos['tasa_aciertos'] = round(datos['aciertos'] / total, 4) if total else 0
+    return datos
+
+
+def horarios_disponibles(servicio, fecha, personas=1):
+    """
+    Horarios libres de un servicio para una fecha, desde la caché si la
+    versión del día no ha cambiado.
+    """
+    cache = _cache()
+    clave = f'disp:{servicio.id}:{fecha}:{personas}:{_versiones(servicio.id, fecha)}'
+    horarios = cache.get(clave)
+    if horarios is not None:
+        _contar('aciertos')
+        return horarios
+
+    _contar('fallos')
+    horarios = calcular_horarios_disponibles(servicio, fecha, personas)
+    cache.set(clave, horarios, _vigencia(servicio, fecha))
+    return horarios
+
+
+def _vigencia(servicio, fecha):
+    # Cuando vence una retención el día cambia sin que nadie escriba:
+    # la entrada no debe durar más que la próxima retención pendiente
+    timeout = _timeout()
+    vence = proximo_vencimiento(servicio=servicio, fecha=fecha)
+    if vence is not None:
+        timeout = min(timeout, max(math.ceil((vence - timezone.now()).total_seconds()), 1))
+    return timeout
+
+
+def _al_confirmar(funcion):
+    # Invalidar después del commit: así nadie guarda en caché, con la versión
+    # nueva, datos leídos antes de que el cambio sea visible.
+    transaction.on_commit(funcion)
+
+
+def invalidar_fechas(pares):
+    """Invalidar los días (servicio_id, fecha) indicados"""
+    claves = {_clave_fecha(servicio_id, fecha) for servicio_id, fecha in pares}
+    if claves:
+        _al_confirmar(lambda: _cache().set_many(dict.fromkeys(claves, nueva_version()), None))
+
+
+def invalidar_servicio(servicio_id):
+    """Invalidar todos los días de un servicio (horarios o duración cambiaron)"""
+    _al_confirmar(lambda: _cache().set(_clave_servicio(servicio_id), nueva_version(), None))
+
+
+def invalidar_todo():
+    """Invalidar toda la disponibilidad en caché"""
+    _al_confirmar(lambda: _cache().set(CLAVE_VERSION_GLOBAL, nueva_version(), None))
@@ -0,0 +1,136 @@
+"""
+Búsqueda, filtros y paginación del catálogo de servicios en el servidor.
+
+El texto se busca con el índice de texto completo de Postgres sobre nombre
+y descripción (en español, con raíces: "masajes" encuentra "masaje") y con
+el índice de trigramas sobre el nombre, que tolera palabras incompletas o
+mal escritas mientras el usuario tipea. Solo viaja al navegador la página
+pedida.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, Q
+from django.http import QueryDict
+
+from ..models import Servicio, VECTOR_BUSQUEDA
+
+
+SERVICIOS_POR_PAGINA = 12
+
+# Página más alta que se atiende: un número enorme daría un OFFSET fuera
+# de rango en la base de datos (error 500) en lugar de una página vacía
+MAX_PAGINAS = 1000
+
+# Opciones del filtro "duración máxima" (minutos)
+DURACIONES = (30, 60, 90, 120)
+
+# Orden: campos de order_by (el id desempata para que las páginas no se solapen)
+ORDENES = {
+    'nombre': ['nombre', 'id'],
+    'precio-asc': ['precio', 'id'],
+    'precio-desc': ['-precio', '-id'],
+}
+
+
+def _decimal(valor):
+    try:
+        numero = Decimal(valor)
+    except (TypeError, ValueError, InvalidOperation):
+        return None
+    return numero if numero.is_finite() and numero >= 0 else None
+
+
+def _entero(valor):
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError):
+        return None
+    return numero if numero > 0 else None
+
+
+def leer_filtros(datos):
+    """
+    Filtros del catálogo a partir de request.GET. Los valores vacíos o
+    inválidos se ignoran en lugar de dar error.
+    """
+    orden = datos.get('orden', '')
+    return {
+        'q': datos.get('q', '').strip()[:100],
+        'precio_min': _decimal(datos.get('precio_min')),
+        'precio_max': _decimal(datos.get('precio_max')),
+        'duracion_max': _entero(datos.get('duracion_max')),
+        'orden': orden if orden in ORDENES else '',
+    }
+
+
+def leer_pagina(datos):
+    """Número de página de request.GET (1 si falta o no es válido, MAX_PAGINAS como tope)"""
+    return min(_entero(datos.get('pagina')) or 1, MAX_PAGINAS)
+
+
+def parametros_catalogo(filtros, pagina=1):
+    """
+    Filtros y página normalizados como QueryDict, sin los vacíos. Sirven
+    para los enlaces de la página y para la clave de la caché de páginas:
+    parámetros ajenos, inválidos o escritos de otra forma (10 y 10.00)
+    dan la misma página y la misma entrada de caché.
+    """
+    parametros = QueryDict(mutable=True)
+    for nombre, valor in filtros.items():
+        if valor is None or valor == '':
+            continue
+        if isinstance(valor, Decimal):
+            valor = format(valor.normalize(), 'f')
+        parametros[nombre] = str(valor)
+    if pagina > 1:
+        parametros['pagina'] = str(pagina)
+    return parametros
+
+
+def clave_catalogo(datos):
+    """Parte de la clave de caché de una página del catálogo (request.GET)"""
+    return parametros_catalogo(leer_filtros(datos), leer_pagina(datos)).urlencode()
+
+
+def buscar_servicios(q='', precio_min=None, precio_max=None, duracion_max=None, orden=''):
+    """
+    Servicios activos que coinciden con el texto y los filtros.
+    Con texto y sin orden explícito, los más relevantes primero.
+    """
+    servicios = Servicio.objects.filter(activo=True)
+
+    if precio_min is not None:
+        servicios = servicios.filter(precio__gte=precio_min)
+    if precio_max is not None:
+        servicios = servicios.filter(precio__lte=precio_max)
+    if duracion_max is not None:
+        servicios = servicios.filter(duracion_minutos__lte=duracion_max)
+
+    if q:
+        consulta = SearchQuery(q, config='spanish', search_type='websearch')
+        # VECTOR_BUSQUEDA y nombre %> q son exactamente las expresiones indexadas
+        servicios = servicios.alias(documento=VECTOR_BUSQUEDA).annotate(
+            rango=SearchRank(VECTOR_BUSQUEDA, consulta),
+            similitud=TrigramWordSimilarity(q, 'nombre'),
+        ).filter(
+            Q(documento=consulta) | Q(nombre__trigram_word_similar=q)
+        )
+        if not orden:
+            return servicios.order_by((F('rango') + F('similitud')).desc(), 'nombre', 'id')
+
+    return servicios.order_by(*ORDENES[orden or 'nombre'])
+
+
+def pagina_servicios(filtros, pagina=1, tamano=SERVICIOS_POR_PAGINA):
+    """
+    Una página del catálogo filtrado.
+    Devuelve (servicios, número de la siguiente página o None); no cuenta
+    el total, se pide una fila de más para saber si hay otra página.
+    """
+    inicio = (pagina - 1) * tamano
+    filas = list(buscar_servicios(**filtros)[inicio:inicio + tamano + 1])
+    # En la última página atendida no se ofrece otra: leer_pagina la recortaría
+    if len(filas) > tamano and pagina < MAX_PAGINAS:
+        return filas[:tamano], pagina + 1
+    return filas[:tamano], None
@@ -0,0 +1,149 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import ConfirmacionPago
+from ..registro import iniciar_contexto, terminar_contexto, vincular
+from .pasarelas import obtener_pasarela
+from .notificaciones import MontoDistinto, registrar_resultado_pago
+
+
+logger = logging.getLogger(__name__)
+
+
+def encolar_confirmacion(reservacion_id, transaction_id, client_transaction_id):
+    """
+    Registrar una confirmación pendiente (para la notificación de PayPhone).
+    Si PayPhone repite la notificación o también llega el retorno, se
+    reutiliza el mismo trabajo.
+    """
+    confirmacion, _ = ConfirmacionPago.objects.get_or_create(
+        transaction_id=transaction_id,
+        client_transaction_id=client_transaction_id,
+        defaults={'reservacion_id': reservacion_id}
+    )
+    return confirmacion
+
+
+async def aencolar_confirmacion(reservacion, transaction_id, client_transaction_id):
+    """
+    Registrar una confirmación pendiente (async, para la vista de retorno).
+    Si PayPhone (o el usuario al recargar) repite el retorno, se reutiliza
+    el mismo trabajo.
+    """
+    confirmacion, _ = await ConfirmacionPago.objects.aget_or_create(
+        transaction_id=transaction_id,
+        client_transaction_id=client_transaction_id,
+        defaults={'reservacion': reservacion}
+    )
+    return confirmacion
+
+
+def aplicar_confirmacion(confirmacion, client_transaction_id):
+    """
+    Actualizar la reservación con la respuesta de PayPhone.
+    Devuelve True si el resultado es definitivo (aprobado o rechazado).
+    Lanza MontoDistinto si PayPhone aprobó otro monto.
+    """
+    if not confirmacion['success']:
+        return False
+    # Se guarda el ID que devolvió Confirm, no el que trajo el retorno
+    registrado = registrar_resultado_pago(
+        client_transaction_id,
+        confirmacion['transaction_id'],
+        confirmacion['aprobado'],
+        authorization_code=confirmacion.get('autorizacion'),
+        monto=confirmacion.get('monto')
+    )
+    if not registrado:
+        # El webhook, otro trabajo o la conciliación ya lo registraron
+        logger.info('El intento ya tenía resultado', extra={'client_transaction_id': client_transaction_id})
+    return True
+
+
+def reclamar_trabajos(limite, vencimiento_minutos=10):
+    """
+    Tomar hasta `limite` confirmaciones listas para procesar y marcarlas
+    como 'procesando'. SKIP LOCKED permite varios workers a la vez; los
+    trabajos 'procesando' muy antiguos (worker caído) se vuelven a tomar.
+    """
+    ahora = timezone.now()
+    vencidos = ahora - timedelta(minutes=vencimiento_minutos)
+    with transaction.atomic():
+        ids = list(
+            ConfirmacionPago.objects.select_for_update(skip_locked=True)
+            .filter(disponible_en__lte=ahora)
+            .filter(Q(estado='pendiente') | Q(estado='procesando', updated_at__lt=vencidos))
+            .order_by('disponible_en')
+            .values_list('id', flat=True)[:limite]
+        )
+        ConfirmacionPago.objects.filter(id__in=ids).update(
+            estado='procesando',
+            updated_at=ahora
+        )
+    return list(ConfirmacionPago.objects.filter(id__in=ids))
+
+
+def procesar_trabajo(trabajo):
+    """Confirmar un pago con PayPhone y aplicar el resultado"""
+    # Los registros del trabajo quedan ligados a la reservación
+    tokens = iniciar_contexto(f'confirmacion-{trabajo.id}')
+    vincular(reservacion=trabajo.reservacion_id)
+    try:
+        return _procesar_trabajo(trabajo)
+    finally:
+        terminar_contexto(tokens)
+
+
+def _procesar_trabajo(trabajo):
+    trabajo.intentos += 1
+    definitivo = False
+    reintentar = True
+    try:
+        pasarela = obtener_pasarela('payphone')
+        resultado = pasarela.confirmar_pago(trabajo.transaction_id, trabajo.client_transaction_id)
+        definitivo = aplicar_confirmacion(resultado, trabajo.client_transaction_id)
+        error = '' if definitivo else str(resultado.get('error', ''))
+    except MontoDistinto as e:
+        # No se reintenta: el intento y la reservación quedan abiertos para revisarlos
+        logger.warning('Monto distinto al confirmar', extra={'confirmacion': trabajo.id, 'error': str(e)})
+        reintentar = False
+        error = str(e)
+    except Exception as e:
+        # Un error inesperado (p. ej. de la base de datos) no detiene al worker:
+        # el trabajo se reintenta como una falla de la pasarela
+        logger.exception('Falla al procesar la confirmación', extra={'confirmacion': trabajo.id})
+        error = str(e)
+
+    if definitivo:
+        trabajo.estado = 'completada'
+    elif not reintentar or trabajo.intentos >= settings.CONFIRMACIONES_MAX_INTENTOS:
+        trabajo.estado = 'fallida'
+    else:
+        # Reintento con espera creciente (5s, 10s, 20s...)
+        trabajo.estado = 'pendiente'
+        trabajo.disponible_en = timezone.now() + timedelta(seconds=5 * 2 ** (trabajo.intentos - 1))
+    trabajo.error = error
+    trabajo.save(update_fields=['estado', 'intentos', 'error', 'disponible_en', 'updated_at'])
+    logger.info('Confirmación procesada', extra={
+        'transaction_id': trabajo.transaction_id,
+        'estado': trabajo.estado,
+        'intentos': trabajo.intentos,
+    })
+    return trabajo
+
+
+def estado_pago(reservacion):
+    """Resumen del estado de pago para la página de 'procesando'"""
+    trabajo = reservacion.confirmaciones.order_by('-created_at').first()
+    procesando = trabajo is not None and not trabajo.finalizada()
+    return {
+        'estado': reservacion.estado,
+        'estado_pago': reservacion.estado_pago,
+        'procesando': procesando,
+        'error': trabajo.error if trabajo and trabajo.estado == 'fallida' else '',
+    }
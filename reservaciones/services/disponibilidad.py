@@ -0,0 +1,265 @@
+from array import array
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from ..models import HorarioDisponible, OcupacionSlot, Reservacion
+from .ocupacion import (
+    ESTADOS_PAGO_VENCIBLES, MINUTOS_DIA, SLOTS_DIA,
+    a_minutos, filtro_vencidas, slots_de, slots_ocupados,
+)
+
+
+# Máximo de días que se pueden consultar en un rango
+MAX_DIAS_RANGO = 62
+
+
+def a_hora(minutos):
+    """Convertir minutos desde medianoche a 'HH:MM'"""
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+class OcupacionDia:
+    """
+    Ocupación de un servicio en un día: número de personas reservadas
+    en cada bloque de tiempo, leída de la tabla OcupacionSlot.
+
+    Para consultar el máximo de un intervalo en O(1) se arma una tabla
+    dispersa (sparse table): el nivel k guarda el máximo de cada ventana
+    de 2**k bloques y se construye comparando dos copias desplazadas del
+    nivel anterior, elemento a elemento.
+    """
+
+    def __init__(self, filas=()):
+        self.personas = array('i', bytes(4 * SLOTS_DIA))
+        self.vacia = True
+        for slot, personas in filas:
+            self.personas[slot] = personas
+            self.vacia = False
+        self._niveles = None
+
+    def _tabla(self):
+        if self._niveles is None:
+            niveles = [self.personas]
+            ancho = 1
+            while 2 * ancho <= SLOTS_DIA:
+                anterior = niveles[-1]
+                niveles.append(array('i', map(max, anterior[:-ancho], anterior[ancho:])))
+                ancho *= 2
+            self._niveles = niveles
+        return self._niveles
+
+    def maximo(self, inicio, fin):
+        """Máximo de personas reservadas en el intervalo [inicio, fin) en minutos"""
+        slots = slots_de(max(inicio, 0), min(fin, MINUTOS_DIA))
+        if not slots or self.vacia:
+            return 0
+        nivel = (len(slots).bit_length() - 1)
+        tabla = self._tabla()[nivel]
+        return max(tabla[slots.start], tabla[slots.stop - (1 << nivel)])
+
+    def cupos(self, inicio, fin, capacidad):
+        """Lugares libres en todo el intervalo [inicio, fin)"""
+        return max(capacidad - self.maximo(inicio, fin), 0)
+
+    def liberar(self, hora_inicio, hora_fin, buffer_minutos, personas):
+        """Descontar una reservación que sigue en la tabla pero ya no ocupa (retención vencida)"""
+        for slot in slots_ocupados(hora_inicio, hora_fin, buffer_minutos):
+            self.personas[slot] = max(self.personas[slot] - personas, 0)
+        self._niveles = None
+
+
+def vencidas(ahora=None, **filtros):
+    """
+    Retenciones vencidas que el barrido (expirar_reservas) aún no cancela:
+    filas (servicio_id, fecha, hora_inicio, hora_fin, buffer_minutos, personas).
+    Usa el índice parcial de pendientes, así que normalmente es casi gratis.
+    """
+    return Reservacion.objects.filter(filtro_vencidas(ahora), **filtros).values_list(
+        'servicio_id', 'fecha', 'hora_inicio', 'hora_fin', 'buffer_minutos', 'numero_personas'
+    ).order_by()
+
+
+def proximo_vencimiento(**filtros):
+    """Momento en que vence la próxima retención pendiente (o None)"""
+    return Reservacion.objects.filter(
+        estado='pendiente',
+        estado_pago__in=ESTADOS_PAGO_VENCIBLES,
+        expira_en__gte=timezone.now(),
+        **filtros
+    ).aggregate(proximo=Min('expira_en'))['proximo']
+
+
+def ocupacion_del_dia(servicio, fecha):
+    """
+    Leer la ocupación de un servicio para una fecha, sin contar las
+    retenciones vencidas (dos consultas)
+    """
+    ocupacion = OcupacionDia(OcupacionSlot.objects.filter(
+        servicio=servicio,
+        fecha=fecha,
+        personas__gt=0
+    ).values_list('slot', 'personas'))
+    if not ocupacion.vacia:
+        for _, _, *vencida in vencidas(servicio=servicio, fecha=fecha):
+            ocupacion.liberar(*vencida)
+    return ocupacion
+
+
+def generar_slots(horarios, duracion, intervalo):
+    """
+    Generar los inicios de slot (minutos) para las ventanas de horario.
+    Cada ventana es (hora_inicio, hora_fin, intervalo propio o None);
+    un slot es válido si termina dentro de su ventana.
+    """
+    inicios = []
+    for hora_inicio, hora_fin, intervalo_horario in horarios:
+        ultimo = a_minutos(hora_fin) - duracion
+        inicios.extend(range(a_minutos(hora_inicio), ultimo + 1, intervalo_horario or intervalo))
+    return inicios
+
+
+def slots_libres(horarios, ocupacion, servicio, personas=1):
+    """
+    Filtrar los slots de las ventanas de horario con cupo suficiente
+    para el número de personas indicado. El intervalo revisado incluye
+    el margen (buffer) posterior al servicio; las reservaciones existentes
+    ya ocupan el suyo en la tabla, así que quedan separadas por él.
+    """
+    duracion = servicio.duracion_minutos
+    buffer = servicio.buffer_minutos
+    capacidad = servicio.capacidad_maxima
+    inicios = generar_slots(horarios, duracion, servicio.intervalo_minutos)
+
+    if ocupacion.vacia:
+        cupos = [capacidad] * len(inicios)
+    else:
+        cupos = [
+            ocupacion.cupos(inicio, inicio + duracion + buffer, capacidad)
+            for inicio in inicios
+        ]
+
+    return [
+        {'hora': a_hora(inicio), 'disponible': True, 'cupos': libres}
+        for inicio, libres in zip(inicios, cupos)
+        if libres >= personas
+    ]
+
+
+def calcular_horarios_disponibles(servicio, fecha, personas=1):
+    """
+    Calcular los horarios libres de un servicio para una fecha.
+    Usa tres consultas (ventanas de horario, ocupación precalculada y
+    retenciones vencidas) y resuelve los cupos en memoria.
+    """
+    horarios = HorarioDisponible.objects.filter(
+        servicio=servicio,
+        dia_semana=fecha.weekday(),
+        activo=True
+    ).values_list('hora_inicio', 'hora_fin', 'intervalo_minutos')
+
+    return slots_libres(horarios, ocupacion_del_dia(servicio, fecha), servicio, personas)
+
+
+def calcular_disponibilidad_rango(servicio, desde, hasta, personas=1):
+    """
+    Calcular los horarios libres de un servicio para cada día entre
+    desde y hasta (inclusive). Siempre usa tres consultas, sin importar
+    cuántos días abarque el rango.
+    """
+    horarios_por_dia = defaultdict(list)
+    for dia_semana, hora_inicio, hora_fin, intervalo in HorarioDisponible.objects.filter(
+        servicio=servicio,
+        activo=True
+    ).values_list('dia_semana', 'hora_inicio', 'hora_fin', 'intervalo_minutos'):
+        horarios_por_dia[dia_semana].append((hora_inicio, hora_fin, intervalo))
+
+    ocupacion_por_fecha = defaultdict(list)
+    for fecha, slot, personas in OcupacionSlot.objects.filter(
+        servicio=servicio,
+        fecha__range=(desde, hasta),
+        personas__gt=0
+    ).values_list('fecha', 'slot', 'personas'):
+        ocupacion_por_fecha[fecha].append((slot, personas))
+
+    vencidas_por_fecha = defaultdict(list)
+    if ocupacion_por_fecha:
+        for _, fecha, *vencida in vencidas(servicio=servicio, fecha__range=(desde, hasta)):
+            vencidas_por_fecha[fecha].append(vencida)
+
+    disponibilidad = {}
+    fecha = desde
+    while fecha <= hasta:
+        horarios = horarios_por_dia[fecha.weekday()]
+        if horarios:
+            ocupacion = OcupacionDia(ocupacion_por_fecha[fecha])
+            for vencida in vencidas_por_fecha[fecha]:
+                ocupacion.liberar(*vencida)
+            disponibilidad[fecha] = slots_libres(horarios, ocupacion, servicio, personas)
+        else:
+            disponibilidad[fecha] = []
+        fecha += timedelta(days=1)
+    return disponibilidad
+
+
+def calcular_disponibilidad_servicios(servicios, fecha, personas=1):
+    """
+    Calcular los horarios libres de varios servicios para una misma fecha.
+    Usa tres consultas (ventanas, ocupación y retenciones vencidas de
+    todos los servicios), sin importar cuántos servicios se pidan.
+    """
+    servicios = list(servicios)
+    ids = [servicio.id for servicio in servicios]
+
+    horarios_por_servicio = defaultdict(list)
+    for servicio_id, hora_inicio, hora_fin, intervalo in HorarioDisponible.objects.filter(
+        servicio_id__in=ids,
+        dia_semana=fecha.weekday(),
+        activo=True
+    ).values_list('servicio_id', 'hora_inicio', 'hora_fin', 'intervalo_minutos'):
+        horarios_por_servicio[servicio_id].append((hora_inicio, hora_fin, intervalo))
+
+    ocupacion_por_servicio = defaultdict(list)
+    for servicio_id, slot, ocupadas in OcupacionSlot.objects.filter(
+        servicio_id__in=[i for i in ids if i in horarios_por_servicio],
+        fecha=fecha,
+        personas__gt=0
+    ).values_list('servicio_id', 'slot', 'personas'):
+        ocupacion_por_servicio[servicio_id].append((slot, ocupadas))
+
+    vencidas_por_servicio = defaultdict(list)
+    if ocupacion_por_servicio:
+        for servicio_id, _, *vencida in vencidas(
+            servicio_id__in=list(ocupacion_por_servicio), fecha=fecha
+        ):
+            vencidas_por_servicio[servicio_id].append(vencida)
+
+    disponibilidad = {}
+    for servicio in servicios:
+        horarios = horarios_por_servicio[servicio.id]
+        if horarios:
+            ocupacion = OcupacionDia(ocupacion_por_servicio[servicio.id])
+            for vencida in vencidas_por_servicio[servicio.id]:
+                ocupacion.liberar(*vencida)
+            disponibilidad[servicio.id] = slots_libres(horarios, ocupacion, servicio, personas)
+        else:
+            disponibilidad[servicio.id] = []
+    return disponibilidad
+
+
+def hay_cupo(servicio, fecha, hora_inicio, hora_fin, personas):
+    """
+    Verificar si un intervalo (más el buffer del servicio) tiene cupo para
+    el número de personas. Consulta solo los bloques que ocuparía en la
+    tabla de ocupación; las retenciones vencidas todavía cuentan aquí
+    (reservar() las cancela antes de rechazar por falta de cupo).
+    """
+    slots = slots_ocupados(hora_inicio, hora_fin, servicio.buffer_minutos)
+    ocupadas = OcupacionSlot.objects.filter(
+        servicio=servicio,
+        fecha=fecha,
+        slot__range=(slots.start, slots.stop - 1)
+    ).aggregate(maximo=Max('personas'))['maximo'] or 0
+    return servicio.capacidad_maxima - ocupadas >= personas
@@ -0,0 +1,100 @@
+"""
+Historial de reservaciones de un usuario, paginado por cursor (keyset).
+
+En lugar de OFFSET, cada página continúa después de la última fila vista
+según (fecha, hora_inicio, id): el costo de una página no depende de
+cuántas reservaciones tenga el usuario.
+"""
+from datetime import date, datetime, timedelta
+
+from django.db.models import BooleanField, Case, Q, Value, When
+from django.utils import timezone
+
+from ..models import Reservacion
+
+
+RESERVACIONES_POR_PAGINA = 20
+
+# Filtros de tiempo: próximas se listan de la más cercana a la más lejana
+CUANDO = ('proximas', 'pasadas')
+
+ESTADOS = [estado for estado, _ in Reservacion.ESTADOS]
+
+# Horas mínimas de anticipación para cancelar (ver Reservacion.puede_cancelar)
+HORAS_CANCELACION = 24
+
+
+def _despues_de(fecha, hora_inicio, reservacion_id, descendente=False):
+    """Filas estrictamente después de (fecha, hora_inicio, id) en el orden dado"""
+    mayor = 'lt' if descendente else 'gt'
+    return (
+        Q(**{f'fecha__{mayor}': fecha})
+        | Q(fecha=fecha, **{f'hora_inicio__{mayor}': hora_inicio})
+        | Q(fecha=fecha, hora_inicio=hora_inicio, **{f'id__{mayor}': reservacion_id})
+    )
+
+
+def filtro_cancelable(ahora=None):
+    """Reservaciones que aún pueden cancelarse: faltan más de 24h para su inicio"""
+    limite = timezone.localtime(ahora) + timedelta(hours=HORAS_CANCELACION)
+    return Q(fecha__gt=limite.date()) | Q(fecha=limite.date(), hora_inicio__gt=limite.time())
+
+
+def codificar_cursor(reservacion):
+    return f"{reservacion.fecha.isoformat()}.{reservacion.hora_inicio.strftime('%H%M%S')}.{reservacion.id}"
+
+
+def leer_cursor(valor):
+    """(fecha, hora_inicio, id) del cursor, o None si no es válido"""
+    try:
+        fecha, hora, reservacion_id = valor.split('.')
+        return (
+            date.fromisoformat(fecha),
+            datetime.strptime(hora, '%H%M%S').time(),
+            int(reservacion_id),
+        )
+    except (AttributeError, ValueError):
+        return None
+
+
+def pagina_reservaciones(usuario, cuando=None, estado=None, cursor=None, tamano=RESERVACIONES_POR_PAGINA):
+    """
+    Una página del historial del usuario.
+    Devuelve (reservaciones, cursor de la siguiente página o None).
+    Cada reservación trae `cancelable`, calculado en la consulta.
+    """
+    ahora = timezone.localtime()
+    reservaciones = Reservacion.objects.filter(usuario=usuario)
+
+    if estado in ESTADOS:
+        reservaciones = reservaciones.filter(estado=estado)
+
+    inicio = Q(fecha__gt=ahora.date()) | Q(fecha=ahora.date(), hora_inicio__gte=ahora.time())
+    if cuando == 'proximas':
+        reservaciones = reservaciones.filter(inicio)
+    elif cuando == 'pasadas':
+        reservaciones = reservaciones.exclude(inicio)
+
+    # Las próximas, de la más cercana en adelante; el resto, de la más reciente hacia atrás
+    descendente = cuando != 'proximas'
+    posicion = leer_cursor(cursor) if cursor else None
+    if posicion:
+        reservaciones = reservaciones.filter(_despues_de(*posicion, descendente=descendente))
+
+    orden = ['fecha', 'hora_inicio', 'id']
+    if descendente:
+        orden = [f'-{campo}' for campo in orden]
+
+    filas = list(
+        reservaciones.select_related('servicio').annotate(
+            cancelable=Case(
+                When(filtro_cancelable(ahora), then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField()
+            )
+        ).order_by(*orden)[:tamano + 1]
+    )
+    # Se pide una fila de más para saber si hay otra página
+    if len(filas) > tamano:
+        return filas[:tamano], codificar_cursor(filas[tamano - 1])
+    return filas, None
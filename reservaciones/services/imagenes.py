@@ -0,0 +1,126 @@
+"""
+Variantes de Servicio.imagen para cada uso en las plantillas.
+
+Al subir una imagen se generan, junto al original, versiones recortadas
+al tamaño de cada presentación (miniatura, tarjeta, detalle) en dos
+anchos (1x y 2x) y en AVIF/WebP cuando Pillow los soporta, más un JPEG
+de respaldo. Los nombres quedan en Servicio.imagen_variantes para que
+las plantillas armen el srcset sin tocar el disco.
+"""
+import io
+import logging
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from ..cache_paginas import purgar_servicio
+from ..models import Servicio
+
+
+logger = logging.getLogger(__name__)
+
+# Presentación: (ancho, alto) en 2x. Se recorta al centro, como object-cover
+PRESENTACIONES = {
+    'miniatura': (160, 160),
+    'tarjeta': (800, 384),
+    'detalle': (1200, 768),
+}
+
+# Formato: (extensión, opciones de Pillow), del más liviano al de respaldo
+FORMATOS = {
+    'avif': ('avif', {'quality': 55}),
+    'webp': ('webp', {'quality': 80, 'method': 6}),
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def formatos_disponibles():
+    """Formatos que esta instalación de Pillow puede escribir"""
+    return [
+        formato for formato in FORMATOS
+        if formato == 'jpeg' or features.check(formato)
+    ]
+
+
+def _nombre(original, presentacion, ancho, extension):
+    # Junto al original: servicios/spa.jpg -> servicios/spa.tarjeta-800.webp
+    base, _ = posixpath.splitext(original)
+    return f'{base}.{presentacion}-{ancho}.{extension}'
+
+
+def _codificar(imagen, formato):
+    _, opciones = FORMATOS[formato]
+    salida = io.BytesIO()
+    imagen.save(salida, format=formato.upper(), **opciones)
+    return salida.getvalue()
+
+
+def _anchos(ancho, ancho_original):
+    """1x y 2x del ancho pedido, sin agrandar la imagen original"""
+    return sorted({min(ancho // 2, ancho_original), min(ancho, ancho_original)})
+
+
+def generar_variantes(servicio):
+    """
+    Generar todas las variantes de la imagen del servicio.
+    Devuelve el diccionario para Servicio.imagen_variantes (vacío si no hay imagen).
+    """
+    if not servicio.imagen:
+        return {}
+
+    storage = servicio.imagen.storage
+    with servicio.imagen.open('rb') as archivo:
+        original = Image.open(archivo)
+        original = ImageOps.exif_transpose(original).convert('RGB')
+
+    formatos = formatos_disponibles()
+    variantes = {'original': servicio.imagen.name}
+    for presentacion, (ancho, alto) in PRESENTACIONES.items():
+        archivos = {formato: {} for formato in formatos}
+        for ancho_variante in _anchos(ancho, original.width):
+            alto_variante = round(ancho_variante * alto / ancho)
+            recorte = ImageOps.fit(original, (ancho_variante, alto_variante), Image.Resampling.LANCZOS)
+            for formato in formatos:
+                nombre = _nombre(servicio.imagen.name, presentacion, ancho_variante, FORMATOS[formato][0])
+                if storage.exists(nombre):
+                    storage.delete(nombre)
+                archivos[formato][str(ancho_variante)] = storage.save(nombre, ContentFile(_codificar(recorte, formato)))
+        variantes[presentacion] = {'ancho': ancho // 2, 'alto': alto // 2, 'archivos': archivos}
+    return variantes
+
+
+def borrar_variantes(storage, variantes):
+    """Borrar del almacenamiento los archivos de unas variantes anteriores"""
+    for presentacion in PRESENTACIONES:
+        for por_ancho in variantes.get(presentacion, {}).get('archivos', {}).values():
+            for nombre in por_ancho.values():
+                storage.delete(nombre)
+
+
+def actualizar_variantes(servicio, forzar=False):
+    """
+    Regenerar las variantes si la imagen cambió (o si se fuerza) y
+    guardarlas con un UPDATE, sin volver a disparar las señales del modelo.
+    Devuelve True si se generaron.
+    """
+    anteriores = servicio.imagen_variantes or {}
+    actual = servicio.imagen.name if servicio.imagen else None
+    if not forzar and anteriores.get('original') == actual:
+        return False
+
+    try:
+        variantes = generar_variantes(servicio)
+    except (OSError, ValueError):
+        # Archivo faltante o que Pillow no puede leer: se sigue usando el original
+        logger.warning('No se pudieron generar las variantes', extra={'servicio': servicio.id}, exc_info=True)
+        return False
+
+    if anteriores and anteriores.get('original') != actual:
+        borrar_variantes(servicio.imagen.storage, anteriores)
+    # updated_at mueve los ETag; las páginas en caché se purgan aparte
+    Servicio.objects.filter(pk=servicio.pk).update(imagen_variantes=variantes, updated_at=timezone.now())
+    purgar_servicio(servicio.pk)
+    servicio.imagen_variantes = variantes
+    return True
@@ -0,0 +1,137 @@
+import hashlib
+import hmac
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Value, When
+from django.utils import timezone
+
+from ..models import Reservacion, ConfirmacionPago, IntentoPago
+
+
+# Códigos de estado de PayPhone
+ESTADO_APROBADO = 3
+ESTADO_CANCELADO = 2
+
+# Estados de pago que todavía pueden cambiar con una notificación
+ESTADOS_PAGO_ABIERTOS = ['pendiente', 'procesando']
+
+# Valor de Reservacion.metodo_pago según la pasarela del intento
+METODOS_PAGO = {'payphone': 'PayPhone', 'stripe': 'Stripe'}
+
+
+class NotificacionInvalida(Exception):
+    """La notificación no se pudo verificar o le faltan datos"""
+
+
+class MontoDistinto(Exception):
+    """La pasarela aprobó un monto distinto al del intento de pago"""
+
+
+def firmar(cuerpo, secreto):
+    """Firma HMAC-SHA256 (hex) del cuerpo crudo de la notificación"""
+    return hmac.new(secreto.encode(), cuerpo, hashlib.sha256).hexdigest()
+
+
+def verificar_firma(cuerpo, firma):
+    """
+    Verificar la firma de la notificación con el secreto compartido.
+    Sin PAYPHONE_WEBHOOK_SECRET configurado se rechazan todas.
+    """
+    secreto = settings.PAYPHONE_WEBHOOK_SECRET
+    if not secreto:
+        raise NotificacionInvalida('Notificaciones deshabilitadas: falta PAYPHONE_WEBHOOK_SECRET')
+    if not firma or not hmac.compare_digest(firmar(cuerpo, secreto), firma):
+        raise NotificacionInvalida('Firma inválida')
+
+
+def leer_notificacion(datos):
+    """
+    Validar y normalizar el JSON de la notificación de PayPhone.
+    Sus valores solo identifican el pago: el resultado se toma de Confirm.
+    """
+    if not isinstance(datos, dict):
+        raise NotificacionInvalida('Formato inválido')
+
+    store_id = datos.get('StoreId')
+    if store_id is not None and str(store_id) != str(settings.PAYPHONE_STORE_ID):
+        raise NotificacionInvalida('La notificación es de otra tienda')
+
+    transaction_id = datos.get('TransactionId')
+    client_transaction_id = datos.get('ClientTransactionId')
+    if not transaction_id or not client_transaction_id:
+        raise NotificacionInvalida('Faltan TransactionId o ClientTransactionId')
+
+    try:
+        status_code = int(datos.get('StatusCode'))
+        monto = Decimal(int(datos.get('Amount', 0))) / 100
+    except (TypeError, ValueError, InvalidOperation):
+        raise NotificacionInvalida('StatusCode o Amount inválido')
+
+    return {
+        'transaction_id': str(transaction_id),
+        'client_transaction_id': str(client_transaction_id),
+        'aprobado': status_code == ESTADO_APROBADO,
+        'authorization_code': datos.get('AuthorizationCode'),
+        'monto': monto,
+    }
+
+
+def registrar_resultado_pago(client_transaction_id, transaction_id, aprobado, authorization_code=None, monto=None):
+    """
+    Aplicar el resultado de un intento de pago con UPDATEs condicionales.
+
+    El intento se busca por su client_transaction_id (índice único) y solo
+    acepta resultado mientras está 'iniciado', así que repeticiones o un
+    rechazo que llegue tarde no cambian nada. Un pago aprobado nunca se
+    revierte a fallido, y el rechazo de un intento no marca como fallida
+    una reservación que tiene otro intento en curso. Devuelve True si
+    cambió algo. Un aprobado por un monto distinto al del intento no se
+    registra: lanza MontoDistinto.
+
+    Como no pasa por save(), no se emiten señales: la reservación solo
+    pasa de 'pendiente' a 'confirmada' (ambos ocupan horario), así que la
+    ocupación no cambia.
+    """
+    ahora = timezone.now()
+    intentos = IntentoPago.objects.filter(client_transaction_id=client_transaction_id, estado='iniciado')
+
+    with transaction.atomic():
+        intento = intentos.select_for_update().only('id', 'reservacion_id', 'pasarela', 'monto').first()
+        if intento is None:
+            return False
+        if aprobado and monto is not None and monto != intento.monto:
+            raise MontoDistinto(f'Monto aprobado {monto}, esperado {intento.monto}')
+        IntentoPago.objects.filter(id=intento.id).update(
+            estado='aprobado' if aprobado else 'rechazado',
+            transaction_id=transaction_id,
+            autorizacion=authorization_code or '',
+            updated_at=ahora
+        )
+
+        reservaciones = Reservacion.objects.filter(id=intento.reservacion_id)
+        if aprobado:
+            reservaciones.exclude(estado_pago__in=['pagado', 'reembolsado']).update(
+                estado_pago='pagado',
+                estado=Case(When(estado='pendiente', then=Value('confirmada')), default=F('estado')),
+                fecha_pago=ahora,
+                metodo_pago=METODOS_PAGO.get(intento.pasarela, intento.pasarela),
+                referencia_pago=authorization_code or transaction_id,
+                transaccion_id=transaction_id,
+                updated_at=ahora
+            )
+        else:
+            reservaciones.filter(estado_pago__in=ESTADOS_PAGO_ABIERTOS).exclude(
+                Exists(IntentoPago.objects.filter(reservacion=OuterRef('pk'), estado='iniciado'))
+            ).update(
+                estado_pago='fallido',
+                updated_at=ahora
+            )
+
+        # Si el worker tenía confirmaciones de este intento en cola, ya no hacen falta
+        ConfirmacionPago.objects.filter(
+            client_transaction_id=client_transaction_id,
+            estado='pendiente'
+        ).update(estado='completada', updated_at=ahora)
+    return True
@@ -0,0 +1,190 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from ..models import Servicio, Reservacion, OcupacionSlot
+
+
+# Estados de reservación que ocupan un horario
+ESTADOS_ACTIVOS = ['pendiente', 'confirmada']
+
+# Estados de pago con los que una retención pendiente puede vencer
+# (con un pago en curso o hecho, la reservación no se libera sola)
+ESTADOS_PAGO_VENCIBLES = ['pendiente', 'fallido']
+
+# Campos de la reservación que definen lo que ocupa (ver huella)
+CAMPOS_HUELLA = ('servicio_id', 'fecha', 'hora_inicio', 'hora_fin', 'buffer_minutos', 'numero_personas', 'estado')
+
+# Tamaño de cada bloque de ocupación (minutos)
+MINUTOS_SLOT = 5
+
+MINUTOS_DIA = 24 * 60
+SLOTS_DIA = MINUTOS_DIA // MINUTOS_SLOT
+
+
+def a_minutos(hora):
+    """Convertir un time a minutos desde medianoche"""
+    return hora.hour * 60 + hora.minute
+
+
+def rango_minutos(hora_inicio, hora_fin):
+    """Intervalo [inicio, fin) en minutos; si termina tras medianoche se corta al fin del día"""
+    inicio = a_minutos(hora_inicio)
+    fin = a_minutos(hora_fin)
+    if fin <= inicio:
+        fin = MINUTOS_DIA
+    return inicio, fin
+
+
+def slots_ocupados(hora_inicio, hora_fin, buffer_minutos):
+    """
+    Bloques que ocupa una reservación: el servicio más el margen posterior.
+    Con el margen solo después, dos reservaciones del mismo lugar quedan
+    separadas por al menos ese margen, y la restricción de capacidad lo hace
+    cumplir igual que el cupo.
+    """
+    inicio, fin = rango_minutos(hora_inicio, hora_fin)
+    return slots_de(inicio, min(fin + buffer_minutos, MINUTOS_DIA))
+
+
+def slots_de(inicio, fin):
+    """Bloques que toca el intervalo [inicio, fin) en minutos"""
+    if inicio >= fin:
+        return range(0)
+    return range(inicio // MINUTOS_SLOT, (fin - 1) // MINUTOS_SLOT + 1)
+
+
+def filtro_vencidas(ahora=None):
+    """Reservaciones pendientes cuya retención ya venció"""
+    return Q(
+        estado='pendiente',
+        estado_pago__in=ESTADOS_PAGO_VENCIBLES,
+        expira_en__lt=ahora or timezone.now()
+    )
+
+
+def huella(valores):
+    """
+    Aporte de una reservación a la ocupación: (servicio_id, fecha, slots, personas)
+    o None si no ocupa lugar (cancelada, completada...).
+    Recibe los valores de la reservación como diccionario (p. ej. instance.__dict__).
+    """
+    if valores['estado'] not in ESTADOS_ACTIVOS:
+        return None
+    return (
+        valores['servicio_id'],
+        valores['fecha'],
+        tuple(slots_ocupados(valores['hora_inicio'], valores['hora_fin'], valores['buffer_minutos'])),
+        valores['numero_personas'],
+    )
+
+
+def sumar_ocupacion(servicio_id, fecha, slots, personas):
+    """
+    Sumar (o restar, con personas negativo) a los bloques indicados.
+    Si la suma supera la capacidad, la base de datos lanza IntegrityError.
+    """
+    if not slots or not personas:
+        return
+    with transaction.atomic():
+        if personas > 0:
+            capacidad = Servicio.objects.values_list('capacidad_maxima', flat=True).get(pk=servicio_id)
+            OcupacionSlot.objects.bulk_create(
+                [
+                    OcupacionSlot(servicio_id=servicio_id, fecha=fecha, slot=slot, capacidad=capacidad)
+                    for slot in slots
+                ],
+                ignore_conflicts=True
+            )
+        OcupacionSlot.objects.filter(
+            servicio_id=servicio_id,
+            fecha=fecha,
+            slot__in=slots
+        ).update(personas=F('personas') + personas)
+
+
+def actualizar_ocupacion(anterior, actual):
+    """Aplicar el cambio entre dos huellas de una misma reservación"""
+    if anterior == actual:
+        return
+    with transaction.atomic():
+        if anterior:
+            servicio_id, fecha, slots, personas = anterior
+            sumar_ocupacion(servicio_id, fecha, slots, -personas)
+        if actual:
+            sumar_ocupacion(*actual)
+
+
+def reconstruir_ocupacion(desde=None, hasta=None, servicio_id=None, pares=None):
+    """
+    Recalcular la tabla de ocupación a partir de las reservaciones activas.
+    Se puede limitar por rango de fechas, servicio o una lista de pares
+    (servicio_id, fecha). Devuelve el número de bloques escritos.
+    """
+    reservaciones = Reservacion.objects.filter(estado__in=ESTADOS_ACTIVOS)
+    ocupacion = OcupacionSlot.objects.all()
+
+    if desde:
+        reservaciones = reservaciones.filter(fecha__gte=desde)
+        ocupacion = ocupacion.filter(fecha__gte=desde)
+    if hasta:
+        reservaciones = reservaciones.filter(fecha__lte=hasta)
+        ocupacion = ocupacion.filter(fecha__lte=hasta)
+    if servicio_id:
+        reservaciones = reservaciones.filter(servicio_id=servicio_id)
+        ocupacion = ocupacion.filter(servicio_id=servicio_id)
+
+    if pares is not None:
+        pares = set(pares)
+        if not pares:
+            return 0
+        fechas = {fecha for _, fecha in pares}
+        servicios = {servicio for servicio, _ in pares}
+        reservaciones = reservaciones.filter(fecha__in=fechas, servicio_id__in=servicios)
+        ocupacion = ocupacion.filter(fecha__in=fechas, servicio_id__in=servicios)
+
+    capacidades = dict(Servicio.objects.values_list('id', 'capacidad_maxima'))
+    totales = Counter()
+    filas = reservaciones.values_list(
+        'servicio_id', 'fecha', 'hora_inicio', 'hora_fin', 'buffer_minutos', 'numero_personas'
+    ).order_by()
+    for servicio, fecha, hora_inicio, hora_fin, buffer_minutos, personas in filas.iterator(chunk_size=5000):
+        if pares is not None and (servicio, fecha) not in pares:
+            continue
+        for slot in slots_ocupados(hora_inicio, hora_fin, buffer_minutos):
+            totales[(servicio, fecha, slot)] += personas
+
+    with transaction.atomic():
+        if pares is not None:
+            for servicio, fecha in pares:
+                ocupacion.filter(servicio_id=servicio, fecha=fecha).delete()
+        else:
+            ocupacion.delete()
+        OcupacionSlot.objects.bulk_create(
+            [
+                OcupacionSlot(
+                    servicio_id=servicio,
+                    fecha=fecha,
+                    slot=slot,
+                    personas=personas,
+                    # Si ya hay sobrecupo (datos anteriores) se respeta, sin admitir más
+                    capacidad=max(capacidades[servicio], personas)
+                )
+                for (servicio, fecha, slot), personas in totales.items()
+            ],
+            batch_size=5000
+        )
+    return len(totales)
+
+
+def actualizar_capacidad(servicio):
+    """Copiar la capacidad del servicio a sus bloques de ocupación futuros"""
+    OcupacionSlot.objects.filter(
+        servicio=servicio,
+        fecha__gte=timezone.localdate()
+    ).exclude(
+        capacidad=servicio.capacidad_maxima
+    ).update(capacidad=Greatest(Value(servicio.capacidad_maxima), F('personas')))
@@ -0,0 +1,392 @@
+"""
+Capa común para las pasarelas de pago.
+
+Cada pasarela (PayPhone, Stripe) se adapta a la misma interfaz y a los
+mismos diccionarios de resultado. Todas las llamadas pasan por un
+interruptor (circuit breaker) por pasarela, que falla de inmediato
+cuando el proveedor acumula errores, y por contadores de latencia y
+errores que se exponen en /reservaciones/api/pasarelas/metricas/.
+"""
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+logger = logging.getLogger(__name__)
+
+# Límites del histograma de latencia (ms)
+LIMITES_LATENCIA = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_pasarelas = {}
+_interruptores = {}
+_metricas = {}
+_lock = threading.Lock()
+_hilos = None
+
+
+def _executor():
+    """
+    Hilos propios para las llamadas bloqueantes de las vistas async.
+    No usa el executor por defecto del event loop (min(32, cpu+4) hilos,
+    compartido con todo lo demás): PASARELAS_HILOS fija el techo de
+    llamadas a pasarelas en vuelo por proceso y el resto espera en cola.
+    """
+    global _hilos
+    if _hilos is None:
+        with _lock:
+            if _hilos is None:
+                _hilos = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'PASARELAS_HILOS', 10),
+                    thread_name_prefix='pasarelas',
+                )
+    return _hilos
+
+
+async def en_hilo(funcion, *args, **kwargs):
+    """Ejecuta una llamada bloqueante en los hilos de pasarelas"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor(), functools.partial(funcion, *args, **kwargs))
+
+
+class Interruptor:
+    """
+    Circuit breaker de una pasarela.
+
+    Cerrado: las llamadas pasan. Tras `umbral` fallos seguidos se abre y
+    rechaza las llamadas durante `espera` segundos. Después deja pasar
+    una sola llamada de prueba (semiabierto): si sale bien se cierra, si
+    falla vuelve a abrirse.
+    """
+
+    def __init__(self, umbral, espera):
+        self.umbral = umbral
+        self.espera = espera
+        self.estado = 'cerrado'
+        self.fallos = 0
+        self.abierto_desde = 0
+        self.lock = threading.Lock()
+
+    def permitir(self):
+        with self.lock:
+            if self.estado == 'cerrado':
+                return True
+            if self.estado == 'abierto' and time.monotonic() - self.abierto_desde >= self.espera:
+                self.estado = 'semiabierto'
+                return True
+            return False
+
+    def registrar(self, exito):
+        with self.lock:
+            if exito:
+                self.estado = 'cerrado'
+                self.fallos = 0
+                return
+            self.fallos += 1
+            if self.estado == 'semiabierto' or self.fallos >= self.umbral:
+                self.estado = 'abierto'
+                self.abierto_desde = time.monotonic()
+
+
+def _interruptor(nombre):
+    with _lock:
+        if nombre not in _interruptores:
+            _interruptores[nombre] = Interruptor(
+                settings.PASARELAS_UMBRAL_FALLOS,
+                settings.PASARELAS_ESPERA_INTERRUPTOR
+            )
+        return _interruptores[nombre]
+
+
+def _medir(nombre, operacion, milisegundos, exito, rechazada=False):
+    with _lock:
+        datos = _metricas.setdefault((nombre, operacion), {
+            'llamadas': 0,
+            'errores': 0,
+            'rechazadas': 0,
+            'latencia_total_ms': 0.0,
+            'latencia_max_ms': 0.0,
+            'buckets': [0] * (len(LIMITES_LATENCIA) + 1),
+        })
+        if rechazada:
+            datos['rechazadas'] += 1
+            return
+        datos['llamadas'] += 1
+        datos['errores'] += 0 if exito else 1
+        datos['latencia_total_ms'] += milisegundos
+        datos['latencia_max_ms'] = max(datos['latencia_max_ms'], milisegundos)
+        indice = next(
+            (i for i, limite in enumerate(LIMITES_LATENCIA) if milisegundos <= limite),
+            len(LIMITES_LATENCIA)
+        )
+        datos['buckets'][indice] += 1
+
+
+def metricas():
+    """Contadores de cada pasarela y operación, y el estado de sus interruptores"""
+    with _lock:
+        copia = {clave: dict(datos, buckets=list(datos['buckets'])) for clave, datos in _metricas.items()}
+        interruptores = dict(_interruptores)
+
+    resultado = {}
+    for (nombre, operacion), datos in sorted(copia.items()):
+        llamadas = datos['llamadas']
+        datos['tasa_error'] = round(datos['errores'] / llamadas, 4) if llamadas else 0
+        datos['latencia_media_ms'] = round(datos['latencia_total_ms'] / llamadas, 2) if llamadas else 0
+        datos['latencia_total_ms'] = round(datos['latencia_total_ms'], 2)
+        datos['latencia_max_ms'] = round(datos['latencia_max_ms'], 2)
+        resultado.setdefault(nombre, {'operaciones': {}})['operaciones'][operacion] = datos
+    for nombre, interruptor in interruptores.items():
+        resultado.setdefault(nombre, {'operaciones': {}})['interruptor'] = interruptor.estado
+    return resultado
+
+
+def metricas_prometheus():
+    """Las mismas métricas en formato de texto de Prometheus"""
+    lineas = [
+        '# TYPE pasarela_llamadas_total counter',
+        '# TYPE pasarela_errores_total counter',
+        '# TYPE pasarela_rechazadas_total counter',
+        '# TYPE pasarela_latencia_ms histogram',
+        '# TYPE pasarela_interruptor_abierto gauge',
+    ]
+    for nombre, datos in metricas().items():
+        for operacion, valores in datos['operaciones'].items():
+            etiquetas = f'pasarela="{nombre}",operacion="{operacion}"'
+            lineas.append(f'pasarela_llamadas_total{{{etiquetas}}} {valores["llamadas"]}')
+            lineas.append(f'pasarela_errores_total{{{etiquetas}}} {valores["errores"]}')
+            lineas.append(f'pasarela_rechazadas_total{{{etiquetas}}} {valores["rechazadas"]}')
+            acumulado = 0
+            for limite, cantidad in zip(LIMITES_LATENCIA + ('+Inf',), valores['buckets']):
+                acumulado += cantidad
+                lineas.append(f'pasarela_latencia_ms_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+            lineas.append(f'pasarela_latencia_ms_sum{{{etiquetas}}} {valores["latencia_total_ms"]}')
+            lineas.append(f'pasarela_latencia_ms_count{{{etiquetas}}} {valores["llamadas"]}')
+        abierto = 0 if datos.get('interruptor', 'cerrado') == 'cerrado' else 1
+        lineas.append(f'pasarela_interruptor_abierto{{pasarela="{nombre}"}} {abierto}')
+    return '\n'.join(lineas) + '\n'
+
+
+class Pasarela:
+    """
+    Interfaz común de las pasarelas de pago.
+
+    Las subclases implementan _crear_pago, _confirmar_pago y, si
+    admite_reembolsos, _reembolsar (y opcionalmente las versiones async)
+    devolviendo los diccionarios:
+
+    crear_pago     -> {'success', 'payment_url', 'referencia'} o {'success': False, 'error'[, 'falla_pasarela']}
+    confirmar_pago -> {'success', 'aprobado', 'estado', 'autorizacion', 'transaction_id'[, 'monto']}
+    reembolsar     -> {'success', 'reembolso_id', 'estado'}
+
+    falla_pasarela marca los errores del proveedor (conexión, timeout,
+    5xx): son los únicos que cuentan para el interruptor.
+    admite_cobros indica si el retorno y la confirmación de pagos nuevos
+    están implementados para la pasarela.
+    """
+    nombre = None
+    admite_reembolsos = False
+    admite_cobros = True
+
+    def _llamar(self, operacion, funcion, *args, **kwargs):
+        interruptor = _interruptor(self.nombre)
+        if not interruptor.permitir():
+            _medir(self.nombre, operacion, 0, False, rechazada=True)
+            return self._no_disponible()
+
+        inicio = time.perf_counter()
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception as e:
+            resultado = self._excepcion(operacion, e)
+        self._registrar(interruptor, operacion, inicio, resultado)
+        return resultado
+
+    async def _allamar(self, operacion, funcion, *args, **kwargs):
+        interruptor = _interruptor(self.nombre)
+        if not interruptor.permitir():
+            _medir(self.nombre, operacion, 0, False, rechazada=True)
+            return self._no_disponible()
+
+        inicio = time.perf_counter()
+        try:
+            resultado = await funcion(*args, **kwargs)
+        except Exception as e:
+            resultado = self._excepcion(operacion, e)
+        self._registrar(interruptor, operacion, inicio, resultado)
+        return resultado
+
+    def _registrar(self, interruptor, operacion, inicio, resultado):
+        _medir(self.nombre, operacion, (time.perf_counter() - inicio) * 1000, resultado['success'])
+        # Un pago rechazado o datos inválidos (4xx) no dicen que el proveedor esté caído
+        interruptor.registrar(not resultado.get('falla_pasarela'))
+
+    def _excepcion(self, operacion, error):
+        # Una excepción sin resultado (conexión, respuesta ilegible, bug en el
+        # adaptador) es falla de la pasarela: cuenta para el interruptor
+        logger.warning('Falla al llamar a la pasarela', exc_info=True,
+                       extra={'pasarela': self.nombre, 'operacion': operacion})
+        return {'success': False, 'error': str(error), 'falla_pasarela': True}
+
+    def _no_disponible(self):
+        return {
+            'success': False,
+            'error': f'La pasarela {self.nombre} no está disponible en este momento. Intenta más tarde.',
+            'no_disponible': True
+        }
+
+    def crear_pago(self, reservacion, return_url, cancel_url):
+        return self._llamar('crear_pago', self._crear_pago, reservacion, return_url, cancel_url)
+
+    def confirmar_pago(self, transaction_id, referencia):
+        return self._llamar('confirmar_pago', self._confirmar_pago, transaction_id, referencia)
+
+    def reembolsar(self, transaction_id, monto=None, clave_idempotencia=None):
+        if not self.admite_reembolsos:
+            # No es una falla de la pasarela: no cuenta para el interruptor
+            return {'success': False, 'error': f'La pasarela {self.nombre} no admite reembolsos'}
+        return self._llamar('reembolsar', self._reembolsar, transaction_id, monto, clave_idempotencia)
+
+    async def acrear_pago(self, reservacion, return_url, cancel_url):
+        return await self._allamar('crear_pago', self._acrear_pago, reservacion, return_url, cancel_url)
+
+    async def aconfirmar_pago(self, transaction_id, referencia):
+        return await self._allamar('confirmar_pago', self._aconfirmar_pago, transaction_id, referencia)
+
+    async def _acrear_pago(self, reservacion, return_url, cancel_url):
+        return await en_hilo(self._crear_pago, reservacion, return_url, cancel_url)
+
+    async def _aconfirmar_pago(self, transaction_id, referencia):
+        return await en_hilo(self._confirmar_pago, transaction_id, referencia)
+
+
+def registrar(clase):
+    """Decorador para registrar una pasarela por su nombre"""
+    _pasarelas[clase.nombre] = clase
+    return clase
+
+
+def obtener_pasarela(nombre=None, reservacion=None):
+    """
+    Elegir la pasarela: la indicada por nombre, la que se usó para pagar
+    la reservación (metodo_pago) o la configurada en PASARELA_PAGO.
+    """
+    if nombre is None and reservacion is not None and reservacion.metodo_pago:
+        if reservacion.metodo_pago.lower() in _pasarelas:
+            nombre = reservacion.metodo_pago.lower()
+    nombre = (nombre or settings.PASARELA_PAGO).lower()
+    if nombre not in _pasarelas:
+        raise ValueError(f'Pasarela desconocida: {nombre}')
+    return _pasarelas[nombre]()
+
+
+def pasarela_de_cobro():
+    """
+    Pasarela para pagos nuevos (PASARELA_PAGO). Solo se aceptan las que
+    tienen retorno y confirmación implementados.
+    """
+    pasarela = obtener_pasarela(settings.PASARELA_PAGO)
+    if not pasarela.admite_cobros:
+        raise ImproperlyConfigured(f'PASARELA_PAGO={settings.PASARELA_PAGO}: la pasarela aún no admite pagos nuevos')
+    return pasarela
+
+
+@registrar
+class PasarelaPayPhone(Pasarela):
+    nombre = 'payphone'
+
+    def __init__(self):
+        from .payphone_service import PayPhoneService
+        self.servicio = PayPhoneService()
+
+    def _crear_pago(self, reservacion, return_url, cancel_url):
+        return self._pago(self.servicio.crear_pago(reservacion, return_url, cancel_url))
+
+    async def _acrear_pago(self, reservacion, return_url, cancel_url):
+        return self._pago(await self.servicio.acrear_pago(reservacion, return_url, cancel_url))
+
+    def _confirmar_pago(self, transaction_id, referencia):
+        return self._confirmacion(self.servicio.confirmar_pago(transaction_id, referencia), transaction_id, referencia)
+
+    async def _aconfirmar_pago(self, transaction_id, referencia):
+        return self._confirmacion(
+            await self.servicio.aconfirmar_pago(transaction_id, referencia), transaction_id, referencia
+        )
+
+    def _pago(self, resultado):
+        if not resultado['success']:
+            return resultado
+        return {
+            'success': True,
+            'payment_url': resultado['payment_url'],
+            'referencia': resultado['client_transaction_id'],
+        }
+
+    def _confirmacion(self, resultado, transaction_id, referencia):
+        if not resultado['success']:
+            return resultado
+        # El ID llega del retorno o de la notificación sin verificar: solo vale
+        # si Confirm responde por la misma referencia (clientTransactionId)
+        if str(resultado['data'].get('clientTransactionId')) != referencia:
+            return {'success': False, 'error': 'PayPhone confirmó otra referencia'}
+        return {
+            'success': True,
+            'aprobado': resultado['is_approved'],
+            'estado': resultado['status'],
+            'autorizacion': resultado.get('authorization_code'),
+            'transaction_id': str(resultado['data'].get('transactionId') or transaction_id),
+            # Monto cobrado según PayPhone (centavos): debe coincidir con el intento
+            'monto': Decimal(int(resultado['data'].get('amount') or 0)) / 100,
+        }
+
+
+@registrar
+class PasarelaStripe(Pasarela):
+    nombre = 'stripe'
+    admite_reembolsos = True
+    # Falta el retorno (success_url) que encole la confirmación de la sesión:
+    # sirve para confirmar y reembolsar pagos existentes, no para cobrar
+    admite_cobros = False
+
+    def __init__(self):
+        from .stripe_service import StripeService
+        self.servicio = StripeService()
+
+    def _crear_pago(self, reservacion, return_url, cancel_url):
+        resultado = self.servicio.crear_checkout_session(reservacion, return_url, cancel_url)
+        if not resultado['success']:
+            return resultado
+        return {
+            'success': True,
+            'payment_url': resultado['checkout_url'],
+            'referencia': resultado['session_id'],
+        }
+
+    def _confirmar_pago(self, transaction_id, referencia):
+        # En Stripe la referencia es la sesión de checkout
+        resultado = self.servicio.verificar_pago(referencia)
+        if not resultado['success']:
+            return resultado
+        return {
+            'success': True,
+            'aprobado': resultado['status'] == 'paid',
+            'estado': resultado['status'],
+            'autorizacion': resultado['payment_intent'],
+            'transaction_id': resultado['payment_intent'],
+        }
+
+    def _reembolsar(self, transaction_id, monto, clave_idempotencia):
+        resultado = self.servicio.crear_reembolso(transaction_id, monto, clave_idempotencia)
+        if not resultado['success']:
+            return resultado
+        return {
+            'success': True,
+            'reembolso_id': resultado['refund_id'],
+            'estado': resultado['status'],
+        }
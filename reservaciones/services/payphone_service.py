@@ -1,6 +1,40 @@
+import json
+import logging
+import random
+import threading
 import requests
 import time
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .pasarelas import en_hilo
+
+
+logger = logging.getLogger(__name__)
+
+# Estados HTTP que vale la pena reintentar en llamadas idempotentes
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+_sesion = None
+_sesion_lock = threading.Lock()
+
+
+def obtener_sesion():
+    """
+    Sesión HTTP compartida por todo el proceso.
+    Reutiliza conexiones (keep-alive) para no pagar TCP+TLS en cada pago.
+    """
+    global _sesion
+    if _sesion is None:
+        with _sesion_lock:
+            if _sesion is None:
+                tamano = getattr(settings, 'PAYPHONE_POOL_SIZE', 10)
+                sesion = requests.Session()
+                adaptador = HTTPAdapter(pool_connections=tamano, pool_maxsize=tamano)
+                sesion.mount('https://', adaptador)
+                sesion.mount('http://', adaptador)
+                _sesion = sesion
+    return _sesion
 
 
 class PayPhoneService:
@@ -23,73 +57,163 @@ class PayPhoneService:
             'Content-Type': 'application/json'
         }
 
-    def crear_pago(self, reservacion, return_url, cancel_url):
+        # (conexión, lectura): fallar rápido si no se puede conectar
+        self.timeout = (
+            getattr(settings, 'PAYPHONE_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'PAYPHONE_READ_TIMEOUT', 15),
+        )
+        self.reintentos = getattr(settings, 'PAYPHONE_REINTENTOS', 3)
+        self.backoff = getattr(settings, 'PAYPHONE_BACKOFF', 0.5)
+        self.session = obtener_sesion()
+
+    def _post_con_reintentos(self, url, payload):
         """
-        Crear una solicitud de pago en PayPhone
-        Payload según documentación oficial
+        POST para llamadas idempotentes: reintenta errores de conexión,
+        timeouts y respuestas 429/5xx con backoff exponencial y jitter.
         """
+        intento = 0
+        while True:
+            try:
+                response = self.session.post(url, json=payload, headers=self.headers, timeout=self.timeout)
+                if response.status_code not in ESTADOS_REINTENTABLES or intento >= self.reintentos:
+                    return response
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if intento >= self.reintentos:
+                    raise
+            # Full jitter: espera aleatoria entre 0 y backoff * 2^intento
+            time.sleep(random.uniform(0, self.backoff * (2 ** intento)))
+            intento += 1
+
+    def _registrar_respuesta(self, operacion, inicio, status_code, texto, client_transaction_id):
+        """Registrar una llamada a PayPhone: resumen en INFO (o WARNING) y cuerpo en DEBUG"""
+        campos = {
+            'pasarela': 'payphone',
+            'operacion': operacion,
+            'status': status_code,
+            'duracion_ms': round((time.perf_counter() - inicio) * 1000, 1),
+            'client_transaction_id': client_transaction_id,
+        }
+        nivel = logging.INFO if status_code == 200 else logging.WARNING
+        logger.log(nivel, 'Respuesta de PayPhone', extra=campos)
+        logger.debug('Cuerpo de la respuesta de PayPhone', extra={**campos, 'cuerpo': texto})
+
+    def _payload_pago(self, reservacion, return_url):
+        """
+        Payload de Prepare según la documentación oficial.
+        Devuelve (payload, client_transaction_id).
+        """
+        # PayPhone trabaja en centavos
+        monto_centavos = int(reservacion.precio_total * 100)
+
+        # ID único por intento (en microsegundos: dos clics seguidos no chocan)
+        client_transaction_id = f"RES-{reservacion.id}-{time.time_ns() // 1000}"
+
+        payload = {
+            "clientTransactionId": client_transaction_id,
+            "storeId": self.store_id,
+            "reference": f"Reservación #{reservacion.id} - {reservacion.servicio.nombre}",
+            "responseUrl": return_url,
+            "amount": monto_centavos,
+            "amountWithoutTax": monto_centavos
+        }
+        return payload, client_transaction_id
+
+    def _resultado_pago(self, status_code, texto, client_transaction_id):
+        """Convertir la respuesta de Prepare en el diccionario de resultado"""
+        if status_code == 200:
+            data = json.loads(texto)
+
+            return {
+                "success": True,
+                "payment_url": data.get("payWithCard"),
+                "transaction_id": data.get("paymentId"),
+                "client_transaction_id": client_transaction_id
+            }
+
         try:
-            # PayPhone trabaja en centavos
-            monto_centavos = int(reservacion.precio_total * 100)
+            error_msg = json.loads(texto).get("message", texto)
+        except Exception:
+            error_msg = texto
 
-            # ID único de transacción
-            client_transaction_id = f"RES-{reservacion.id}-{int(time.time())}"
+        return {
+            "success": False,
+            "error": error_msg,
+            "falla_pasarela": status_code >= 500
+        }
 
-            # Payload según documentación oficial de PayPhone
-            payload = {
-                "clientTransactionId": client_transaction_id,
-                "storeId": self.store_id,
-                "reference": f"Reservación #{reservacion.id} - {reservacion.servicio.nombre}",
-                "responseUrl": return_url,
-                "amount": monto_centavos,
-                "amountWithoutTax": monto_centavos
+    def _resultado_confirmacion(self, status_code, texto):
+        """Convertir la respuesta de Confirm en el diccionario de resultado"""
+        if status_code == 200:
+            data = json.loads(texto)
+
+            status = (
+                data.get("transactionStatus")
+                or data.get("statusCode")
+                or "Unknown"
+            )
+
+            # PayPhone puede devolver diferentes valores para aprobado
+            is_approved = str(status).lower() in [
+                "approved", "aprobado", "3", "approved"
+            ] or data.get("statusCode") == 3
+
+            return {
+                "success": True,
+                "status": status,
+                "is_approved": is_approved,
+                "authorization_code": data.get("authorizationCode"),
+                "transaction_id": data.get("transactionId"),
+                "amount": (
+                    data.get("amount", 0) / 100
+                    if data.get("amount")
+                    else 0
+                ),
+                "data": data
             }
 
-            # Debug
-            print("PayPhone Payload:", payload)
+        return {
+            "success": False,
+            "error": f"Error al confirmar pago: {texto}",
+            "falla_pasarela": status_code >= 500
+        }
 
-            response = requests.post(
+    def crear_pago(self, reservacion, return_url, cancel_url):
+        """
+        Crear una solicitud de pago en PayPhone
+        Payload según documentación oficial
+        """
+        try:
+            payload, client_transaction_id = self._payload_pago(reservacion, return_url)
+            logger.debug('Payload de Prepare', extra={'payload': payload})
+
+            # Prepare no es idempotente: sin reintentos
+            inicio = time.perf_counter()
+            response = self.session.post(
                 f"{self.api_url}/button/Prepare",
                 json=payload,
                 headers=self.headers,
-                timeout=30
+                timeout=self.timeout
             )
+            self._registrar_respuesta('prepare', inicio, response.status_code, response.text, client_transaction_id)
 
-            print("PayPhone Response Status:", response.status_code)
-            print("PayPhone Response Body:", response.text)
-
-            if response.status_code == 200:
-                data = response.json()
-
-                return {
-                    "success": True,
-                    "payment_url": data.get("payWithCard"),
-                    "transaction_id": data.get("paymentId"),
-                    "client_transaction_id": client_transaction_id
-                }
-            else:
-                try:
-                    error_data = response.json()
-                    error_msg = error_data.get("message", response.text)
-                except Exception:
-                    error_msg = response.text
-
-                return {
-                    "success": False,
-                    "error": error_msg
-                }
+            return self._resultado_pago(response.status_code, response.text, client_transaction_id)
 
         except requests.exceptions.Timeout:
+            logger.warning('Falla al llamar a PayPhone', exc_info=True)
             return {
                 "success": False,
-                "error": "Tiempo de espera agotado al conectar con PayPhone"
+                "error": "Tiempo de espera agotado al conectar con PayPhone",
+                "falla_pasarela": True
             }
         except requests.exceptions.RequestException as e:
+            logger.warning('Falla al llamar a PayPhone', exc_info=True)
             return {
                 "success": False,
-                "error": f"Error de conexión: {str(e)}"
+                "error": f"Error de conexión: {str(e)}",
+                "falla_pasarela": True
             }
         except Exception as e:
+            logger.warning('Falla al llamar a PayPhone', exc_info=True)
             return {
                 "success": False,
                 "error": str(e)
@@ -107,62 +231,45 @@ class PayPhoneService:
                 "clientTxId": client_transaction_id
             }
             
-            print("Confirm Payload:", payload)
+            logger.debug('Payload de Confirm', extra={'payload': payload})
             
-            response = requests.post(
+            # Confirm solo consulta el estado: es seguro reintentarlo
+            inicio = time.perf_counter()
+            response = self._post_con_reintentos(
                 f"{self.api_url}/button/V2/Confirm",
-                json=payload,
-                headers=self.headers,
-                timeout=30
+                payload
             )
+            self._registrar_respuesta('confirm', inicio, response.status_code, response.text, client_transaction_id)
 
-            print("Confirm Response Status:", response.status_code)
-            print("Confirm Response Body:", response.text)
-
-            if response.status_code == 200:
-                data = response.json()
-
-                status = (
-                    data.get("transactionStatus")
-                    or data.get("statusCode")
-                    or "Unknown"
-                )
-
-                # PayPhone puede devolver diferentes valores para aprobado
-                is_approved = str(status).lower() in [
-                    "approved", "aprobado", "3", "approved"
-                ] or data.get("statusCode") == 3
-
-                return {
-                    "success": True,
-                    "status": status,
-                    "is_approved": is_approved,
-                    "authorization_code": data.get("authorizationCode"),
-                    "transaction_id": data.get("transactionId"),
-                    "amount": (
-                        data.get("amount", 0) / 100
-                        if data.get("amount")
-                        else 0
-                    ),
-                    "data": data
-                }
-
-            return {
-                "success": False,
-                "error": f"Error al confirmar pago: {response.text}"
-            }
+            return self._resultado_confirmacion(response.status_code, response.text)
 
         except requests.exceptions.RequestException as e:
+            logger.warning('Falla al llamar a PayPhone', exc_info=True)
             return {
                 "success": False,
-                "error": f"Error de conexión: {str(e)}"
+                "error": f"Error de conexión: {str(e)}",
+                "falla_pasarela": True
             }
         except Exception as e:
+            logger.warning('Falla al llamar a PayPhone', exc_info=True)
             return {
                 "success": False,
                 "error": str(e)
             }
 
+    async def acrear_pago(self, reservacion, return_url, cancel_url):
+        """
+        Versión async de crear_pago para vistas async: la llamada corre en
+        los hilos de pasarelas (PASARELAS_HILOS) con la sesión compartida
+        (keep-alive, timeouts de conexión y lectura, proxies) y no bloquea
+        el event loop.
+        """
+        return await en_hilo(self.crear_pago, reservacion, return_url, cancel_url)
+
+    async def aconfirmar_pago(self, transaction_id, client_transaction_id):
+        """Versión async de confirmar_pago, con los mismos reintentos"""
+        return await en_hilo(self.confirmar_pago, transaction_id, client_transaction_id)
+
     def procesar_respuesta(self, request_data):
         """
         Procesar la respuesta de PayPhone (redirect)
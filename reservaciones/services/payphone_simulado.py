@@ -0,0 +1,94 @@
+"""
+Servidor local que imita la API de PayPhone (Prepare y Confirm).
+
+Sirve para probar la conciliación, el worker de confirmaciones y los
+benchmarks sin salir a internet. Permite agregar latencia, errores 5xx
+y pagos rechazados. Se levanta con `manage.py payphone_simulado`.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ManejadorPayPhone(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # Se configuran en iniciar()
+    latencia = 0.0
+    tasa_error = 0.0
+    tasa_rechazo = 0.0
+    silencioso = True
+
+    # Monto de cada Prepare por clientTransactionId, para que Confirm lo devuelva
+    montos = {}
+
+    def log_message(self, formato, *args):
+        if not self.silencioso:
+            super().log_message(formato, *args)
+
+    def do_POST(self):
+        largo = int(self.headers.get('Content-Length', 0))
+        try:
+            datos = json.loads(self.rfile.read(largo) or b'{}')
+        except ValueError:
+            datos = {}
+
+        if self.latencia:
+            time.sleep(self.latencia)
+
+        if random.random() < self.tasa_error:
+            self._responder(503, {'message': 'Servicio no disponible (simulado)'})
+        elif self.path.endswith('/button/Prepare'):
+            self.montos[datos.get('clientTransactionId')] = datos.get('amount', 0)
+            self._responder(200, {
+                'paymentId': random.randint(10 ** 7, 10 ** 8),
+                'payWithCard': 'http://127.0.0.1/pago-simulado/',
+            })
+        elif self.path.endswith('/button/V2/Confirm'):
+            aprobado = random.random() >= self.tasa_rechazo
+            self._responder(200, {
+                'transactionId': datos.get('id'),
+                'clientTransactionId': datos.get('clientTxId'),
+                'statusCode': 3 if aprobado else 2,
+                'transactionStatus': 'Approved' if aprobado else 'Canceled',
+                'authorizationCode': f"AUT{str(datos.get('id'))[-6:]}" if aprobado else None,
+                'amount': self.montos.get(datos.get('clientTxId'), 1000),
+            })
+        else:
+            self._responder(404, {'message': 'Ruta no encontrada'})
+
+    def _responder(self, codigo, datos):
+        cuerpo = json.dumps(datos).encode()
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+
+class ServidorPayPhone(ThreadingHTTPServer):
+    # Cola de conexiones amplia: los benchmarks abren cientos a la vez
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def iniciar(puerto=8765, latencia=0.0, tasa_error=0.0, tasa_rechazo=0.0, en_segundo_plano=True, silencioso=True):
+    """
+    Levantar el servidor simulado en 127.0.0.1:puerto.
+    La URL para PAYPHONE_API_URL es http://127.0.0.1:<puerto>/api
+    """
+    manejador = type('Manejador', (ManejadorPayPhone,), {
+        'latencia': latencia,
+        'tasa_error': tasa_error,
+        'tasa_rechazo': tasa_rechazo,
+        'silencioso': silencioso,
+        'montos': {},
+    })
+    servidor = ServidorPayPhone(('127.0.0.1', puerto), manejador)
+    if en_segundo_plano:
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    else:
+        servidor.serve_forever()
+    return servidor
@@ -0,0 +1,105 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Reservacion
+from .cache_disponibilidad import invalidar_fechas
+from .ocupacion import CAMPOS_HUELLA, ESTADOS_ACTIVOS, huella, sumar_ocupacion
+from .pasarelas import obtener_pasarela
+
+
+def clave_idempotencia(reservacion):
+    """
+    Clave fija por reservación: si el proceso se repite (o se cae a la
+    mitad), la pasarela devuelve el mismo reembolso en lugar de otro.
+    """
+    return f'reembolso-reservacion-{reservacion.id}'
+
+
+def cancelar_reservaciones(queryset):
+    """
+    Cancelar en una sola transacción las reservaciones activas del queryset.
+    Devuelve los IDs de las que se cancelaron.
+    """
+    with transaction.atomic():
+        filas = list(
+            Reservacion.objects.select_for_update()
+            .filter(id__in=queryset.values('id'), estado__in=ESTADOS_ACTIVOS)
+            .values('id', *CAMPOS_HUELLA)
+        )
+        if not filas:
+            return []
+        ids = [fila['id'] for fila in filas]
+        Reservacion.objects.filter(id__in=ids).update(estado='cancelada', updated_at=timezone.now())
+
+        # update() no dispara señales: restar lo que ocupaban, sin reconstruir
+        # los días (una reserva nueva del mismo día no perdería su suma)
+        liberar = Counter()
+        for fila in filas:
+            servicio_id, fecha, slots, personas = huella(fila)
+            liberar[(servicio_id, fecha, slots)] += personas
+        for (servicio_id, fecha, slots), personas in liberar.items():
+            sumar_ocupacion(servicio_id, fecha, slots, -personas)
+        invalidar_fechas({(servicio_id, fecha) for servicio_id, fecha, _ in liberar})
+    return ids
+
+
+def _reembolsar(reservacion):
+    try:
+        pasarela = obtener_pasarela(nombre=reservacion.metodo_pago or '')
+    except ValueError:
+        return reservacion, {
+            'success': False,
+            'error': f'Método de pago sin reembolso automático: {reservacion.metodo_pago or "ninguno"}'
+        }
+    return reservacion, pasarela.reembolsar(
+        reservacion.transaccion_id,
+        clave_idempotencia=clave_idempotencia(reservacion)
+    )
+
+
+def cancelar_y_reembolsar(queryset, hilos=8):
+    """
+    Cancelar las reservaciones del queryset y reembolsar las pagadas.
+
+    La cancelación es una sola transacción; los reembolsos se piden
+    después, en paralelo con un máximo de `hilos` llamadas a la vez, y
+    las que salen bien se marcan como 'reembolsado' con un bulk_update.
+    Solo se reembolsan las que esta llamada canceló: una reservación que
+    ya estaba cancelada no se vuelve a reembolsar.
+    """
+    inicio = time.perf_counter()
+    # Fijar el conjunto antes de cancelar: el queryset puede filtrar por estado
+    ids = list(queryset.values_list('id', flat=True))
+    canceladas = cancelar_reservaciones(Reservacion.objects.filter(id__in=ids))
+
+    pendientes = list(
+        Reservacion.objects.filter(id__in=canceladas, estado_pago='pagado')
+        .only('id', 'metodo_pago', 'transaccion_id', 'estado_pago', 'updated_at')
+        .order_by('id')
+    )
+
+    reembolsadas = []
+    fallidas = []
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        for reservacion, resultado in pool.map(_reembolsar, pendientes):
+            if resultado['success']:
+                reservacion.estado_pago = 'reembolsado'
+                # bulk_update no aplica auto_now
+                reservacion.updated_at = timezone.now()
+                reembolsadas.append(reservacion)
+            else:
+                fallidas.append({'reservacion': reservacion.id, 'error': resultado['error']})
+
+    Reservacion.objects.bulk_update(reembolsadas, ['estado_pago', 'updated_at'], batch_size=500)
+
+    return {
+        'canceladas': len(canceladas),
+        'reembolsos_solicitados': len(pendientes),
+        'reembolsadas': len(reembolsadas),
+        'fallidas': fallidas,
+        'segundos': round(time.perf_counter() - inicio, 2),
+    }
@@ -0,0 +1,49 @@
+from django.db import IntegrityError, transaction
+
+from ..models import Reservacion
+from .disponibilidad import hay_cupo
+from .retenciones import expirar_vencidas, vencimiento
+
+
+# Nombre de la restricción que rechaza sobrerreservas (ver OcupacionSlot)
+RESTRICCION_CAPACIDAD = 'ocupacion_dentro_de_capacidad'
+
+
+class HorarioNoDisponible(Exception):
+    """El horario no tiene cupo suficiente para la reservación"""
+
+
+def reservar(servicio, fecha, hora_inicio, hora_fin, numero_personas, **datos):
+    """
+    Crear una reservación si el horario tiene cupo.
+    La verificación previa evita trabajo en el caso común; la garantía real
+    la da la restricción de capacidad al sumar la ocupación dentro de la
+    misma transacción, así que dos solicitudes simultáneas no pueden
+    sobrerreservar y no se mantiene ningún bloqueo durante la solicitud.
+
+    Las reservaciones pendientes retienen el horario hasta expira_en. Si no
+    hay cupo, primero se cancelan las retenciones vencidas de ese día (sin
+    esperar al barrido) y se vuelve a verificar.
+    """
+    if datos.get('estado', 'pendiente') == 'pendiente':
+        datos.setdefault('expira_en', vencimiento())
+
+    if not hay_cupo(servicio, fecha, hora_inicio, hora_fin, numero_personas):
+        if not expirar_vencidas(servicio=servicio, fecha=fecha) or \
+                not hay_cupo(servicio, fecha, hora_inicio, hora_fin, numero_personas):
+            raise HorarioNoDisponible()
+
+    try:
+        with transaction.atomic():
+            return Reservacion.objects.create(
+                servicio=servicio,
+                fecha=fecha,
+                hora_inicio=hora_inicio,
+                hora_fin=hora_fin,
+                numero_personas=numero_personas,
+                **datos
+            )
+    except IntegrityError as e:
+        if RESTRICCION_CAPACIDAD in str(e):
+            raise HorarioNoDisponible() from e
+        raise
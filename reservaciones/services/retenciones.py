@@ -0,0 +1,57 @@
+"""
+Vencimiento de las retenciones: una reservación pendiente aparta su
+horario solo hasta expira_en. Después deja de contar al calcular la
+disponibilidad (ver disponibilidad.vencidas) y el barrido la cancela.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Reservacion
+from .cache_disponibilidad import invalidar_fechas
+from .ocupacion import CAMPOS_HUELLA, filtro_vencidas, huella, sumar_ocupacion
+
+
+def vencimiento(desde=None):
+    """Momento en que vence la retención de una reservación creada ahora"""
+    return (desde or timezone.now()) + timedelta(minutes=settings.RESERVAS_MINUTOS_RETENCION)
+
+
+def expirar_vencidas(lote=500, **filtros):
+    """
+    Cancelar hasta `lote` reservaciones con la retención vencida.
+
+    Todo ocurre en una transacción corta: las filas se bloquean con SKIP
+    LOCKED (un pago que se está registrando no se espera ni se pisa) y la
+    ocupación se descuenta con restas, sin reconstruir los días, para no
+    chocar con reservaciones nuevas del mismo día. Devuelve cuántas se
+    cancelaron.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        filas = list(
+            Reservacion.objects.select_for_update(skip_locked=True)
+            .filter(filtro_vencidas(ahora), **filtros)
+            .values('id', *CAMPOS_HUELLA)
+            .order_by('expira_en')[:lote]
+        )
+        if not filas:
+            return 0
+
+        canceladas = Reservacion.objects.filter(id__in=[fila['id'] for fila in filas]).update(
+            estado='cancelada',
+            updated_at=ahora
+        )
+
+        # update() no dispara señales: restar lo que ocupaban, agrupado por intervalo
+        liberar = Counter()
+        for fila in filas:
+            servicio_id, fecha, slots, personas = huella(fila)
+            liberar[(servicio_id, fecha, slots)] += personas
+        for (servicio_id, fecha, slots), personas in liberar.items():
+            sumar_ocupacion(servicio_id, fecha, slots, -personas)
+        invalidar_fechas({(servicio_id, fecha) for servicio_id, fecha, _ in liberar})
+    return canceladas
@@ -4,6 +4,15 @@ from decimal import Decimal
 from urllib.parse import urlparse
 
 
+def _error(e):
+    """Resultado de un error de Stripe: conexión y 5xx son fallas del proveedor"""
+    return {
+        'success': False,
+        'error': str(e),
+        'falla_pasarela': isinstance(e, stripe.error.APIConnectionError) or (e.http_status or 0) >= 500
+    }
+
+
 class StripeService:
     """Servicio para integración con Stripe"""
     
@@ -65,10 +74,7 @@ class StripeService:
             }
         
         except stripe.error.StripeError as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            return _error(e)
         except Exception as e:
             return {
                 'success': False,
@@ -89,10 +95,7 @@ class StripeService:
                 'data': session
             }
         except stripe.error.StripeError as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            return _error(e)
     
     def obtener_payment_intent(self, payment_intent_id):
         """
@@ -108,14 +111,12 @@ class StripeService:
                 'data': payment_intent
             }
         except stripe.error.StripeError as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            return _error(e)
     
-    def crear_reembolso(self, payment_intent_id, monto=None):
+    def crear_reembolso(self, payment_intent_id, monto=None, clave_idempotencia=None):
         """
         Crear un reembolso
+        Con clave_idempotencia, repetir la llamada devuelve el mismo reembolso
         """
         try:
             refund_data = {'payment_intent': payment_intent_id}
@@ -124,6 +125,9 @@ class StripeService:
                 # Convertir a centavos
                 refund_data['amount'] = int(monto * 100)
             
+            if clave_idempotencia:
+                refund_data['idempotency_key'] = clave_idempotencia
+            
             refund = stripe.Refund.create(**refund_data)
             
             return {
@@ -133,7 +137,4 @@ class StripeService:
                 'data': refund
             }
         except stripe.error.StripeError as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
\ No newline at end of file
+            return _error(e)
\ No newline at end of file
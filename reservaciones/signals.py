@@ -0,0 +1,114 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Servicio, HorarioDisponible, Reservacion
+from .services.ocupacion import (
+    CAMPOS_HUELLA,
+    huella,
+    actualizar_ocupacion,
+    actualizar_capacidad,
+)
+from .services.cache_disponibilidad import invalidar_fechas, invalidar_servicio
+from .cache_paginas import purgar_servicio
+from .services.imagenes import actualizar_variantes
+
+
+CAMPOS_DISPONIBILIDAD_SERVICIO = ('duracion_minutos', 'capacidad_maxima', 'intervalo_minutos', 'buffer_minutos')
+
+
+def huella_cargada(instance):
+    """Huella de la reservación tal como está en la base de datos (None si es nueva)"""
+    cargados = getattr(instance, '_valores_cargados', None)
+    if cargados is None:
+        return None
+    return huella(cargados)
+
+
+@receiver([pre_save, pre_delete], sender=Reservacion)
+def cargar_diferidos(sender, instance, raw=False, **kwargs):
+    """
+    Con campos diferidos (.only()), leer de la base de datos lo que ocupa la
+    reservación antes de guardarla o borrarla: el cambio se aplica con restas
+    y sumas, sin reconstruir el día, y después del borrado ya no se puede
+    consultar. No se toca la instancia: un campo diferido asignado en memoria
+    se guarda con su valor nuevo.
+    """
+    cargados = getattr(instance, '_valores_cargados', None)
+    if raw or cargados is None:
+        return
+    faltantes = [campo for campo in CAMPOS_HUELLA if campo not in cargados]
+    if faltantes:
+        cargados.update(Reservacion.objects.filter(pk=instance.pk).values(*faltantes).get())
+
+
+@receiver(post_save, sender=Reservacion)
+def guardar_ocupacion(sender, instance, created, raw=False, **kwargs):
+    """
+    Actualizar la ocupación precalculada tras crear o modificar una reservación.
+    Si el cambio supera la capacidad, la restricción de OcupacionSlot lo rechaza.
+    """
+    if raw:
+        return
+    anterior = None if created else huella_cargada(instance)
+    # Los campos que siguen diferidos no se guardaron: valen lo cargado
+    valores = {**getattr(instance, '_valores_cargados', {}), **instance.__dict__}
+    actual = huella(valores)
+    if anterior != actual:
+        actualizar_ocupacion(anterior, actual)
+        invalidar_fechas(h[:2] for h in (anterior, actual) if h)
+    # Lo guardado pasa a ser el nuevo estado de referencia
+    instance._valores_cargados = {campo: valores[campo] for campo in CAMPOS_HUELLA}
+
+
+@receiver(post_delete, sender=Reservacion)
+def borrar_ocupacion(sender, instance, **kwargs):
+    """Liberar la ocupación de una reservación eliminada"""
+    anterior = huella_cargada(instance)
+    if anterior is None:
+        anterior = huella(instance.__dict__)
+    if anterior:
+        actualizar_ocupacion(anterior, None)
+        invalidar_fechas([anterior[:2]])
+
+
+@receiver(post_save, sender=Servicio)
+def guardar_servicio(sender, instance, created, raw=False, **kwargs):
+    """Propagar cambios de duración o capacidad a la ocupación y a la caché"""
+    if raw or created:
+        return
+    cargados = getattr(instance, '_valores_cargados', {})
+    if any(cargados.get(campo) != getattr(instance, campo) for campo in CAMPOS_DISPONIBILIDAD_SERVICIO):
+        actualizar_capacidad(instance)
+        invalidar_servicio(instance.id)
+    instance._valores_cargados = {
+        **cargados,
+        **{campo: getattr(instance, campo) for campo in CAMPOS_DISPONIBILIDAD_SERVICIO},
+    }
+
+
+@receiver(post_save, sender=Servicio)
+def generar_variantes_imagen(sender, instance, raw=False, **kwargs):
+    """Generar las variantes de la imagen cuando se sube o cambia"""
+    if raw:
+        return
+    actualizar_variantes(instance)
+
+
+@receiver([post_save, post_delete], sender=Servicio)
+def purgar_paginas_servicio(sender, instance, raw=False, **kwargs):
+    """Purgar la lista y el detalle del servicio en la caché de páginas"""
+    if raw:
+        return
+    purgar_servicio(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=HorarioDisponible)
+def cambiar_horario(sender, instance, raw=False, **kwargs):
+    """Las ventanas de horario cambian los slots de todos los días del servicio"""
+    if raw:
+        return
+    invalidar_servicio(instance.servicio_id)
+    purgar_servicio(instance.servicio_id)
+    # Los horarios son parte del servicio: mover su updated_at cambia los ETag
+    Servicio.objects.filter(pk=instance.servicio_id).update(updated_at=timezone.now())
@@ -0,0 +1,58 @@
+from django import template
+
+from ..services.imagenes import PRESENTACIONES
+
+
+register = template.Library()
+
+# Ancho con que se muestra cada presentación (atributo sizes)
+TAMANOS = {
+    'miniatura': '80px',
+    'tarjeta': '(min-width: 1024px) 400px, (min-width: 768px) 50vw, 100vw',
+    'detalle': '(min-width: 1024px) 600px, 100vw',
+}
+
+TIPOS = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+
+@register.inclusion_tag('reservaciones/imagen_servicio.html')
+def imagen_servicio(servicio, presentacion, clase='', carga='lazy'):
+    """
+    <picture> con las variantes de la imagen del servicio: srcset por
+    formato, dimensiones explícitas y carga diferida. Sin variantes
+    (aún no generadas) usa la imagen original.
+    """
+    ancho, alto = (medida // 2 for medida in PRESENTACIONES[presentacion])
+    contexto = {
+        'servicio': servicio,
+        'clase': clase,
+        'carga': carga,
+        'ancho': ancho,
+        'alto': alto,
+        'tamanos': TAMANOS[presentacion],
+        'fuentes': [],
+        'src': servicio.imagen.url,
+        'srcset': '',
+    }
+
+    variante = (servicio.imagen_variantes or {}).get(presentacion)
+    if not variante or (servicio.imagen_variantes.get('original') != servicio.imagen.name):
+        return contexto
+
+    storage = servicio.imagen.storage
+
+    def srcset(por_ancho):
+        return ', '.join(f'{storage.url(nombre)} {ancho_archivo}w' for ancho_archivo, nombre in por_ancho.items())
+
+    archivos = variante['archivos']
+    contexto.update({
+        'ancho': variante['ancho'],
+        'alto': variante['alto'],
+        'fuentes': [
+            {'tipo': tipo, 'srcset': srcset(archivos[formato])}
+            for formato, tipo in TIPOS.items() if formato in archivos
+        ],
+        'src': storage.url(next(iter(archivos['jpeg'].values()))),
+        'srcset': srcset(archivos['jpeg']),
+    })
+    return contexto
@@ -1,3 +1,748 @@
-from django.test import TestCase
+import io
+import json
+import random
+from datetime import time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import messages
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin import ReservacionAdmin
+from .management.commands.conciliar_pagos import Command as ConciliarPagos
+from .models import Servicio, HorarioDisponible, Reservacion, IntentoPago, ConfirmacionPago, OcupacionSlot
+from .services import cache_disponibilidad
+from .services.catalogo import leer_filtros, pagina_servicios
+from .services.confirmaciones import reclamar_trabajos, procesar_trabajo
+from .services.disponibilidad import OcupacionDia, calcular_horarios_disponibles
+from .services.historial import pagina_reservaciones
+from .services import pasarelas
+from .services.notificaciones import firmar, ESTADO_APROBADO
+from .services.reembolsos import cancelar_y_reembolsar
+from .services.reservas import reservar, HorarioNoDisponible
+from .services.retenciones import expirar_vencidas
+
+
+SECRETO = 'secreto-de-prueba'
+
+
+class DatosPrueba(TestCase):
+    """Servicio con capacidad 2 y un usuario, para reservar mañana"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura-123')
+        cls.servicio = Servicio.objects.create(
+            nombre='Masaje',
+            descripcion='Masaje relajante',
+            duracion_minutos=60,
+            precio=Decimal('25.00'),
+            capacidad_maxima=2
+        )
+        cls.fecha = timezone.localdate() + timedelta(days=1)
+
+    def crear_reservacion(self, hora_inicio=time(10, 0), hora_fin=time(11, 0), personas=1, **datos):
+        valores = {
+            'usuario': self.usuario,
+            'servicio': self.servicio,
+            'fecha': self.fecha,
+            'hora_inicio': hora_inicio,
+            'hora_fin': hora_fin,
+            'numero_personas': personas,
+            'nombre_cliente': 'Cliente',
+            'email_cliente': 'cliente@example.com',
+            'telefono_cliente': '0999999999',
+            'precio_total': self.servicio.precio * personas,
+        }
+        valores.update(datos)
+        return Reservacion.objects.create(**valores)
+
+
+class OcupacionTests(DatosPrueba):
+    """La tabla de ocupación sigue a las reservaciones (señales de signals.py)"""
+
+    # 10:00-11:00 en bloques de 5 minutos
+    SLOTS_10_A_11 = range(120, 132)
+
+    def ocupacion(self):
+        return dict(
+            OcupacionSlot.objects.filter(servicio=self.servicio, fecha=self.fecha, personas__gt=0)
+            .values_list('slot', 'personas')
+        )
+
+    def assertOcupacion(self, slots, personas):
+        self.assertEqual(self.ocupacion(), dict.fromkeys(slots, personas))
+
+    def test_crear_ocupa_los_bloques_del_intervalo(self):
+        self.crear_reservacion(personas=2)
+        self.assertOcupacion(self.SLOTS_10_A_11, 2)
+
+    def test_cancelar_y_completar_liberan_el_horario(self):
+        for estado in ('cancelada', 'completada'):
+            with self.subTest(estado=estado):
+                reservacion = self.crear_reservacion()
+                reservacion.estado = estado
+                reservacion.save()
+                self.assertOcupacion([], 0)
+
+    def test_cambiar_de_horario_mueve_la_ocupacion(self):
+        reservacion = self.crear_reservacion()
+        reservacion.hora_inicio, reservacion.hora_fin = time(11, 0), time(11, 30)
+        reservacion.save()
+        self.assertOcupacion(range(132, 138), 1)
+
+    def test_borrar_libera_el_horario(self):
+        self.crear_reservacion().delete()
+        self.assertOcupacion([], 0)
+
+    def test_guardar_y_borrar_con_campos_diferidos(self):
+        cancelar, borrar = self.crear_reservacion(), self.crear_reservacion()
+        self.assertOcupacion(self.SLOTS_10_A_11, 2)
+
+        parcial = Reservacion.objects.only('id', 'estado').get(pk=cancelar.pk)
+        parcial.estado = 'cancelada'
+        parcial.save()
+        self.assertOcupacion(self.SLOTS_10_A_11, 1)
+
+        Reservacion.objects.only('id', 'estado').get(pk=borrar.pk).delete()
+        self.assertOcupacion([], 0)
+
+    def test_mover_con_campos_diferidos(self):
+        reservacion = self.crear_reservacion()
+        otra = self.crear_reservacion(hora_inicio=time(10, 30), hora_fin=time(11, 0))
+        parcial = Reservacion.objects.only('id').get(pk=reservacion.pk)
+        parcial.hora_inicio, parcial.hora_fin = time(11, 0), time(11, 30)
+        parcial.save()
+        self.assertOcupacion(range(126, 138), 1)
+        self.assertEqual(Reservacion.objects.get(pk=otra.pk).estado, 'pendiente')
+
+    def test_reconfirmar_en_un_horario_lleno_se_rechaza(self):
+        cancelada = self.crear_reservacion(estado='cancelada')
+        self.crear_reservacion(personas=2)
+
+        parcial = Reservacion.objects.only('id', 'estado').get(pk=cancelada.pk)
+        parcial.estado = 'confirmada'
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            parcial.save()
+        self.assertOcupacion(self.SLOTS_10_A_11, 2)
+
+    def test_accion_del_admin_respeta_la_capacidad(self):
+        cancelada = self.crear_reservacion(estado='cancelada')
+        llena = self.crear_reservacion(personas=2)
+        admin_reservaciones = ReservacionAdmin(Reservacion, AdminSite())
+        request = mock.Mock()
+
+        with mock.patch.object(admin_reservaciones, 'message_user') as mensaje:
+            admin_reservaciones.confirmar_reservaciones(request, Reservacion.objects.filter(pk=cancelada.pk))
+        self.assertEqual(mensaje.call_args.args[2], messages.ERROR)
+        self.assertEqual(Reservacion.objects.get(pk=cancelada.pk).estado, 'cancelada')
+
+        admin_reservaciones.completar_reservaciones(request, Reservacion.objects.filter(pk=llena.pk))
+        self.assertOcupacion([], 0)
+
+    def test_reservar_sin_cupo(self):
+        datos = {'usuario': self.usuario, 'nombre_cliente': 'Cliente', 'precio_total': self.servicio.precio}
+        reservar(self.servicio, self.fecha, time(10, 0), time(11, 0), 2, **datos)
+
+        with self.assertRaises(HorarioNoDisponible):
+            reservar(self.servicio, self.fecha, time(10, 30), time(11, 30), 1, **datos)
+        self.assertEqual(Reservacion.objects.count(), 1)
+
+    def test_la_restriccion_de_capacidad_impide_sobrerreservar(self):
+        # Dos solicitudes que pasaron la verificación previa a la vez
+        datos = {'usuario': self.usuario, 'nombre_cliente': 'Cliente', 'precio_total': self.servicio.precio}
+        reservar(self.servicio, self.fecha, time(10, 0), time(11, 0), 2, **datos)
+
+        with mock.patch('reservaciones.services.reservas.hay_cupo', return_value=True):
+            with self.assertRaises(HorarioNoDisponible):
+                reservar(self.servicio, self.fecha, time(10, 0), time(11, 0), 1, **datos)
+        self.assertEqual(Reservacion.objects.count(), 1)
+        self.assertOcupacion(self.SLOTS_10_A_11, 2)
+
+    def test_el_buffer_ocupa_bloques_y_la_restriccion_lo_hace_cumplir(self):
+        Servicio.objects.filter(pk=self.servicio.pk).update(buffer_minutos=15)
+        self.servicio.refresh_from_db()
+        datos = {'usuario': self.usuario, 'nombre_cliente': 'Cliente', 'precio_total': self.servicio.precio}
+        reservar(self.servicio, self.fecha, time(10, 0), time(11, 0), 2, **datos)
+        # 10:00-11:15: el servicio más el margen posterior
+        self.assertOcupacion(range(120, 135), 2)
+
+        with mock.patch('reservaciones.services.reservas.hay_cupo', return_value=True):
+            with self.assertRaises(HorarioNoDisponible):
+                reservar(self.servicio, self.fecha, time(11, 0), time(12, 0), 1, **datos)
+        reservar(self.servicio, self.fecha, time(11, 15), time(12, 15), 1, **datos)
+
+        # Cambiar el margen después no mueve lo que ya ocupan: borrar las deja en cero
+        Servicio.objects.filter(pk=self.servicio.pk).update(buffer_minutos=0)
+        for reservacion in Reservacion.objects.all():
+            reservacion.delete()
+        self.assertOcupacion([], 0)
+
+
+@override_settings(PAYPHONE_WEBHOOK_SECRET=SECRETO, PAYPHONE_STORE_ID='tienda')
+class NotificacionPayPhoneTests(DatosPrueba):
+
+    def setUp(self):
+        self.reservacion = self.crear_reservacion(estado_pago='procesando')
+        self.intento = IntentoPago.objects.create(
+            reservacion=self.reservacion,
+            pasarela='payphone',
+            client_transaction_id=f'RES-{self.reservacion.id}-1',
+            monto=self.reservacion.precio_total
+        )
+
+    def notificar(self, secreto=SECRETO, **cambios):
+        datos = {
+            'StoreId': 'tienda',
+            'TransactionId': '123456',
+            'ClientTransactionId': self.intento.client_transaction_id,
+            'StatusCode': ESTADO_APROBADO,
+            'Amount': 2500,
+            **cambios,
+        }
+        cuerpo = json.dumps(datos).encode()
+        cabeceras = {'X-PayPhone-Signature': firmar(cuerpo, secreto)} if secreto else {}
+        return self.client.post(
+            reverse('notificacion_payphone'), cuerpo, content_type='application/json', headers=cabeceras
+        )
+
+    def assertSinPagar(self):
+        self.reservacion.refresh_from_db()
+        self.assertEqual(self.reservacion.estado, 'pendiente')
+        self.assertEqual(self.reservacion.estado_pago, 'procesando')
+
+    def test_sin_secreto_configurado_rechaza_todo(self):
+        with override_settings(PAYPHONE_WEBHOOK_SECRET=''):
+            respuesta = self.notificar(secreto=None)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(ConfirmacionPago.objects.exists())
+        self.assertSinPagar()
+
+    def test_firma_invalida(self):
+        respuesta = self.notificar(secreto='otro-secreto')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(ConfirmacionPago.objects.exists())
+
+    def test_solo_encola_la_confirmacion(self):
+        respuesta = self.notificar()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.json()['encolada'])
+        self.assertSinPagar()
+
+        trabajo = ConfirmacionPago.objects.get()
+        self.assertEqual(trabajo.reservacion_id, self.reservacion.id)
+        self.assertEqual(trabajo.estado, 'pendiente')
+        self.intento.refresh_from_db()
+        self.assertEqual(self.intento.estado, 'iniciado')
+        # El ID del cuerpo queda en el trabajo hasta que Confirm lo verifique
+        self.assertIsNone(self.intento.transaction_id)
+        self.assertEqual(trabajo.transaction_id, '123456')
+
+    def test_repeticiones_reutilizan_el_trabajo(self):
+        for _ in range(3):
+            self.notificar()
+        self.assertEqual(ConfirmacionPago.objects.count(), 1)
+
+    def test_referencia_desconocida_no_encola(self):
+        respuesta = self.notificar(ClientTransactionId='RES-0-0')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(respuesta.json()['encolada'])
+        self.assertFalse(ConfirmacionPago.objects.exists())
+
+    def test_un_id_reutilizado_no_ocupa_el_trabajo_de_otro_intento(self):
+        # Otro intento del mismo usuario vuelve del pago con el ID de este
+        otra = self.crear_reservacion(hora_inicio=time(12, 0), hora_fin=time(13, 0), estado_pago='procesando')
+        ajeno = IntentoPago.objects.create(
+            reservacion=otra, pasarela='payphone', client_transaction_id=f'RES-{otra.id}-1', monto=otra.precio_total
+        )
+        self.client.force_login(self.usuario)
+        self.client.get(reverse('pago_confirmacion'), {'id': '123456', 'clientTransactionId': ajeno.client_transaction_id})
+        self.notificar()
+
+        self.assertEqual(ConfirmacionPago.objects.filter(transaction_id='123456').count(), 2)
+        self.assertFalse(IntentoPago.objects.filter(transaction_id='123456').exists())
+
+        # Confirm solo verifica el par de este intento: el ID queda guardado aquí
+        def confirmar(transaction_id, referencia):
+            if referencia != self.intento.client_transaction_id:
+                return {'success': False, 'error': 'PayPhone confirmó otra referencia'}
+            return {
+                'success': True, 'aprobado': True, 'estado': 'Approved',
+                'autorizacion': 'AUT1', 'transaction_id': '123456', 'monto': Decimal('25.00'),
+            }
+        pasarela = mock.Mock()
+        pasarela.confirmar_pago.side_effect = confirmar
+        with mock.patch('reservaciones.services.confirmaciones.obtener_pasarela', return_value=pasarela):
+            for trabajo in reclamar_trabajos(10):
+                procesar_trabajo(trabajo)
+
+        self.assertEqual(IntentoPago.objects.get(transaction_id='123456').pk, self.intento.pk)
+        self.reservacion.refresh_from_db()
+        self.assertEqual(self.reservacion.estado_pago, 'pagado')
+
+    def test_confirm_de_otra_referencia_no_vale(self):
+        pasarela = pasarelas.obtener_pasarela('payphone')
+        respuesta = {
+            'success': True, 'status': 'Approved', 'is_approved': True, 'authorization_code': 'AUT1',
+            'data': {'transactionId': 999, 'clientTransactionId': 'RES-0-0', 'amount': 2500},
+        }
+        self.assertFalse(pasarela._confirmacion(respuesta, '999', self.intento.client_transaction_id)['success'])
+
+        respuesta['data']['clientTransactionId'] = self.intento.client_transaction_id
+        confirmacion = pasarela._confirmacion(respuesta, '123', self.intento.client_transaction_id)
+        self.assertEqual(confirmacion['transaction_id'], '999')
+
+    def procesar(self, confirmacion):
+        pasarela = mock.Mock()
+        pasarela.confirmar_pago.return_value = confirmacion
+        with mock.patch('reservaciones.services.confirmaciones.obtener_pasarela', return_value=pasarela):
+            for trabajo in reclamar_trabajos(10):
+                procesar_trabajo(trabajo)
+        return pasarela
+
+    def test_el_worker_registra_el_resultado_de_confirm(self):
+        # La notificación dice "aprobado", pero manda lo que responda Confirm
+        self.notificar()
+        pasarela = self.procesar({
+            'success': True, 'aprobado': False, 'estado': 'Canceled',
+            'autorizacion': None, 'transaction_id': '123456', 'monto': Decimal('25.00'),
+        })
+        pasarela.confirmar_pago.assert_called_once_with('123456', self.intento.client_transaction_id)
+        self.reservacion.refresh_from_db()
+        self.assertEqual(self.reservacion.estado_pago, 'fallido')
+        self.assertEqual(ConfirmacionPago.objects.get().estado, 'completada')
+
+    def test_pago_aprobado_por_confirm(self):
+        self.notificar()
+        self.procesar({
+            'success': True, 'aprobado': True, 'estado': 'Approved',
+            'autorizacion': 'AUT1', 'transaction_id': '123456', 'monto': Decimal('25.00'),
+        })
+        self.reservacion.refresh_from_db()
+        self.assertEqual(self.reservacion.estado_pago, 'pagado')
+        self.assertEqual(self.reservacion.estado, 'confirmada')
+
+    def test_monto_distinto_no_confirma(self):
+        self.notificar()
+        self.procesar({
+            'success': True, 'aprobado': True, 'estado': 'Approved',
+            'autorizacion': 'AUT1', 'transaction_id': '123456', 'monto': Decimal('1.00'),
+        })
+        self.assertSinPagar()
+        trabajo = ConfirmacionPago.objects.get()
+        self.assertEqual(trabajo.estado, 'fallida')
+        self.assertIn('Monto', trabajo.error)
+
+    def test_un_error_inesperado_reprograma_el_trabajo(self):
+        self.notificar()
+        pasarela = mock.Mock()
+        pasarela.confirmar_pago.side_effect = RuntimeError('se cayó la base de datos')
+        with mock.patch('reservaciones.services.confirmaciones.obtener_pasarela', return_value=pasarela):
+            for trabajo in reclamar_trabajos(10):
+                procesar_trabajo(trabajo)
+
+        trabajo = ConfirmacionPago.objects.get()
+        self.assertEqual(trabajo.estado, 'pendiente')
+        self.assertEqual(trabajo.intentos, 1)
+        self.assertGreater(trabajo.disponible_en, timezone.now())
+        self.assertSinPagar()
+
+    def test_el_worker_sigue_si_un_trabajo_falla(self):
+        self.notificar()
+        with mock.patch(
+            'reservaciones.management.commands.procesar_confirmaciones.procesar_trabajo',
+            side_effect=RuntimeError('se cayó la base de datos')
+        ), mock.patch('reservaciones.management.commands.procesar_confirmaciones.close_old_connections'):
+            salida = io.StringIO()
+            call_command('procesar_confirmaciones', una_vez=True, hilos=1, stdout=salida)
+        self.assertEqual(salida.getvalue(), '')
+
+
+class ConciliarPagosTests(DatosPrueba):
+
+    def setUp(self):
+        self.comando = ConciliarPagos()
+        self.comando.totales = dict.fromkeys(
+            ['aprobados', 'rechazados', 'errores', 'sin_id', 'omitidos', 'canceladas', 'monto_distinto'], 0
+        )
+        self.reservacion = self.crear_reservacion(estado_pago='procesando')
+
+    def intento(self, numero):
+        return IntentoPago.objects.create(
+            reservacion=self.reservacion,
+            pasarela='payphone',
+            client_transaction_id=f'RES-{self.reservacion.id}-{numero}',
+            transaction_id=str(numero),
+            monto=self.reservacion.precio_total
+        )
+
+    def confirmacion(self, intento, aprobado, monto=Decimal('25.00')):
+        return {
+            'success': True, 'aprobado': aprobado, 'autorizacion': 'AUT1' if aprobado else None,
+            'transaction_id': intento.transaction_id, 'monto': monto,
+        }
+
+    def test_un_aprobado_por_otro_monto_no_se_registra(self):
+        intento = self.intento(1)
+
+        self.comando._aplicar([(intento, self.confirmacion(intento, True, monto=Decimal('1.00')))])
+
+        self.reservacion.refresh_from_db()
+        self.assertEqual(self.reservacion.estado_pago, 'procesando')
+        self.assertEqual(IntentoPago.objects.get(pk=intento.pk).estado, 'iniciado')
+        self.assertEqual(self.comando.totales['monto_distinto'], 1)
+
+    def test_no_revive_una_reservacion_cancelada_durante_el_lote(self):
+        intento = IntentoPago.objects.only('id', 'reservacion_id', 'estado', 'transaction_id').get(pk=self.intento(1).pk)
+        cancelada = Reservacion.objects.get(pk=self.reservacion.pk)
+        cancelada.estado = 'cancelada'
+        cancelada.save()
+
+        self.comando._aplicar([(intento, self.confirmacion(intento, True))])
+
+        self.reservacion.refresh_from_db()
+        self.assertEqual(self.reservacion.estado, 'cancelada')
+        self.assertEqual(self.reservacion.estado_pago, 'procesando')
+        self.assertEqual(IntentoPago.objects.get(pk=intento.pk).estado, 'aprobado')
+        self.assertEqual(OcupacionSlot.objects.filter(personas__gt=0).count(), 0)
+
+    def test_dos_intentos_de_la_misma_reservacion_gana_el_aprobado(self):
+        aprobado, rechazado = self.intento(1), self.intento(2)
+        self.comando._aplicar([
+            (rechazado, self.confirmacion(rechazado, False)),
+            (aprobado, self.confirmacion(aprobado, True)),
+        ])
+
+        self.reservacion.refresh_from_db()
+        self.assertEqual(self.reservacion.estado_pago, 'pagado')
+        self.assertEqual(self.reservacion.estado, 'confirmada')
+        self.assertEqual(self.reservacion.transaccion_id, '1')
+        self.assertEqual(
+            dict(IntentoPago.objects.values_list('transaction_id', 'estado')),
+            {'1': 'aprobado', '2': 'rechazado'}
+        )
+
+    def test_omite_lo_que_ya_resolvio_el_worker(self):
+        intento = self.intento(1)
+        Reservacion.objects.filter(pk=self.reservacion.pk).update(estado_pago='pagado', estado='confirmada')
+
+        self.comando._aplicar([(intento, self.confirmacion(intento, False))])
+
+        self.reservacion.refresh_from_db()
+        self.assertEqual(self.reservacion.estado_pago, 'pagado')
+        self.assertEqual(self.comando.totales['omitidos'], 1)
+
+
+class RetencionesTests(DatosPrueba):
+
+    def ocupadas(self):
+        return sum(OcupacionSlot.objects.values_list('personas', flat=True))
+
+    def test_el_barrido_cancela_la_vencida_y_libera_el_horario(self):
+        reservacion = self.crear_reservacion(personas=2, expira_en=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.ocupadas(), 24)
+
+        self.assertEqual(expirar_vencidas(), 1)
+
+        reservacion.refresh_from_db()
+        self.assertEqual(reservacion.estado, 'cancelada')
+        self.assertEqual(self.ocupadas(), 0)
+
+    def test_no_barre_un_pago_en_proceso_ni_una_vigente(self):
+        pasada = timezone.now() - timedelta(minutes=1)
+        procesando = self.crear_reservacion(estado_pago='procesando', expira_en=pasada)
+        vigente = self.crear_reservacion(expira_en=timezone.now() + timedelta(minutes=10))
+
+        self.assertEqual(expirar_vencidas(), 0)
+
+        for reservacion in (procesando, vigente):
+            reservacion.refresh_from_db()
+            self.assertEqual(reservacion.estado, 'pendiente')
+        self.assertEqual(self.ocupadas(), 24)
+
+    def test_procesar_pago_no_revive_una_retencion_barrida(self):
+        reservacion = self.crear_reservacion(expira_en=timezone.now() + timedelta(minutes=10))
+
+        async def crear_pago(reservacion, return_url, cancel_url):
+            # El barrido cancela la retención mientras responde la pasarela
+            await Reservacion.objects.filter(pk=reservacion.pk).aupdate(estado='cancelada')
+            return {'success': True, 'referencia': f'RES-{reservacion.id}-1', 'payment_url': 'https://pago.example.com/'}
+
+        pasarela = mock.Mock(nombre='payphone', acrear_pago=crear_pago)
+        self.client.force_login(self.usuario)
+        with mock.patch('reservaciones.services.pasarelas.pasarela_de_cobro', return_value=pasarela):
+            respuesta = self.client.get(reverse('procesar_pago', args=[reservacion.id]))
+
+        self.assertRedirects(respuesta, reverse('mis_reservaciones'), fetch_redirect_response=False)
+        reservacion.refresh_from_db()
+        self.assertEqual(reservacion.estado, 'cancelada')
+        self.assertEqual(reservacion.estado_pago, 'pendiente')
+        self.assertEqual(IntentoPago.objects.get().estado, 'cancelado')
+
+
+@override_settings(PASARELAS_UMBRAL_FALLOS=2)
+class InterruptorTests(DatosPrueba):
+
+    def setUp(self):
+        pasarelas._interruptores.clear()
+        self.addCleanup(pasarelas._interruptores.clear)
+        self.reservacion = self.crear_reservacion()
+
+    def crear_pagos(self, resultado, veces=3):
+        pasarela = pasarelas.obtener_pasarela('payphone')
+        with mock.patch.object(pasarela.servicio, 'crear_pago', return_value=resultado):
+            return [pasarela.crear_pago(self.reservacion, 'http://localhost/', 'http://localhost/') for _ in range(veces)]
+
+    def test_un_pago_rechazado_no_abre_el_interruptor(self):
+        resultado = pasarelas.obtener_pasarela('payphone').servicio._resultado_pago(400, '{"message": "Datos inválidos"}', 'RES-1')
+        self.assertFalse(resultado['falla_pasarela'])
+
+        respuestas = self.crear_pagos(resultado)
+
+        self.assertFalse(any(respuesta.get('no_disponible') for respuesta in respuestas))
+        self.assertEqual(pasarelas.metricas()['payphone']['interruptor'], 'cerrado')
+
+    def test_los_errores_del_proveedor_abren_el_interruptor(self):
+        resultado = pasarelas.obtener_pasarela('payphone').servicio._resultado_pago(503, 'Service Unavailable', 'RES-1')
+        self.assertTrue(resultado['falla_pasarela'])
+
+        respuestas = self.crear_pagos(resultado)
+
+        self.assertTrue(respuestas[-1].get('no_disponible'))
+        self.assertEqual(pasarelas.metricas()['payphone']['interruptor'], 'abierto')
+
+    def test_las_excepciones_cuentan_como_falla_de_la_pasarela(self):
+        pasarela = pasarelas.obtener_pasarela('payphone')
+        with mock.patch.object(pasarela.servicio, 'crear_pago', side_effect=ValueError('JSON inválido')):
+            respuestas = [pasarela.crear_pago(self.reservacion, 'http://localhost/', 'http://localhost/') for _ in range(3)]
+
+        self.assertTrue(respuestas[0]['falla_pasarela'])
+        self.assertTrue(respuestas[-1].get('no_disponible'))
+        self.assertEqual(pasarelas.metricas()['payphone']['interruptor'], 'abierto')
+
+    def test_stripe_no_cobra_pagos_nuevos(self):
+        with override_settings(PASARELA_PAGO='stripe'):
+            with self.assertRaises(ImproperlyConfigured):
+                pasarelas.pasarela_de_cobro()
+        self.assertEqual(pasarelas.pasarela_de_cobro().nombre, 'payphone')
+
+
+class CancelarYReembolsarTests(DatosPrueba):
+
+    def reembolsar(self, queryset):
+        pasarela = mock.Mock()
+        pasarela.reembolsar.return_value = {'success': True, 'reembolso_id': 're_1', 'estado': 'succeeded'}
+        with mock.patch('reservaciones.services.reembolsos.obtener_pasarela', return_value=pasarela):
+            resumen = cancelar_y_reembolsar(queryset, hilos=2)
+        return resumen, pasarela
+
+    def test_cancela_libera_y_reembolsa_solo_lo_que_cancela(self):
+        pagada = self.crear_reservacion(estado='confirmada', estado_pago='pagado', metodo_pago='Stripe', transaccion_id='pi_1')
+        ya_cancelada = self.crear_reservacion(estado='cancelada', estado_pago='pagado', metodo_pago='Stripe', transaccion_id='pi_2')
+        otra = self.crear_reservacion(hora_inicio=time(10, 30), hora_fin=time(11, 30))
+
+        resumen, pasarela = self.reembolsar(Reservacion.objects.filter(pk__in=[pagada.pk, ya_cancelada.pk]))
+
+        self.assertEqual(resumen['canceladas'], 1)
+        self.assertEqual(resumen['reembolsadas'], 1)
+        pasarela.reembolsar.assert_called_once_with('pi_1', clave_idempotencia=f'reembolso-reservacion-{pagada.pk}')
+        self.assertEqual(Reservacion.objects.get(pk=pagada.pk).estado_pago, 'reembolsado')
+        self.assertEqual(Reservacion.objects.get(pk=ya_cancelada.pk).estado_pago, 'pagado')
+        # Solo queda lo que ocupa la otra reservación del día (10:30-11:30)
+        self.assertEqual(
+            dict(OcupacionSlot.objects.filter(personas__gt=0).values_list('slot', 'personas')),
+            dict.fromkeys(range(126, 138), 1)
+        )
+        self.assertEqual(Reservacion.objects.get(pk=otra.pk).estado, 'pendiente')
+
+    def test_repetir_no_vuelve_a_reembolsar(self):
+        pagada = self.crear_reservacion(estado='confirmada', estado_pago='pagado', metodo_pago='Stripe', transaccion_id='pi_1')
+        self.reembolsar(Reservacion.objects.filter(pk=pagada.pk))
+        # Aunque siga como pagada, ya estaba cancelada antes de esta llamada
+        Reservacion.objects.filter(pk=pagada.pk).update(estado_pago='pagado')
+
+        resumen, pasarela = self.reembolsar(Reservacion.objects.filter(pk=pagada.pk))
+
+        self.assertEqual(resumen['canceladas'], 0)
+        pasarela.reembolsar.assert_not_called()
+
+
+class PaginasCondicionalesTests(DatosPrueba):
+    """ETag / 304 y caché de páginas del catálogo"""
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_un_despliegue_nuevo_cambia_el_etag_y_la_clave_de_cache(self):
+        with override_settings(VERSION_PUBLICADA='a'):
+            primera = self.client.get(reverse('lista_servicios'))
+            self.assertEqual(primera['X-Cache'], 'MISS')
+            self.assertEqual(self.client.get(reverse('lista_servicios'))['X-Cache'], 'HIT')
+        with override_settings(VERSION_PUBLICADA='b'):
+            segunda = self.client.get(reverse('lista_servicios'), HTTP_IF_NONE_MATCH=primera['ETag'])
+
+        self.assertEqual(segunda.status_code, 200)
+        self.assertEqual(segunda['X-Cache'], 'MISS')
+        self.assertNotEqual(segunda['ETag'], primera['ETag'])
+
+    def test_la_clave_de_cache_usa_los_filtros_normalizados(self):
+        Servicio.objects.bulk_create([
+            Servicio(nombre=f'Servicio {n}', descripcion='-', duracion_minutos=30, precio=Decimal('10'))
+            for n in range(12)
+        ])
+        primera = self.client.get(reverse('lista_servicios'), {'precio_max': '30.00', 'utm_source': 'x'})
+        segunda = self.client.get(reverse('lista_servicios'), {'precio_max': '30', 'pagina': 'abc'})
+
+        self.assertEqual(primera['X-Cache'], 'MISS')
+        self.assertEqual(segunda['X-Cache'], 'HIT')
+        self.assertContains(segunda, 'href="?precio_max=30&amp;pagina=2"')
+        self.assertNotContains(segunda, 'utm_source')
+
+    def test_una_pagina_enorme_no_rompe_la_consulta(self):
+        respuesta = self.client.get(reverse('buscar_servicios'), {'pagina': '9' * 30})
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['servicios'], [])
+
+    def test_etag_responde_304_hasta_que_cambia_el_servicio(self):
+        self.client.force_login(self.usuario)
+        primera = self.client.get(reverse('detalle_servicio', args=[self.servicio.id]))
+        igual = self.client.get(reverse('detalle_servicio', args=[self.servicio.id]), HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(igual.status_code, 304)
+
+        self.servicio.precio = Decimal('30.00')
+        self.servicio.save()
+        cambiada = self.client.get(reverse('detalle_servicio', args=[self.servicio.id]), HTTP_IF_NONE_MATCH=primera['ETag'])
+
+        self.assertEqual(cambiada.status_code, 200)
+        self.assertNotEqual(cambiada['ETag'], primera['ETag'])
+
+    def test_etag_de_horarios_cambia_al_reservar(self):
+        url = reverse('horarios_disponibles', args=[self.servicio.id])
+        parametros = {'fecha': self.fecha.isoformat()}
+        primera = self.client.get(url, parametros)
+        self.assertEqual(self.client.get(url, parametros, HTTP_IF_NONE_MATCH=primera['ETag']).status_code, 304)
+
+        self.crear_reservacion()
+
+        self.assertEqual(self.client.get(url, parametros, HTTP_IF_NONE_MATCH=primera['ETag']).status_code, 200)
+
+
+class DisponibilidadTests(DatosPrueba):
+    """Horarios libres a partir de la ocupación precalculada"""
+
+    def setUp(self):
+        caches['default'].clear()
+        HorarioDisponible.objects.create(
+            servicio=self.servicio, dia_semana=self.fecha.weekday(), hora_inicio=time(9), hora_fin=time(13)
+        )
+
+    def horas(self):
+        return [horario['hora'] for horario in calcular_horarios_disponibles(self.servicio, self.fecha)]
+
+    def test_maximo_de_la_tabla_dispersa_coincide_con_el_recorrido(self):
+        aleatorio = random.Random(7)
+        filas = [(slot, aleatorio.randint(1, 9)) for slot in aleatorio.sample(range(288), 60)]
+        ocupacion = OcupacionDia(filas)
+        personas = dict(filas)
+
+        for _ in range(500):
+            inicio = aleatorio.randrange(0, 1440)
+            fin = aleatorio.randrange(inicio + 1, 1441)
+            esperado = max((personas.get(slot, 0) for slot in range(inicio // 5, (fin - 1) // 5 + 1)), default=0)
+            self.assertEqual(ocupacion.maximo(inicio, fin), esperado, (inicio, fin))
+
+    def test_un_horario_lleno_no_se_ofrece(self):
+        self.crear_reservacion(personas=2)
+        # 09:30 y 10:30 se cruzan con 10:00-11:00; 09:00 termina justo al empezar
+        self.assertEqual(self.horas(), ['09:00', '11:00', '11:30', '12:00'])
+
+    def test_una_retencion_vencida_no_ocupa(self):
+        self.crear_reservacion(personas=2, expira_en=timezone.now() - timedelta(minutes=1))
+        self.assertIn('10:00', self.horas())
+
+    def test_la_cache_se_invalida_al_confirmar_la_transaccion(self):
+        def en_cache():
+            return [horario['hora'] for horario in cache_disponibilidad.horarios_disponibles(self.servicio, self.fecha)]
+
+        self.assertIn('10:00', en_cache())
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.crear_reservacion(personas=2)
+        # Antes del commit sigue la versión anterior en caché
+        self.assertIn('10:00', en_cache())
+
+        for callback in callbacks:
+            callback()
+        self.assertNotIn('10:00', en_cache())
+
+
+class HistorialTests(DatosPrueba):
+    """Paginación por cursor del historial del usuario"""
+
+    def recorrer(self, **filtros):
+        vistas, cursor = [], None
+        while True:
+            pagina, cursor = pagina_reservaciones(self.usuario, cursor=cursor, tamano=2, **filtros)
+            vistas.extend(reservacion.pk for reservacion in pagina)
+            if cursor is None:
+                return vistas
+
+    def test_el_cursor_recorre_todo_sin_repetir(self):
+        manana = self.fecha
+        reservaciones = [
+            self.crear_reservacion(fecha=manana + timedelta(days=2), hora_inicio=time(9), hora_fin=time(10)),
+            self.crear_reservacion(fecha=manana, hora_inicio=time(12), hora_fin=time(13)),
+            # Mismo día y hora: el id desempata
+            self.crear_reservacion(fecha=manana, hora_inicio=time(9), hora_fin=time(10)),
+            self.crear_reservacion(fecha=manana, hora_inicio=time(9), hora_fin=time(10)),
+            self.crear_reservacion(fecha=manana + timedelta(days=1), hora_inicio=time(15), hora_fin=time(16)),
+        ]
+        esperado = [r.pk for r in sorted(reservaciones, key=lambda r: (r.fecha, r.hora_inicio, r.pk))]
+
+        self.assertEqual(self.recorrer(cuando='proximas'), esperado)
+        self.assertEqual(self.recorrer(), esperado[::-1])
+
+    def test_un_cursor_invalido_empieza_desde_el_principio(self):
+        reservacion = self.crear_reservacion()
+        pagina, cursor = pagina_reservaciones(self.usuario, cursor='no-es-un-cursor')
+        self.assertEqual([r.pk for r in pagina], [reservacion.pk])
+        self.assertIsNone(cursor)
+
+
+class CatalogoTests(TestCase):
+    """Filtros y páginas del catálogo (la búsqueda de texto necesita Postgres)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Servicio.objects.bulk_create([
+            Servicio(nombre=f'Servicio {n:02d}', descripcion='-', duracion_minutos=30 * (1 + n % 3), precio=Decimal(10 + n))
+            for n in range(10)
+        ])
+        Servicio.objects.create(nombre='Inactivo', descripcion='-', duracion_minutos=30, precio=Decimal('1'), activo=False)
+
+    def test_filtros_y_orden(self):
+        filtros = leer_filtros({'precio_max': '15', 'duracion_max': '60', 'orden': 'precio-desc'})
+        servicios, siguiente = pagina_servicios(filtros)
+
+        # 12 y 15 duran 90 minutos; los de más de 15 y el inactivo quedan fuera
+        self.assertEqual([s.precio for s in servicios], [Decimal(p) for p in (14, 13, 11, 10)])
+        self.assertIsNone(siguiente)
+
+    def test_paginas_sin_solaparse(self):
+        filtros = leer_filtros({})
+        primera, siguiente = pagina_servicios(filtros, 1, tamano=4)
+        segunda, _ = pagina_servicios(filtros, siguiente, tamano=4)
+        tercera, ultima = pagina_servicios(filtros, 3, tamano=4)
+
+        nombres = [s.nombre for s in primera + segunda + tercera]
+        self.assertEqual(nombres, [f'Servicio {n:02d}' for n in range(10)])
+        self.assertEqual(siguiente, 2)
+        self.assertIsNone(ultima)
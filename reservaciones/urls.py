@@ -5,7 +5,12 @@ urlpatterns = [
     path('', views.lista_servicios, name='lista_servicios'),
     path('servicio/<int:servicio_id>/', views.detalle_servicio, name='detalle_servicio'),
     path('servicio/<int:servicio_id>/reservar/', views.crear_reservacion, name='crear_reservacion'),
+    path('api/servicios/', views.obtener_servicios, name='buscar_servicios'),
+    path('api/horarios/', views.obtener_horarios_lote, name='horarios_lote'),
     path('api/horarios/<int:servicio_id>/', views.obtener_horarios_disponibles, name='horarios_disponibles'),
+    path('api/calendario/<int:servicio_id>/', views.obtener_calendario_disponible, name='calendario_disponible'),
+    path('api/cache/estadisticas/', views.estadisticas_cache, name='estadisticas_cache'),
+    path('api/pasarelas/metricas/', views.metricas_pasarelas, name='metricas_pasarelas'),
     path('mis-reservaciones/', views.mis_reservaciones, name='mis_reservaciones'),
     path('reservacion/<int:reservacion_id>/cancelar/', views.cancelar_reservacion, name='cancelar_reservacion'),
     path('registro/', views.registro, name='registro'),
@@ -13,5 +18,8 @@ urlpatterns = [
     # Rutas de pago con PayPhone
     path('pago/<int:reservacion_id>/', views.procesar_pago, name='procesar_pago'),
     path('pago/confirmacion/', views.pago_confirmacion, name='pago_confirmacion'),
+    path('pago/procesando/<int:reservacion_id>/', views.pago_procesando, name='pago_procesando'),
+    path('api/pago/<int:reservacion_id>/estado/', views.obtener_estado_pago, name='estado_pago'),
+    path('pago/notificacion/', views.notificacion_payphone, name='notificacion_payphone'),
     path('pago/cancelado/<int:reservacion_id>/', views.pago_cancelado, name='pago_cancelado'),
 ]
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""
+Versiones de claves de caché.
+
+En lugar de borrar entradas, cada caché guarda la versión de lo que
+depende (un día, un servicio, una etiqueta de página) y la incluye en la
+clave: cambiar la versión deja inalcanzables todas las entradas viejas.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+
+def nueva_version():
+    """Valor para una versión nueva"""
+    # Se usa un valor nuevo en lugar de incr(): no depende de que el backend
+    # tenga incremento atómico (el de archivos no lo tiene) y, si la clave
+    # fue desalojada, nunca reaparece una versión anterior.
+    return time.time_ns()
+
+
+def leer_versiones(cache, claves):
+    """
+    Versión actual de cada clave, unidas con '.' para usarlas en otra clave.
+    Las que no existen (o fueron desalojadas) se inicializan.
+    """
+    versiones = cache.get_many(claves)
+    for clave in claves:
+        if clave not in versiones:
+            cache.add(clave, nueva_version(), None)
+            versiones[clave] = cache.get(clave)
+    return '.'.join(str(versiones[clave]) for clave in claves)
+
+
+def version_publicada():
+    """
+    Identificador del despliegue: VERSION_PUBLICADA o, si no se define, el
+    hash del manifiesto de estáticos. Las plantillas cambian al desplegar
+    sin tocar la base de datos, así que entra en los ETag de las páginas
+    HTML y en las claves de la caché de páginas.
+    """
+    return settings.VERSION_PUBLICADA or getattr(staticfiles_storage, 'manifest_hash', '')
@@ -1,10 +1,14 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Q
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, Http404
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
-from datetime import datetime, timedelta, time
+from django.views.decorators.http import condition, require_POST
+from django.views.decorators.cache import cache_control
+from datetime import datetime, timedelta
 from django.utils import timezone
 from django.contrib.auth.models import User 
 from django.contrib.auth.forms import UserCreationForm
@@ -12,19 +16,91 @@ from django.contrib.auth import login, authenticate
 from django import forms
 from django.conf import settings
 import json
+import logging
 
-from .models import Servicio, Reservacion, HorarioDisponible
+from .models import Servicio, Reservacion, IntentoPago
+from . import condiciones
+from .cache_paginas import cache_anonimo, etiquetas_servicio
+from .registro import vincular
 from .services.payphone_service import PayPhoneService
+from .services.disponibilidad import (
+    calcular_disponibilidad_rango,
+    calcular_disponibilidad_servicios,
+    MAX_DIAS_RANGO,
+)
+from .services import cache_disponibilidad, pasarelas
+from .services.reservas import reservar, HorarioNoDisponible
+from .services.historial import pagina_reservaciones
+from .services.catalogo import (
+    DURACIONES, leer_filtros, leer_pagina, pagina_servicios, parametros_catalogo, clave_catalogo,
+)
+from .services.confirmaciones import aencolar_confirmacion, encolar_confirmacion, estado_pago
+from .services.notificaciones import (
+    NotificacionInvalida,
+    verificar_firma,
+    leer_notificacion,
+)
 
+logger = logging.getLogger(__name__)
 
+
+@cache_anonimo(lambda: ['servicios'], lambda request: clave_catalogo(request.GET))
+@cache_control(no_cache=True)
+@condition(
+    etag_func=condiciones.etag_lista_servicios,
+    last_modified_func=condiciones.ultima_modificacion_lista_servicios
+)
 def lista_servicios(request):
-    """Mostrar todos los servicios disponibles"""
-    servicios = Servicio.objects.filter(activo=True)
+    """Mostrar los servicios disponibles (búsqueda, filtros y páginas en el servidor)"""
+    filtros = leer_filtros(request.GET)
+    pagina = leer_pagina(request.GET)
+    servicios, siguiente = pagina_servicios(filtros, pagina)
     return render(request, 'reservaciones/lista_servicios.html', {
-        'servicios': servicios
+        'servicios': servicios,
+        'filtros': filtros,
+        # Los enlaces se arman con lo normalizado, igual que la clave de caché
+        'parametros': parametros_catalogo(filtros),
+        'filtrando': any(valor is not None and valor != '' for valor in filtros.values()),
+        'duraciones': DURACIONES,
+        'siguiente': siguiente,
+        'primera_pagina': pagina == 1,
+    })
+
+
+@cache_anonimo(lambda: ['servicios'], lambda request: clave_catalogo(request.GET))
+@cache_control(no_cache=True)
+@condition(
+    etag_func=condiciones.etag_lista_servicios,
+    last_modified_func=condiciones.ultima_modificacion_lista_servicios
+)
+def obtener_servicios(request):
+    """API: una página del catálogo en JSON (scroll infinito de lista_servicios)"""
+    filtros = leer_filtros(request.GET)
+    servicios, siguiente = pagina_servicios(filtros, leer_pagina(request.GET))
+    return JsonResponse({
+        'servicios': [
+            {
+                'id': servicio.id,
+                'nombre': servicio.nombre,
+                'precio': str(servicio.precio),
+                'duracion_minutos': servicio.duracion_minutos,
+                'capacidad_maxima': servicio.capacidad_maxima,
+                'url': reverse('detalle_servicio', args=[servicio.id]),
+            }
+            for servicio in servicios
+        ],
+        # Tarjetas ya renderizadas, con el mismo marcado que la página
+        'html': render_to_string('reservaciones/tarjetas_servicios.html', {'servicios': servicios}, request),
+        'siguiente': siguiente,
     })
 
 
+@cache_anonimo(etiquetas_servicio)
+@cache_control(no_cache=True)
+@condition(
+    etag_func=condiciones.etag_detalle_servicio,
+    last_modified_func=condiciones.ultima_modificacion_detalle_servicio
+)
 def detalle_servicio(request, servicio_id):
     """Detalle de un servicio específico"""
     servicio = get_object_or_404(Servicio, id=servicio_id, activo=True)
@@ -69,35 +145,26 @@ def crear_reservacion(request, servicio_id):
             messages.error(request, 'No puedes reservar en fechas pasadas.')
             return redirect('crear_reservacion', servicio_id=servicio.id)
         
-        # Verificar disponibilidad
-        conflictos = Reservacion.objects.filter(
-            servicio=servicio,
-            fecha=fecha_obj,
-            estado__in=['pendiente', 'confirmada']
-        ).filter(
-            Q(hora_inicio__lt=hora_fin_obj, hora_fin__gt=hora_inicio_obj)
-        )
-        
-        if conflictos.exists():
+        # Crear reservación (la base de datos rechaza el horario si ya no hay cupo)
+        try:
+            reservacion = reservar(
+                servicio,
+                fecha_obj,
+                hora_inicio_obj,
+                hora_fin_obj,
+                numero_personas,
+                usuario=request.user,
+                nombre_cliente=nombre_cliente,
+                email_cliente=email_cliente,
+                telefono_cliente=telefono_cliente,
+                notas=notas,
+                precio_total=servicio.precio * numero_personas,
+                estado='pendiente'
+            )
+        except HorarioNoDisponible:
             messages.error(request, 'El horario seleccionado ya no está disponible.')
             return redirect('crear_reservacion', servicio_id=servicio.id)
         
-        # Crear reservación
-        reservacion = Reservacion.objects.create(
-            usuario=request.user,
-            servicio=servicio,
-            fecha=fecha_obj,
-            hora_inicio=hora_inicio_obj,
-            hora_fin=hora_fin_obj,
-            nombre_cliente=nombre_cliente,
-            email_cliente=email_cliente,
-            telefono_cliente=telefono_cliente,
-            numero_personas=numero_personas,
-            notas=notas,
-            precio_total=servicio.precio * numero_personas,
-            estado='pendiente'
-        )
-        
         messages.success(request, f'¡Reservación creada exitosamente! Tu reservación #{reservacion.id} está pendiente de confirmación.')
         return redirect('mis_reservaciones')
     
@@ -107,6 +174,20 @@ def crear_reservacion(request, servicio_id):
     })
 
 
+def _personas_solicitadas(request):
+    """Leer el parámetro personas (por defecto 1); None si es inválido"""
+    try:
+        personas = int(request.GET.get('personas', 1))
+    except ValueError:
+        return None
+    return personas if personas >= 1 else None
+
+
+@cache_control(no_cache=True)
+@condition(
+    etag_func=condiciones.etag_horarios,
+    last_modified_func=condiciones.ultima_modificacion_horarios
+)
 def obtener_horarios_disponibles(request, servicio_id):
     """API para obtener horarios disponibles (AJAX)"""
     servicio = get_object_or_404(Servicio, id=servicio_id)
@@ -116,58 +197,140 @@ def obtener_horarios_disponibles(request, servicio_id):
         return JsonResponse({'error': 'Fecha requerida'}, status=400)
     
     fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-    dia_semana = fecha.weekday()
+    personas = _personas_solicitadas(request)
+    if personas is None:
+        return JsonResponse({'error': 'Número de personas inválido'}, status=400)
     
-    # Obtener horarios configurados para ese día
-    horarios = HorarioDisponible.objects.filter(
-        servicio=servicio,
-        dia_semana=dia_semana,
-        activo=True
-    )
-    
-    horarios_disponibles = []
-    for horario in horarios:
-        # Generar slots de tiempo según duración del servicio
-        hora_actual = horario.hora_inicio
-        while hora_actual < horario.hora_fin:
-            hora_fin_slot = (
-                datetime.combine(fecha, hora_actual) + 
-                timedelta(minutes=servicio.duracion_minutos)
-            ).time()
-            
-            if hora_fin_slot <= horario.hora_fin:
-                # Verificar si está disponible
-                conflicto = Reservacion.objects.filter(
-                    servicio=servicio,
-                    fecha=fecha,
-                    estado__in=['pendiente', 'confirmada']
-                ).filter(
-                    Q(hora_inicio__lt=hora_fin_slot, hora_fin__gt=hora_actual)
-                ).exists()
-                
-                if not conflicto:
-                    horarios_disponibles.append({
-                        'hora': hora_actual.strftime('%H:%M'),
-                        'disponible': True
-                    })
-            
-            # Incrementar por intervalos (ej: cada 30 min)
-            hora_actual = (
-                datetime.combine(fecha, hora_actual) + timedelta(minutes=30)
-            ).time()
+    horarios_disponibles = cache_disponibilidad.horarios_disponibles(servicio, fecha, personas)
     
     return JsonResponse({'horarios': horarios_disponibles})
 
 
+def obtener_calendario_disponible(request, servicio_id):
+    """
+    API para obtener la disponibilidad de un rango de fechas (AJAX)
+    Parámetros: desde, hasta (YYYY-MM-DD) y detalle=1 para incluir los horarios
+    """
+    servicio = get_object_or_404(Servicio, id=servicio_id)
+    desde_str = request.GET.get('desde')
+    hasta_str = request.GET.get('hasta')
+    
+    if not desde_str or not hasta_str:
+        return JsonResponse({'error': 'Fechas desde y hasta requeridas'}, status=400)
+    
+    try:
+        desde = datetime.strptime(desde_str, '%Y-%m-%d').date()
+        hasta = datetime.strptime(hasta_str, '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Formato de fecha inválido (YYYY-MM-DD)'}, status=400)
+    
+    if hasta < desde:
+        return JsonResponse({'error': 'La fecha hasta debe ser posterior a desde'}, status=400)
+    
+    if (hasta - desde).days + 1 > MAX_DIAS_RANGO:
+        return JsonResponse({'error': f'El rango no puede superar {MAX_DIAS_RANGO} días'}, status=400)
+    
+    personas = _personas_solicitadas(request)
+    if personas is None:
+        return JsonResponse({'error': 'Número de personas inválido'}, status=400)
+    
+    detalle = request.GET.get('detalle') == '1'
+    disponibilidad = calcular_disponibilidad_rango(servicio, desde, hasta, personas)
+    
+    dias = []
+    for fecha, horarios in disponibilidad.items():
+        dia = {
+            'fecha': fecha.strftime('%Y-%m-%d'),
+            'disponibles': len(horarios)
+        }
+        if detalle:
+            dia['horarios'] = horarios
+        dias.append(dia)
+    
+    return JsonResponse({'dias': dias})
+
+
+def obtener_horarios_lote(request):
+    """
+    API para obtener los horarios disponibles de varios servicios en una fecha (AJAX)
+    Parámetros: fecha (YYYY-MM-DD) y servicios=1,2,3 (opcional, por defecto todos los activos)
+    """
+    fecha_str = request.GET.get('fecha')
+    
+    if not fecha_str:
+        return JsonResponse({'error': 'Fecha requerida'}, status=400)
+    
+    try:
+        fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Formato de fecha inválido (YYYY-MM-DD)'}, status=400)
+    
+    personas = _personas_solicitadas(request)
+    if personas is None:
+        return JsonResponse({'error': 'Número de personas inválido'}, status=400)
+    
+    servicios = Servicio.objects.filter(activo=True)
+    servicios_str = request.GET.get('servicios')
+    if servicios_str:
+        try:
+            ids = [int(servicio_id) for servicio_id in servicios_str.split(',') if servicio_id.strip()]
+        except ValueError:
+            return JsonResponse({'error': 'Lista de servicios inválida'}, status=400)
+        servicios = servicios.filter(id__in=ids)
+    
+    servicios = list(servicios.only(
+        'id', 'nombre', 'duracion_minutos', 'capacidad_maxima', 'intervalo_minutos', 'buffer_minutos'
+    ))
+    disponibilidad = calcular_disponibilidad_servicios(servicios, fecha, personas)
+    
+    return JsonResponse({
+        'fecha': fecha.strftime('%Y-%m-%d'),
+        'servicios': [
+            {
+                'id': servicio.id,
+                'nombre': servicio.nombre,
+                'horarios': disponibilidad[servicio.id]
+            }
+            for servicio in servicios
+        ]
+    })
+
+
+@staff_member_required
+def estadisticas_cache(request):
+    """API con los aciertos/fallos de la caché de disponibilidad (solo staff)"""
+    return JsonResponse(cache_disponibilidad.estadisticas())
+
+
+@staff_member_required
+def metricas_pasarelas(request):
+    """
+    API con latencia, errores y estado del interruptor de cada pasarela (solo staff).
+    Con ?formato=prometheus responde en el formato de texto de Prometheus.
+    """
+    if request.GET.get('formato') == 'prometheus':
+        return HttpResponse(pasarelas.metricas_prometheus(), content_type='text/plain; version=0.0.4')
+    return JsonResponse(pasarelas.metricas())
+
+
 @login_required
 def mis_reservaciones(request):
-    """Ver las reservaciones del usuario"""
-    reservaciones = Reservacion.objects.filter(
-        usuario=request.user
-    ).select_related('servicio')
+    """Ver las reservaciones del usuario (por páginas, con filtros)"""
+    cuando = request.GET.get('cuando', '')
+    estado = request.GET.get('estado', '')
+    reservaciones, siguiente = pagina_reservaciones(
+        request.user,
+        cuando=cuando,
+        estado=estado,
+        cursor=request.GET.get('despues')
+    )
     
     return render(request, 'reservaciones/mis_reservaciones.html', {
-        'reservaciones': reservaciones
+        'reservaciones': reservaciones,
+        'cuando': cuando,
+        'estado': estado,
+        'siguiente': siguiente,
+        'primera_pagina': 'despues' not in request.GET,
     })
 
 
@@ -279,50 +442,87 @@ def registro(request):
 # VISTAS DE PAGO CON PAYPHONE
 # ============================================================
 
+async def _reservacion_del_usuario(request, reservacion_id):
+    """get_object_or_404 para vistas async"""
+    usuario = await request.auser()
+    try:
+        return await Reservacion.objects.select_related('servicio').aget(id=reservacion_id, usuario=usuario)
+    except Reservacion.DoesNotExist:
+        raise Http404('Reservación no encontrada')
+
+
 @login_required
-def procesar_pago(request, reservacion_id):
-    """Procesar el pago de una reservación con PayPhone"""
-    reservacion = get_object_or_404(Reservacion, id=reservacion_id, usuario=request.user)
+async def procesar_pago(request, reservacion_id):
+    """
+    Procesar el pago de una reservación con PayPhone.
+    Es async: mientras PayPhone responde, el worker atiende otros requests.
+    La llamada bloqueante corre en los hilos de pasarelas, así que cada
+    proceso tiene como mucho PASARELAS_HILOS pagos en vuelo; el resto
+    espera turno sin ocupar el event loop.
+    """
+    reservacion = await _reservacion_del_usuario(request, reservacion_id)
+    vincular(reservacion=reservacion.id)
     
     # Verificar que la reservación no esté pagada
     if reservacion.esta_pagada():
         messages.info(request, 'Esta reservación ya está pagada.')
         return redirect('mis_reservaciones')
     
-    # Crear pago con PayPhone
-    payphone_service = PayPhoneService()
+    # La retención venció (o el barrido ya la canceló): el horario pudo ocuparse
+    if reservacion.estado == 'cancelada' or reservacion.retencion_vencida():
+        messages.error(request, 'La reservación venció sin pago. Vuelve a reservar el horario.')
+        return redirect('mis_reservaciones')
+    
+    # Crear pago con la pasarela configurada: solo PayPhone tiene retorno
+    # (pago_confirmacion) y confirmación en el worker
+    pasarela = pasarelas.pasarela_de_cobro()
     
     # URLs de retorno
     base_url = settings.SITE_URL.rstrip('/')
     return_url = f"{base_url}/reservaciones/pago/confirmacion/"
     cancel_url = f"{base_url}/reservaciones/pago/cancelado/{reservacion.id}/"
     
-    # Debug
-    print(f"Return URL: {return_url}")
-    print(f"Cancel URL: {cancel_url}")
+    logger.debug('URLs de retorno', extra={'return_url': return_url, 'cancel_url': cancel_url})
     
-    resultado = payphone_service.crear_pago(
+    resultado = await pasarela.acrear_pago(
         reservacion=reservacion,
         return_url=return_url,
         cancel_url=cancel_url
     )
     
     if resultado['success']:
-        # Guardar el client_transaction_id
-        reservacion.transaccion_id = resultado.get('client_transaction_id')
-        reservacion.estado_pago = 'procesando'
-        reservacion.save()
+        # Cada intento guarda su referencia (clientTransactionId en PayPhone);
+        # transaccion_id queda para el ID de la pasarela cuando se aprueba
+        intento = await IntentoPago.objects.acreate(
+            reservacion=reservacion,
+            pasarela=pasarela.nombre,
+            client_transaction_id=resultado['referencia'],
+            monto=reservacion.precio_total
+        )
+        # Actualización condicional: si el barrido canceló la retención mientras
+        # respondía la pasarela, no se revive (save() la volvería a dejar pendiente)
+        actualizadas = await Reservacion.objects.filter(pk=reservacion.pk, estado='pendiente').aupdate(
+            estado_pago='procesando',
+            updated_at=timezone.now()
+        )
+        if not actualizadas:
+            intento.estado = 'cancelado'
+            await intento.asave(update_fields=['estado', 'updated_at'])
+            logger.warning('Retención vencida durante el pago', extra={'referencia': resultado['referencia']})
+            messages.error(request, 'La reservación venció sin pago. Vuelve a reservar el horario.')
+            return redirect('mis_reservaciones')
         
+        logger.info('Pago iniciado', extra={'pasarela': pasarela.nombre, 'referencia': resultado['referencia']})
         # Redirigir al checkout de PayPhone
         return redirect(resultado['payment_url'])
     else:
         messages.error(request, f'Error al procesar el pago: {resultado["error"]}')
-        print(f"Error de PayPhone: {resultado['error']}")
+        logger.warning('No se pudo iniciar el pago', extra={'pasarela': pasarela.nombre, 'error': resultado['error']})
         return redirect('mis_reservaciones')
 
 
 @login_required
-def pago_confirmacion(request):
+async def pago_confirmacion(request):
     """
     Página de confirmación después de PayPhone redirect
     PayPhone envía los datos por GET
@@ -335,52 +535,93 @@ def pago_confirmacion(request):
     transaction_id = respuesta.get('transaction_id')
     client_transaction_id = respuesta.get('client_transaction_id')
     
-    # Debug
-    print(f"PayPhone Response: {request.GET}")
-    print(f"Transaction ID: {transaction_id}")
-    print(f"Client Transaction ID: {client_transaction_id}")
+    logger.info('Retorno de PayPhone', extra={
+        'transaction_id': transaction_id,
+        'client_transaction_id': client_transaction_id
+    })
+    logger.debug('Parámetros del retorno de PayPhone', extra={'parametros': request.GET.dict()})
     
     if not transaction_id or not client_transaction_id:
         messages.error(request, 'Error: No se recibieron los datos del pago.')
         return redirect('mis_reservaciones')
     
-    # Extraer el ID de la reservación del client_transaction_id
-    # Formato: RES-{id}-{fecha}
+    # Buscar el intento por su referencia (índice único)
     try:
-        parts = client_transaction_id.split('-')
-        reservacion_id = int(parts[1])
-        reservacion = get_object_or_404(Reservacion, id=reservacion_id, usuario=request.user)
-    except (IndexError, ValueError) as e:
-        print(f"Error parsing client_transaction_id: {e}")
-        messages.error(request, 'Error: ID de reservación inválido.')
+        intento = await IntentoPago.objects.select_related('reservacion').aget(
+            client_transaction_id=client_transaction_id,
+            reservacion__usuario=await request.auser()
+        )
+    except IntentoPago.DoesNotExist:
+        logger.warning('clientTransactionId desconocido', extra={'client_transaction_id': client_transaction_id})
+        messages.error(request, 'Error: no se encontró el pago.')
         return redirect('mis_reservaciones')
+    reservacion = intento.reservacion
+    vincular(reservacion=reservacion.id)
     
-    # Confirmar el pago con PayPhone
-    confirmacion = payphone_service.confirmar_pago(transaction_id, client_transaction_id)
-    
-    print(f"Confirmación PayPhone: {confirmacion}")
-    
-    if confirmacion['success'] and confirmacion['is_approved']:
-        # Pago exitoso
-        reservacion.estado_pago = 'pagado'
-        reservacion.estado = 'confirmada'
-        reservacion.fecha_pago = timezone.now()
-        reservacion.metodo_pago = 'PayPhone'
-        reservacion.referencia_pago = confirmacion.get('authorization_code', transaction_id)
-        reservacion.transaccion_id = transaction_id
-        reservacion.save()
-        
-        messages.success(request, '¡Pago procesado exitosamente! Tu reservación ha sido confirmada.')
-    elif confirmacion['success']:
-        # Pago no aprobado
-        status = confirmacion.get('status', 'Desconocido')
-        reservacion.estado_pago = 'fallido'
-        reservacion.save()
-        messages.warning(request, f'El pago no fue aprobado. Estado: {status}')
-    else:
-        messages.error(request, f'Error al verificar el pago: {confirmacion.get("error")}')
-    
-    return redirect('mis_reservaciones')
+    # La confirmación con PayPhone la hace el worker (procesar_confirmaciones)
+    # para no bloquear el request mientras responde la pasarela. El ID de
+    # PayPhone viaja en el trabajo: el intento solo guarda el que verifique Confirm
+    await aencolar_confirmacion(reservacion, transaction_id, client_transaction_id)
+    return redirect('pago_procesando', reservacion_id=reservacion.id)
+
+
+@login_required
+def pago_procesando(request, reservacion_id):
+    """Página de espera mientras se confirma el pago"""
+    reservacion = get_object_or_404(
+        Reservacion.objects.select_related('servicio'),
+        id=reservacion_id,
+        usuario=request.user
+    )
+    return render(request, 'reservaciones/pago_procesando.html', {
+        'reservacion': reservacion,
+        'estado': estado_pago(reservacion),
+    })
+
+
+@login_required
+def obtener_estado_pago(request, reservacion_id):
+    """API para consultar el estado del pago (la página de espera la consulta)"""
+    reservacion = get_object_or_404(
+        Reservacion.objects.only('id', 'estado', 'estado_pago'),
+        id=reservacion_id,
+        usuario=request.user
+    )
+    return JsonResponse(estado_pago(reservacion))
+
+
+@csrf_exempt
+@require_POST
+def notificacion_payphone(request):
+    """
+    Notificación servidor a servidor de PayPhone.
+    Solo dispara la confirmación: se encola igual que en el retorno y el
+    worker registra el resultado que devuelve Confirm, nunca el que trae
+    la notificación. Repeticiones reutilizan el mismo trabajo.
+    """
+    try:
+        verificar_firma(request.body, request.headers.get('X-PayPhone-Signature'))
+        notificacion = leer_notificacion(json.loads(request.body))
+    except (NotificacionInvalida, ValueError) as e:
+        logger.warning('Notificación de PayPhone rechazada', extra={'error': str(e)})
+        return JsonResponse({'error': str(e)}, status=400)
+
+    transaction_id = notificacion['transaction_id']
+    client_transaction_id = notificacion['client_transaction_id']
+    intento = IntentoPago.objects.filter(
+        client_transaction_id=client_transaction_id,
+        pasarela='payphone'
+    ).only('id', 'reservacion_id').first()
+    if intento is not None:
+        vincular(reservacion=intento.reservacion_id)
+        encolar_confirmacion(intento.reservacion_id, transaction_id, client_transaction_id)
+    logger.info('Notificación de PayPhone', extra={
+        'transaction_id': transaction_id,
+        'client_transaction_id': client_transaction_id,
+        'encolada': intento is not None,
+    })
+    # PayPhone reintenta mientras no reciba Response=true
+    return JsonResponse({'Response': True, 'ErrorCode': '000', 'encolada': intento is not None})
 
 
 @login_required
@@ -388,9 +629,9 @@ def pago_cancelado(request, reservacion_id):
     """Cuando el usuario cancela el pago en PayPhone"""
     reservacion = get_object_or_404(Reservacion, id=reservacion_id, usuario=request.user)
     
-    # Actualizar estado
+    # Actualizar estado (el intento queda en el historial como cancelado)
+    reservacion.intentos_pago.filter(estado='iniciado').update(estado='cancelado', updated_at=timezone.now())
     reservacion.estado_pago = 'pendiente'
-    reservacion.transaccion_id = None
     reservacion.save()
     
     messages.warning(request, 'El pago fue cancelado. Puedes intentar de nuevo cuando desees.')